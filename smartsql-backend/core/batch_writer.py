@@ -0,0 +1,149 @@
+"""
+Group commit for small, frequent writes.
+
+Request threads hand rows to a BatchWriter and get a Future back. One
+background thread per process collects whatever arrives within `max_delay`
+seconds (or until `max_batch` rows are waiting) and writes the batch with a
+single flush() call in one transaction, so a burst of N submissions costs one
+commit instead of N.
+
+If a batch fails, its rows are retried one at a time so a single bad row only
+fails its own Future. The thread is started lazily and restarted after a fork
+(gunicorn preloads), and rows still queued at interpreter exit are flushed.
+
+BatchCaller applies the same collection to slow calls that are cheaper in
+bulk (one LLM request grading several submissions): batches are not wrapped
+in a transaction and up to `concurrency` of them run at once on a thread pool.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.db import close_old_connections, connection, transaction
+
+_STOP = object()
+
+
+class BatchWriter:
+
+    def __init__(self, name, flush, max_batch=200, max_delay=0.05):
+        """
+        `flush(cursor, items)` writes a list of items on the writer thread's own
+        connection, inside a transaction. It may return a list of per-item results.
+        """
+        self.name = name
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                # Queued items of a parent process are not ours to write
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name=f'batch-writer-{self.name}', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, item):
+        """Queue an item for the next batch. The Future resolves once its batch has committed."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            self._write(self._collect(entry))
+        connection.close()
+
+    def _write(self, batch):
+        close_old_connections()
+        items = [item for item, _ in batch]
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                results = self.flush(cursor, items)
+        except Exception as e:
+            print(f"❌ {self.name}: batch of {len(batch)} failed: {e}")
+            if connection.needs_rollback or not connection.is_usable():
+                connection.close()
+            if len(batch) > 1:
+                for entry in batch:
+                    self._write([entry])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        results = results if results is not None else [None] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self, timeout=5):
+        """Flush what is queued and stop the thread (called at exit)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+class BatchCaller(BatchWriter):
+
+    def __init__(self, name, call, max_batch=8, max_delay=0.3, concurrency=4):
+        """`call(items)` handles a list of items and returns a list of per-item results."""
+        super().__init__(name, call, max_batch=max_batch, max_delay=max_delay)
+        self.concurrency = concurrency
+        self._executor = None
+        self._executor_pid = None
+
+    def _write(self, batch):
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'batch-{self.name}')
+            self._executor_pid = os.getpid()
+        self._executor.submit(self._call, batch)
+
+    def _call(self, batch):
+        try:
+            results = self.flush([item for item, _ in batch])
+        except Exception as e:
+            print(f"❌ {self.name}: batch of {len(batch)} failed: {e}")
+            if len(batch) > 1:
+                for entry in batch:
+                    self._call([entry])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self, timeout=5):
+        super().close(timeout)
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
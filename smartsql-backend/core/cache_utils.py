@@ -0,0 +1,64 @@
+"""
+Versioned cache keys.
+
+Instead of deleting cached entries, writers bump a per-scope version number
+(e.g. per student). Readers build their keys from the current version, so an
+entry computed by a request that raced with the write is simply never read
+again and expires on its own.
+
+Bumps only reach processes that share the cache. With the default per-process
+LocMemCache an instance that did not take the write keeps its entries, so
+callers pass their timeouts through ttl(), which caps them at
+LOCAL_CACHE_MAX_AGE seconds unless the cache is shared.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def is_shared():
+    """Whether the default cache is shared between processes (not the per-process LocMemCache)."""
+    return 'locmem' not in settings.CACHES['default']['BACKEND'].lower()
+
+
+def ttl(seconds):
+    """Timeout for versioned entries: `seconds`, capped at LOCAL_CACHE_MAX_AGE when bumps stay per-process."""
+    return seconds if is_shared() else min(seconds, settings.LOCAL_CACHE_MAX_AGE)
+
+
+def _version_key(namespace, scope_id):
+    return f"{namespace}:v:{scope_id}"
+
+
+def get_version(namespace, scope_id):
+    """Current version of a scope; initialised from the clock so it never repeats after eviction."""
+    key = _version_key(namespace, scope_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def versioned_key(namespace, scope_id, *parts):
+    """Cache key for data belonging to `scope_id`, invalidated by bump_version()."""
+    suffix = ":".join(str(p) for p in parts)
+    return f"{namespace}:{scope_id}:{get_version(namespace, scope_id)}:{suffix}"
+
+
+def bump_version(namespace, scope_ids):
+    """Invalidate everything cached under the given scopes."""
+    for scope_id in scope_ids:
+        key = _version_key(namespace, scope_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_on_commit(namespace, scope_ids):
+    """bump_version() once the current transaction commits (immediately in autocommit)."""
+    scope_ids = list(scope_ids)
+    transaction.on_commit(lambda: bump_version(namespace, scope_ids))
@@ -0,0 +1,180 @@
+"""
+Process-wide cache of static exercise content.
+
+Holds every exercise (title, description, hint, difficulty, expected answer and
+the already-parsed table_schema of its dataset, with the dataset_hash) keyed by exercise_id, and every module with its
+ordered exercise ids keyed by module_id. Modules and courses also carry an
+exercise bitmap (see core.solved), so student views overlay per-student
+completion on top of these entries instead of re-reading Exercise rows.
+
+The catalog is reloaded as a whole whenever its generation (kept in the
+Django cache) changes; instructor edits bump it through invalidate(). That only
+reaches other processes (more web workers, run_tasks, management commands)
+through a shared cache, so each process also reloads a catalog older than
+CATALOG_MAX_AGE seconds: with the default per-process cache, edits made
+elsewhere show up within that bound instead of never.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from core.cache_utils import bump_on_commit, get_version
+from core.solved import mask
+
+NAMESPACE = 'exercise_catalog'
+_SCOPE = 'all'
+
+_lock = threading.Lock()
+# Replaced wholesale on reload, so readers holding a reference see one consistent version
+_state = {'generation': None, 'loaded_at': 0.0, 'exercises': {}, 'modules': {}, 'courses': {}, 'course_masks': {}}
+
+
+def parse_table_schema(raw):
+    """Decode a table_schema column value; invalid or empty schemas become []."""
+    if not raw:
+        return []
+    try:
+        return json.loads(raw)
+    except (TypeError, json.JSONDecodeError):
+        return []
+
+
+def _display_key(entry):
+    # Same ordering as MySQL's ORDER BY display_order: NULLs first
+    order = entry[1]
+    return (order is not None, order or 0)
+
+
+def _load():
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT m.module_id, m.module_name, m.module_description, m.course_id,
+                   c.course_name, c.course_code
+            FROM Module m
+            LEFT JOIN Course c ON m.course_id = c.course_id
+        """)
+        modules = {}
+        for module_id, name, description, course_id, course_name, course_code in cursor.fetchall():
+            modules[module_id] = {
+                'module_id': module_id,
+                'module_name': name,
+                'module_description': description,
+                'course_id': course_id,
+                'course_name': course_name,
+                'course_code': course_code,
+                'exercise_ids': [],
+                'exercise_mask': 0,
+            }
+
+        cursor.execute("""
+            SELECT e.exercise_id, e.title, e.description, e.hint, e.difficulty, e.dataset_hash, d.table_schema,
+                   e.expected_answer
+            FROM Exercise e
+            LEFT JOIN Dataset d ON e.dataset_hash = d.dataset_hash
+        """)
+        exercises = {}
+        for (exercise_id, title, description, hint, difficulty, dataset_hash, table_schema,
+             expected_answer) in cursor.fetchall():
+            exercises[exercise_id] = {
+                'exercise_id': exercise_id,
+                'title': title,
+                'description': description,
+                'hint': hint,
+                'difficulty': difficulty,
+                'dataset_hash': dataset_hash,
+                'table_schema': parse_table_schema(table_schema),
+                'expected_answer': expected_answer,
+                'module_id': None,
+            }
+
+        cursor.execute("SELECT module_id, exercise_id, display_order FROM Module_Exercise ORDER BY id")
+        memberships = {}
+        for module_id, exercise_id, display_order in cursor.fetchall():
+            if module_id in modules and exercise_id in exercises:
+                memberships.setdefault(module_id, []).append((exercise_id, display_order))
+
+    for module_id, entries in memberships.items():
+        entries.sort(key=_display_key)
+        modules[module_id]['exercise_ids'] = [exercise_id for exercise_id, _ in entries]
+        modules[module_id]['exercise_mask'] = mask(modules[module_id]['exercise_ids'])
+        for exercise_id, _ in entries:
+            exercise = exercises[exercise_id]
+            # An exercise's home module is its lowest module_id, as elsewhere in the app
+            if exercise['module_id'] is None or module_id < exercise['module_id']:
+                exercise['module_id'] = module_id
+
+    courses = {}
+    course_masks = {}
+    for module in sorted(modules.values(), key=lambda m: (m['module_name'] or '', m['module_id'])):
+        if module['course_id'] is not None:
+            courses.setdefault(module['course_id'], []).append(module['module_id'])
+            course_masks[module['course_id']] = course_masks.get(module['course_id'], 0) | module['exercise_mask']
+
+    return exercises, modules, courses, course_masks
+
+
+def _stale(state, generation):
+    return state['generation'] != generation or time.monotonic() - state['loaded_at'] > settings.CATALOG_MAX_AGE
+
+
+def _current():
+    global _state
+    generation = get_version(NAMESPACE, _SCOPE)
+    if _stale(_state, generation):
+        with _lock:
+            if _stale(_state, generation):
+                exercises, modules, courses, course_masks = _load()
+                _state = {'generation': generation, 'loaded_at': time.monotonic(), 'exercises': exercises,
+                          'modules': modules, 'courses': courses, 'course_masks': course_masks}
+    return _state
+
+
+def get_exercise(exercise_id):
+    """Exercise entry (with its home module and course) or None. Callers must not mutate it."""
+    state = _current()
+    exercise = state['exercises'].get(exercise_id)
+    if exercise is None:
+        return None
+    module = state['modules'].get(exercise['module_id']) or {}
+    return {
+        **exercise,
+        'module_name': module.get('module_name'),
+        'course_id': module.get('course_id'),
+        'course_name': module.get('course_name'),
+    }
+
+
+def get_module(module_id):
+    """Module entry (including ordered 'exercise_ids' and 'exercise_mask') or None."""
+    return _current()['modules'].get(module_id)
+
+
+def module_exercises(module_id):
+    """Exercise entries of a module in display order."""
+    state = _current()
+    module = state['modules'].get(module_id)
+    if module is None:
+        return []
+    return [state['exercises'][exercise_id] for exercise_id in module['exercise_ids']]
+
+
+def course_modules(course_id):
+    """Module entries of a course, ordered by module name."""
+    state = _current()
+    return [state['modules'][module_id] for module_id in state['courses'].get(course_id, [])]
+
+
+def course_mask(course_id):
+    """Bitmap of every exercise in the course's modules."""
+    return _current()['course_masks'].get(course_id, 0)
+
+
+def invalidate():
+    """
+    Reload the catalog after the current transaction commits: at once in every
+    process sharing this cache, within CATALOG_MAX_AGE seconds everywhere else.
+    """
+    bump_on_commit(NAMESPACE, [_SCOPE])
@@ -0,0 +1,122 @@
+"""
+Course catalog search shared by the student browse page and the instructor course list.
+
+Text search goes through the FULLTEXT index on Course(course_name, course_code,
+course_description) in boolean mode, every word required and prefix-matched,
+ranked by relevance. Pages are cut with keyset cursors rather than OFFSET: the
+cursor carries the sort key of the last row returned, so each page is an index
+range read no matter how deep the client scrolls. Course.year / term are NOT
+NULL (0 = not scheduled) so the sort key is the bare indexed columns, and the
+cursor predicate is spelled out rather than a row comparison, which older
+MySQL versions do not turn into a range scan.
+"""
+import re
+
+from core.pagination import decode_cursor, encode_cursor
+from core.pagination import page_size as _page_size
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+TERMS = {'spring': 1, 'summer': 2, 'fall': 3}
+
+_COLUMNS = """
+    c.course_id, c.course_name, c.course_code, c.course_description,
+    c.instructor_id, c.year, c.term, c.state
+"""
+
+
+def boolean_query(text):
+    """Turn free text into a FULLTEXT boolean-mode query: +word* for every word; '' if none."""
+    return " ".join(f"+{word}*" for word in _WORD.findall(text or ''))
+
+
+def parse_term(raw):
+    """Term filter from a query param: a term number or name (Spring / Summer / Fall)."""
+    if raw in (None, ''):
+        return None
+    if str(raw).isdigit():
+        return int(raw)
+    return TERMS.get(str(raw).lower())
+
+
+def parse_year(raw):
+    try:
+        return int(raw) if raw not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def page_size(raw):
+    """Parse a ?limit= value, clamped to [1, MAX_PAGE_SIZE]."""
+    return _page_size(raw, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def search(cursor, text=None, year=None, term=None, state=None, instructor_id=None,
+           extra_select="", extra_join="", extra_params=None, limit=DEFAULT_PAGE_SIZE, after=None):
+    """
+    Return (rows, next_cursor). Rows are dicts with the Course columns, plus
+    'relevance' when searching by text, plus whatever `extra_select` adds.
+
+    `extra_select` / `extra_join` / `extra_params` let callers attach their own
+    columns (enrollment flag, counters) to the same statement; `extra_params`
+    holds the placeholders of both, select first. `limit=None` returns every
+    match in one page.
+    """
+    match = boolean_query(text)
+    where, params = [], []
+    if match:
+        where.append("MATCH(c.course_name, c.course_code, c.course_description) AGAINST (%s IN BOOLEAN MODE)")
+        params.append(match)
+    for column, value in (('c.year', year), ('c.term', term), ('c.state', state), ('c.instructor_id', instructor_id)):
+        if value is not None:
+            where.append(f"{column} = %s")
+            params.append(value)
+
+    if match:
+        # Relevance first; ties (and equal scores) broken by course_id
+        select_rank = ", MATCH(c.course_name, c.course_code, c.course_description) AGAINST (%s IN BOOLEAN MODE) AS relevance"
+        rank_params = [match]
+        order = "relevance DESC, c.course_id DESC"
+        if after:
+            score, last_id = decode_cursor(after, 2)
+            where.append("(MATCH(c.course_name, c.course_code, c.course_description) AGAINST (%s IN BOOLEAN MODE) < %s"
+                         " OR (MATCH(c.course_name, c.course_code, c.course_description) AGAINST (%s IN BOOLEAN MODE) = %s"
+                         " AND c.course_id < %s))")
+            params.extend([match, score, match, score, last_id])
+    else:
+        select_rank, rank_params = "", []
+        order = "c.year DESC, c.term DESC, c.course_id DESC"
+        if after:
+            last_year, last_term, last_id = decode_cursor(after, 3)
+            where.append("(c.year < %s OR (c.year = %s AND (c.term < %s OR (c.term = %s AND c.course_id < %s))))")
+            params.extend([last_year, last_year, last_term, last_term, last_id])
+
+    sql = f"""
+        SELECT {_COLUMNS}{select_rank}{extra_select}
+        FROM Course c
+        {extra_join}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY {order}
+    """
+    all_params = rank_params + list(extra_params or []) + params
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        sql += " LIMIT %s"
+        all_params.append(limit + 1)
+
+    cursor.execute(sql, all_params)
+    columns = [col[0] for col in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if match:
+            next_cursor = encode_cursor([last['relevance'], last['course_id']])
+        else:
+            next_cursor = encode_cursor([last['year'], last['term'], last['course_id']])
+    return rows, next_cursor
@@ -0,0 +1,65 @@
+"""
+Denormalized per-course counters (Course_Stats).
+
+Course listings join this one row per course instead of counting Module,
+Module_Exercise and Enrollment rows on every request. Like core.progress,
+every helper takes the caller's cursor so the counters change in the same
+transaction as the write that moved them.
+"""
+
+_REFRESH_SQL = """
+    INSERT INTO Course_Stats (course_id, module_count, exercise_count, enrolled_count)
+    SELECT c.course_id,
+           (SELECT COUNT(*) FROM Module m WHERE m.course_id = c.course_id),
+           (SELECT COUNT(*) FROM Module_Exercise me
+            JOIN Module m ON me.module_id = m.module_id
+            WHERE m.course_id = c.course_id),
+           (SELECT COUNT(*) FROM Enrollment e
+            WHERE e.course_id = c.course_id AND e.status = 'enrolled')
+    FROM Course c
+    {where}
+    ON DUPLICATE KEY UPDATE
+        module_count = VALUES(module_count),
+        exercise_count = VALUES(exercise_count),
+        enrolled_count = VALUES(enrolled_count)
+"""
+
+
+def refresh(cursor, course_ids=None):
+    """Recompute the counters of these courses (all courses if None) from the source tables."""
+    if course_ids is None:
+        cursor.execute(_REFRESH_SQL.format(where=""))
+    else:
+        course_ids = [c for c in course_ids if c is not None]
+        if not course_ids:
+            return 0
+        cursor.execute(_REFRESH_SQL.format(where="WHERE c.course_id IN %s"), [tuple(course_ids)])
+    return cursor.rowcount
+
+
+def adjust(cursor, course_id, modules=0, exercises=0, enrolled=0):
+    """Shift one course's counters; a course without a stats row gets it recomputed instead."""
+    if course_id is None:
+        return
+    cursor.execute("""
+        UPDATE Course_Stats
+        SET module_count = GREATEST(module_count + %s, 0),
+            exercise_count = GREATEST(exercise_count + %s, 0),
+            enrolled_count = GREATEST(enrolled_count + %s, 0)
+        WHERE course_id = %s
+    """, [modules, exercises, enrolled, course_id])
+    if cursor.rowcount == 0:
+        refresh(cursor, [course_id])
+
+
+def adjust_exercises(cursor, module_ids, delta):
+    """Add `delta` exercises to the course of each module (an exercise linked to or unlinked from them)."""
+    if not module_ids:
+        return
+    cursor.execute("""
+        SELECT course_id, COUNT(*) FROM Module
+        WHERE module_id IN %s AND course_id IS NOT NULL
+        GROUP BY course_id
+    """, [tuple(module_ids)])
+    for course_id, links in cursor.fetchall():
+        adjust(cursor, course_id, exercises=delta * links)
@@ -0,0 +1,200 @@
+"""
+Per-student dashboard snapshot.
+
+The whole dashboard is built by a single statement (the two "recent" lists are
+aggregated into JSON arrays server-side) and cached per student. The exercise
+counts come from the student's bitmaps (core.solved) ANDed with the enrolled
+courses' catalog masks, so an exercise shared by two courses counts once, and
+values coming back through JSON are converted to the types a plain query
+returns (Decimal scores, datetimes). The cache is invalidated by submit,
+enroll, grade and profile events via invalidate().
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core import catalog, solved
+from core.cache_utils import bump_on_commit, ttl, versioned_key
+
+NAMESPACE = 'student_dashboard'
+
+_ISO_FORMAT = "'%%Y-%%m-%%dT%%H:%%i:%%sZ'"
+# DATETIME as text in JSON, parsed back with _DATETIME_FORMAT
+_SQL_DATETIME_FORMAT = "'%%Y-%%m-%%d %%H:%%i:%%s'"
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_SNAPSHOT_SQL = f"""
+    SELECT
+        u.first_name, u.last_name, u.username, u.email, u.profile_info,
+        cs.total_courses, cs.active_courses, cs.completed_courses,
+        cs.course_ids,
+        rc.recent_courses,
+        rx.recent_exercises
+    FROM Users u
+    CROSS JOIN (
+        SELECT
+            COUNT(DISTINCT e.course_id) AS total_courses,
+            COUNT(DISTINCT CASE WHEN c.state = 'active' THEN c.course_id END) AS active_courses,
+            COUNT(DISTINCT CASE WHEN c.state = 'complete' THEN c.course_id END) AS completed_courses,
+            GROUP_CONCAT(DISTINCT e.course_id) AS course_ids
+        FROM Enrollment e
+        JOIN Course c ON e.course_id = c.course_id
+        WHERE e.student_id = %s AND e.status = 'enrolled'
+    ) cs
+    CROSS JOIN (
+        SELECT JSON_ARRAYAGG(JSON_OBJECT(
+            'course_id', r.course_id,
+            'course_name', r.course_name,
+            'course_code', r.course_code,
+            'year', r.year,
+            'term', r.term,
+            'state', r.state,
+            'module_count', r.module_count,
+            'exercise_count', r.exercise_count,
+            'completed_exercises', r.completed_exercises,
+            'progress', r.progress,
+            'instructor_name', r.instructor_name,
+            'next_deadline', r.next_deadline
+        )) AS recent_courses
+        FROM (
+            SELECT
+                c.course_id, c.course_name, c.course_code, c.year, c.term, c.state,
+                COALESCE(cst.module_count, 0) AS module_count,
+                COALESCE(sc.total_exercises, 0) AS exercise_count,
+                COALESCE(sc.completed_exercises, 0) AS completed_exercises,
+                COALESCE(sc.progress, 0) AS progress,
+                CONCAT(i.first_name, ' ', i.last_name) AS instructor_name,
+                (SELECT DATE_FORMAT(MIN(m.due_date), {_ISO_FORMAT})
+                 FROM Module m
+                 LEFT JOIN Student_Module sm ON sm.module_id = m.module_id AND sm.student_id = e.student_id
+                 WHERE m.course_id = c.course_id AND m.due_date >= UTC_TIMESTAMP()
+                   AND COALESCE(sm.is_completed, FALSE) = FALSE) AS next_deadline
+            FROM Enrollment e
+            JOIN Course c ON c.course_id = e.course_id
+            JOIN Users i ON i.user_id = c.instructor_id
+            LEFT JOIN Student_Course sc ON sc.student_id = e.student_id AND sc.course_id = c.course_id
+            LEFT JOIN Course_Stats cst ON cst.course_id = c.course_id
+            WHERE e.student_id = %s AND e.status = 'enrolled'
+            ORDER BY c.year DESC, c.term DESC
+            LIMIT 5
+        ) r
+    ) rc
+    CROSS JOIN (
+        SELECT JSON_ARRAYAGG(JSON_OBJECT(
+            'student_exercise_id', r.id,
+            'exercise_id', r.exercise_id,
+            'title', r.title,
+            'difficulty', r.difficulty,
+            'is_correct', r.is_correct,
+            'completed_at', r.completed_at,
+            'score', r.score,
+            'ai_feedback', r.ai_feedback,
+            'course_name', r.course_name,
+            'module_name', r.module_name,
+            'course_id', r.course_id,
+            'module_id', r.module_id
+        )) AS recent_exercises
+        FROM (
+            SELECT
+                se.id, e.exercise_id, e.title, e.difficulty, se.is_correct,
+                DATE_FORMAT(se.completed_at, {_SQL_DATETIME_FORMAT}) AS completed_at,
+                -- DECIMAL as text: JSON numbers would come back as floats
+                CAST(se.score AS CHAR) AS score, se.ai_feedback,
+                c.course_name, m.module_name, c.course_id, m.module_id
+            FROM Student_Exercise se
+            JOIN Exercise e ON se.exercise_id = e.exercise_id
+            LEFT JOIN (
+                SELECT exercise_id, MIN(module_id) AS module_id
+                FROM Module_Exercise
+                GROUP BY exercise_id
+            ) me ON e.exercise_id = me.exercise_id
+            LEFT JOIN Module m ON me.module_id = m.module_id
+            LEFT JOIN Course c ON m.course_id = c.course_id
+            WHERE se.student_id = %s AND se.completed_at IS NOT NULL
+            ORDER BY se.completed_at DESC
+            LIMIT 5
+        ) r
+    ) rx
+    WHERE u.user_id = %s
+"""
+
+
+def _rate(part, whole):
+    return round(part / whole * 100, 2) if whole else 0
+
+
+def build_snapshot(student_id):
+    """Build the dashboard payload in one round trip. Returns None if the user does not exist."""
+    with connection.cursor() as cursor:
+        cursor.execute(_SNAPSHOT_SQL, [student_id] * 4)
+        row = cursor.fetchone()
+    if not row:
+        return None
+
+    (first_name, last_name, username, email, profile_info,
+     total_courses, active_courses, completed_courses,
+     course_ids, recent_courses_json, recent_exercises_json) = row
+
+    # Distinct exercises of the enrolled courses, as COUNT(DISTINCT exercise_id) would count them
+    enrolled_mask = 0
+    for course_id in (course_ids or '').split(','):
+        if course_id:
+            enrolled_mask |= catalog.course_mask(int(course_id))
+    solved_set = solved.get(student_id)
+    total_exercises = enrolled_mask.bit_count()
+    correct_exercises = solved_set.count_solved(enrolled_mask)
+    attempted_exercises = solved_set.count_attempted(enrolled_mask)
+    recent_courses = json.loads(recent_courses_json) if recent_courses_json else []
+    recent_exercises = json.loads(recent_exercises_json) if recent_exercises_json else []
+    for exercise in recent_exercises:
+        if exercise['score'] is not None:
+            exercise['score'] = Decimal(exercise['score'])
+        if exercise['completed_at'] is not None:
+            exercise['completed_at'] = datetime.strptime(exercise['completed_at'], _DATETIME_FORMAT)
+    # JSON_ARRAYAGG does not preserve the derived table's order
+    recent_courses.sort(key=lambda c: (c['year'] or 0, c['term'] or 0), reverse=True)
+    recent_exercises.sort(key=lambda x: x['completed_at'] or datetime.min, reverse=True)
+
+    return {
+        'user': {
+            'first_name': first_name,
+            'last_name': last_name,
+            'username': username,
+            'email': email,
+            'profile_info': profile_info,
+        },
+        'course_stats': {
+            'total_courses': total_courses,
+            'active_courses': active_courses,
+            'completed_courses': completed_courses,
+        },
+        'exercise_stats': {
+            'total_exercises': total_exercises,
+            'correct_exercises': correct_exercises,
+            'attempted_exercises': attempted_exercises,
+            'completion_rate': _rate(attempted_exercises, total_exercises),
+            'accuracy_rate': _rate(correct_exercises, attempted_exercises),
+        },
+        'recent_courses': recent_courses,
+        'recent_exercises': recent_exercises,
+    }
+
+
+def get_snapshot(student_id):
+    """Cached dashboard payload for a student."""
+    key = versioned_key(NAMESPACE, student_id, 'snapshot')
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot(student_id)
+        if snapshot is not None:
+            cache.set(key, snapshot, ttl(settings.STUDENT_DASHBOARD_CACHE_TTL))
+    return snapshot
+
+
+def invalidate(*student_ids):
+    """Drop the cached snapshots of these students once the current transaction commits."""
+    bump_on_commit(NAMESPACE, student_ids)
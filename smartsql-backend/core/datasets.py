@@ -0,0 +1,61 @@
+"""
+Content-addressed library of exercise datasets.
+
+A dataset is an exercise's table_schema: a list of tables, each with its
+columns and optionally its own seed "rows". Many exercises share the same
+tables, so each distinct dataset is stored once in Dataset, keyed by the
+SHA-256 of its canonical JSON, and Exercise.dataset_hash points at it.
+intern() is what instructor create / update call: identical schemas, however
+they were formatted or ordered, land on the same row.
+
+Because the hash names the content, anything derived from a dataset (the
+sandbox images of student/sandbox.py) can be cached under it forever.
+"""
+import hashlib
+import json
+
+
+class DatasetError(ValueError):
+    pass
+
+
+def canonical(table_schema):
+    """The canonical JSON text of a schema (a list / dict, or JSON text)."""
+    if isinstance(table_schema, str):
+        try:
+            table_schema = json.loads(table_schema)
+        except json.JSONDecodeError as e:
+            raise DatasetError(f"Invalid table schema JSON: {e}")
+    if not isinstance(table_schema, (list, dict)):
+        raise DatasetError("A table schema must be a JSON list or object.")
+    return json.dumps(table_schema, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def content_hash(table_schema):
+    return hashlib.sha256(canonical(table_schema).encode('utf-8')).hexdigest()
+
+
+def intern(cursor, table_schema):
+    """Store the schema in Dataset if it is new; returns its hash (None for an empty schema)."""
+    if not table_schema:
+        return None
+    text = canonical(table_schema)
+    if text in ('[]', '{}'):
+        return None
+    dataset_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    cursor.execute("INSERT IGNORE INTO Dataset (dataset_hash, table_schema) VALUES (%s, %s)",
+                   [dataset_hash, text])
+    return dataset_hash
+
+
+def prune(cursor):
+    """Delete datasets no exercise references any more; returns their hashes."""
+    cursor.execute("""
+        SELECT d.dataset_hash FROM Dataset d
+        WHERE NOT EXISTS (SELECT 1 FROM Exercise e WHERE e.dataset_hash = d.dataset_hash)
+        FOR UPDATE
+    """)
+    hashes = [row[0] for row in cursor.fetchall()]
+    if hashes:
+        cursor.execute("DELETE FROM Dataset WHERE dataset_hash IN %s", [tuple(hashes)])
+    return hashes
@@ -0,0 +1,135 @@
+"""
+Course enrollment with optional seat limits and a waitlist.
+
+Enrollment has a unique (student_id, course_id) key, so a student's row is
+created by one INSERT IGNORE and concurrent duplicate requests cannot both
+succeed. Seats are claimed with one conditional UPDATE of the course's
+Course_Stats.enrolled_count:
+
+    enrolled_count = enrolled_count + 1 WHERE enrolled_count < seat_limit
+
+InnoDB serializes those updates on the counter row, so however many requests
+race for the last seat exactly one of them gets it. A student who gets no seat
+stays 'waitlisted'; promote() moves waitlisted students in, in request order,
+whenever seats free up (a drop, or a raised seat_limit). Course.seat_limit NULL
+means unlimited.
+
+All functions take the caller's cursor and must run inside transaction.atomic.
+"""
+from core import course_stats, dashboard, inbox, progress
+
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_ENROLLED = 'already_enrolled'
+ALREADY_WAITLISTED = 'already_waitlisted'
+UNAVAILABLE = 'unavailable'
+
+
+def _claim_seat(cursor, course_id):
+    """Take one seat of the course if one is free. True on success."""
+    claim = """
+        UPDATE Course_Stats cs JOIN Course c ON c.course_id = cs.course_id
+        SET cs.enrolled_count = cs.enrolled_count + 1
+        WHERE cs.course_id = %s AND (c.seat_limit IS NULL OR cs.enrolled_count < c.seat_limit)
+    """
+    cursor.execute(claim, [course_id])
+    if cursor.rowcount:
+        return True
+    cursor.execute("SELECT 1 FROM Course_Stats WHERE course_id = %s", [course_id])
+    if cursor.fetchone():
+        return False
+    # Course created before Course_Stats existed: count it, then try again
+    course_stats.refresh(cursor, [course_id])
+    cursor.execute(claim, [course_id])
+    return bool(cursor.rowcount)
+
+
+def _admit(cursor, student_id, course_id):
+    """Turn a waitlisted row whose seat has been claimed into an enrollment."""
+    cursor.execute("""
+        UPDATE Enrollment SET status = 'enrolled'
+        WHERE student_id = %s AND course_id = %s AND status = 'waitlisted'
+    """, [student_id, course_id])
+    progress.rebuild_rollups(cursor, student_ids=[student_id], course_ids=[course_id])
+    inbox.deliver_enrollment(cursor, student_id, course_id)
+    dashboard.invalidate(student_id)
+
+
+def waitlist_position(cursor, student_id, course_id):
+    cursor.execute("""
+        SELECT COUNT(*) FROM Enrollment w
+        JOIN Enrollment me ON me.course_id = w.course_id AND me.student_id = %s
+        WHERE w.course_id = %s AND w.status = 'waitlisted'
+          AND (w.requested_at, w.enrollment_id) <= (me.requested_at, me.enrollment_id)
+    """, [student_id, course_id])
+    return cursor.fetchone()[0]
+
+
+def enroll(cursor, student_id, course_id):
+    """
+    Enroll a student, or waitlist them when the course is full.
+    Returns one of ENROLLED, WAITLISTED, ALREADY_ENROLLED, ALREADY_WAITLISTED, UNAVAILABLE.
+    """
+    # New rows start waitlisted and only become enrolled with a claimed seat
+    cursor.execute("""
+        INSERT IGNORE INTO Enrollment (student_id, course_id, status)
+        SELECT %s, course_id, 'waitlisted' FROM Course WHERE course_id = %s AND state = 'active'
+    """, [student_id, course_id])
+    if not cursor.rowcount:
+        # Existing row (or no such active course): only a dropped student may come back
+        cursor.execute("""
+            UPDATE Enrollment e JOIN Course c ON c.course_id = e.course_id
+            SET e.status = 'waitlisted', e.requested_at = CURRENT_TIMESTAMP(3)
+            WHERE e.student_id = %s AND e.course_id = %s AND e.status = 'dropped' AND c.state = 'active'
+        """, [student_id, course_id])
+        if not cursor.rowcount:
+            cursor.execute("""
+                SELECT e.status FROM Enrollment e JOIN Course c ON c.course_id = e.course_id
+                WHERE e.student_id = %s AND e.course_id = %s AND c.state = 'active'
+            """, [student_id, course_id])
+            row = cursor.fetchone()
+            if row is None:
+                return UNAVAILABLE
+            return ALREADY_ENROLLED if row[0] == ENROLLED else ALREADY_WAITLISTED
+
+    if not _claim_seat(cursor, course_id):
+        return WAITLISTED
+    _admit(cursor, student_id, course_id)
+    return ENROLLED
+
+
+def drop(cursor, student_id, course_id):
+    """Drop an enrollment or leave the waitlist. Frees the seat for the waitlist. Returns the old status or None."""
+    cursor.execute("""
+        SELECT status FROM Enrollment
+        WHERE student_id = %s AND course_id = %s AND status IN ('enrolled', 'waitlisted')
+        FOR UPDATE
+    """, [student_id, course_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute("UPDATE Enrollment SET status = 'dropped' WHERE student_id = %s AND course_id = %s",
+                   [student_id, course_id])
+    if row[0] == ENROLLED:
+        course_stats.adjust(cursor, course_id, enrolled=-1)
+        progress.drop_student_course_rollups(cursor, student_id, course_id)
+        dashboard.invalidate(student_id)
+        promote(cursor, course_id)
+    return row[0]
+
+
+def promote(cursor, course_id):
+    """Admit waitlisted students, oldest first, while seats are free. Returns the promoted student ids."""
+    promoted = []
+    while True:
+        cursor.execute("""
+            SELECT student_id FROM Enrollment
+            WHERE course_id = %s AND status = 'waitlisted'
+            ORDER BY requested_at, enrollment_id LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, [course_id])
+        row = cursor.fetchone()
+        if row is None or not _claim_seat(cursor, course_id):
+            return promoted
+        _admit(cursor, row[0], course_id)
+        promoted.append(row[0])
@@ -0,0 +1,113 @@
+"""
+Server-Sent Events endpoints (served by the ASGI app, see smartsql/asgi.py).
+
+Each stream is an async generator parked on a pubsub Subscription: it wakes
+only to forward an event or, every PUBSUB_HEARTBEAT_SECONDS, to write a
+comment line that keeps proxies from closing the idle connection.
+EventSource cannot send headers, so the JWT may also be given as ?token=.
+
+Django 4.2 does not notice a client disconnecting mid-stream, so every stream
+ends after PUBSUB_STREAM_MAX_SECONDS and EventSource simply reconnects.
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from core import pubsub
+from core.authentication import CustomJWTAuthentication
+
+
+def _user_from_token(raw_token):
+    auth = CustomJWTAuthentication()
+    return auth.get_user(auth.get_validated_token(raw_token))
+
+
+async def authenticate(request):
+    """The user named by the Bearer header or ?token=, or None."""
+    header = request.headers.get('Authorization', '')
+    raw_token = header[7:] if header.startswith('Bearer ') else request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        return await sync_to_async(_user_from_token)(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+def format_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream(subscription, initial=(), accept=None):
+    """
+    Yield SSE frames: `initial` (event, data) pairs first, then every published
+    event for which `accept(channel, event)` is true. Closes the subscription
+    when the client goes away.
+    """
+    heartbeat = settings.PUBSUB_HEARTBEAT_SECONDS
+    deadline = time.monotonic() + settings.PUBSUB_STREAM_MAX_SECONDS
+    try:
+        yield "retry: 5000\n\n"
+        for event_type, data in initial:
+            yield format_event(event_type, data, data.get('id'))
+        while time.monotonic() < deadline:
+            item = await subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                # This client fell behind and lost events: tell it to refetch
+                subscription.overflowed = False
+                yield format_event('resync', {})
+            if item is None:
+                yield ": ping\n\n"
+                continue
+            channel, event = item
+            if accept is None or accept(channel, event):
+                yield format_event(event.get('type', 'message'), event, event.get('id'))
+    finally:
+        subscription.close()
+
+
+def sse_response(generator):
+    response = StreamingHttpResponse(generator, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def user_channels(user):
+    """Channels a user hears: their own, plus the announcement channels of their enrolled courses."""
+    channels = [f'user:{user.user_id}']
+    if user.user_type == 'Student':
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.course_id, c.instructor_id
+                FROM Enrollment e JOIN Course c ON c.course_id = e.course_id
+                WHERE e.student_id = %s AND e.status = 'enrolled'
+            """, [user.user_id])
+            for course_id, instructor_id in cursor.fetchall():
+                channels.append(f'course:{course_id}')
+                channels.append(f'instructor:{instructor_id}')
+    return channels
+
+
+async def events_stream_api(request):
+    """GET: SSE stream of new private messages and announcements for the current user."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'status': 'error', 'message': 'Authentication required.'}, status=401)
+
+    channels = await sync_to_async(user_channels)(user)
+    subscription = pubsub.subscribe(channels)
+    return sse_response(stream(subscription, initial=[('ready', {'channels': channels})]))
@@ -0,0 +1,128 @@
+"""
+Idempotent POST endpoints.
+
+A request is identified by the client's Idempotency-Key header, or, when the
+client sends none, by a fingerprint of its payload (for a submission: student,
+exercise and answer). The first request with a key claims it in the cache and
+runs; a repeat that arrives while it is still running waits for it (on a
+threading.Event in the same process, by polling the cache otherwise) and gets
+the same response, marked with an Idempotent-Replayed header. A repeat after
+it finished gets the stored response without running the view again.
+
+The claim of a running request expires on its own in case its process dies,
+so it must outlive the slowest run of the view: a view declares its worst case
+(claim_seconds), and the claim lasts that plus CLAIM_MARGIN_SECONDS.
+
+Client keys are remembered for IDEMPOTENCY_TTL. Derived keys only for
+IDEMPOTENCY_WINDOW_SECONDS, so deliberately resubmitting the same answer later
+is still graded again. Only 2xx responses are stored; after an error the next
+retry runs normally. Dedupe across processes needs a shared cache backend.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+MAX_KEY_LENGTH = 255
+# Added to a view's worst-case duration for the lifetime of its pending claim
+CLAIM_MARGIN_SECONDS = 30
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _cache_key(scope, user_id, key):
+    return f"idempotency:{scope}:{user_id}:{fingerprint(key)}"
+
+
+def _error(message, code):
+    return Response({'status': 'error', 'message': message}, status=code)
+
+
+def _replay(entry):
+    return Response(entry['data'], status=entry['status'], headers={'Idempotent-Replayed': 'true'})
+
+
+def _execute(key, request_fingerprint, ttl, call):
+    event = threading.Event()
+    with _inflight_lock:
+        _inflight[key] = event
+    try:
+        response = call()
+        if 200 <= response.status_code < 300:
+            cache.set(key, {'state': 'done', 'fingerprint': request_fingerprint,
+                            'status': response.status_code, 'data': response.data}, ttl)
+        else:
+            cache.delete(key)
+        return response
+    except Exception:
+        cache.delete(key)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def run(key, request_fingerprint, ttl, call, claim_seconds=None):
+    """
+    Run call() once per key; concurrent and later repeats get its response.
+    `claim_seconds` is the longest call() can take (IDEMPOTENCY_WAIT_SECONDS if not given).
+    """
+    pending = {'state': 'pending', 'fingerprint': request_fingerprint}
+    claim_ttl = (claim_seconds or settings.IDEMPOTENCY_WAIT_SECONDS) + CLAIM_MARGIN_SECONDS
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        # The pending claim expires on its own if its owner dies mid-request, never while it still runs
+        if cache.add(key, pending, claim_ttl):
+            return _execute(key, request_fingerprint, ttl, call)
+        entry = cache.get(key)
+        if entry is None:
+            continue
+        if entry['fingerprint'] != request_fingerprint:
+            return _error('Idempotency-Key was already used for a different request.',
+                          status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if entry['state'] == 'done':
+            return _replay(entry)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _error('The original request is still being processed; retry shortly.',
+                          status.HTTP_409_CONFLICT)
+        with _inflight_lock:
+            event = _inflight.get(key)
+        if event is not None:
+            event.wait(remaining)
+        else:
+            time.sleep(min(0.2, remaining))
+
+
+def idempotent(scope, derive, claim_seconds=None):
+    """
+    Decorate a DRF view (below the auth decorators). `derive(request, *args, **kwargs)`
+    returns the payload fingerprint used when the client sends no Idempotency-Key.
+    `claim_seconds()` returns the longest the view can run (see run()).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request_fingerprint = derive(request, *args, **kwargs)
+            client_key = request.headers.get('Idempotency-Key')
+            if client_key:
+                if len(client_key) > MAX_KEY_LENGTH:
+                    return _error('Idempotency-Key is too long.', status.HTTP_400_BAD_REQUEST)
+                key, ttl = _cache_key(scope, request.user.user_id, client_key), settings.IDEMPOTENCY_TTL
+            else:
+                key, ttl = _cache_key(scope, request.user.user_id, request_fingerprint), settings.IDEMPOTENCY_WINDOW_SECONDS
+            return run(key, request_fingerprint, ttl, lambda: view(request, *args, **kwargs),
+                       claim_seconds=claim_seconds() if claim_seconds else None)
+        return wrapper
+    return decorator
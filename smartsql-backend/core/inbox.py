@@ -0,0 +1,323 @@
+"""
+Fan-out-on-write message inbox.
+
+Every message is copied into the Inbox of each user who should see it when it
+is sent: the receiver and the sender of a private message, every enrolled
+student of a course announcement, and every student of the sender's courses for
+a global (course_id NULL) announcement. Announcements fan out with a single
+INSERT ... SELECT. Reading an inbox is then one range scan of
+(user_id, inbox_id) that can be paged from either end.
+
+Each entry belongs to a conversation ('user:<peer>', 'course:<id>', or
+'instructor:<sender>' for global announcements) and carries its own read flag.
+Unread_Counter keeps the unread count per user and conversation, plus the
+user's total under TOTAL, adjusted on delivery and on mark-read, so badge polls
+never touch the message tables.
+
+All writers take the caller's cursor so delivery commits with the message.
+Announcements to large courses are fanned out by a background task instead
+(send_announcement); until it has run, enrollment does not hand the
+announcement out either, so each recipient is counted once.
+Conversation keys double as pub/sub channel names: notify() pushes a new
+message to the live event streams (core.events) of everyone in it.
+"""
+from django.db import connection, transaction
+
+from core import pubsub, tasks
+from core.pagination import page_size as _page_size
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+TOTAL = '*'
+
+# Recipients of announcements: enrolled students of the announcement's course,
+# or of all of the sender's courses when course_id is NULL.
+_ANNOUNCEMENT_RECIPIENTS = """
+    SELECT user_id, message_id, course_id, conversation, FALSE FROM (
+        SELECT DISTINCT e.student_id AS user_id, m.message_id, a.course_id, m.timestamp,
+               IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)) AS conversation
+        FROM Message m
+        JOIN Announcement a ON a.message_id = m.message_id
+        JOIN Course c ON (a.course_id IS NOT NULL AND c.course_id = a.course_id)
+                      OR (a.course_id IS NULL AND c.instructor_id = m.sender_id)
+        JOIN Enrollment e ON e.course_id = c.course_id AND e.status = 'enrolled'
+        WHERE {where}
+    ) r
+    ORDER BY r.timestamp, r.message_id
+"""
+
+
+def page_size(raw):
+    """Parse a ?limit= value, clamped to [1, MAX_PAGE_SIZE]."""
+    return _page_size(raw, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def _count_unread(cursor, where, params):
+    """Add the unread Inbox entries matching `where` to their owners' counters."""
+    cursor.execute(f"""
+        INSERT INTO Unread_Counter (user_id, conversation, unread)
+        SELECT * FROM (
+            SELECT user_id, conversation, COUNT(*) AS unread FROM Inbox
+            WHERE is_read = FALSE AND {where}
+            GROUP BY user_id, conversation
+            UNION ALL
+            SELECT user_id, %s, COUNT(*) FROM Inbox
+            WHERE is_read = FALSE AND {where}
+            GROUP BY user_id
+        ) counts
+        ON DUPLICATE KEY UPDATE unread = Unread_Counter.unread + VALUES(unread)
+    """, params + [TOTAL] + params)
+
+
+def deliver_private(cursor, message_id, sender_id, receiver_id):
+    """File a private message in both the receiver's and the sender's inbox."""
+    cursor.execute("""
+        INSERT INTO Inbox (user_id, message_id, course_id, conversation, is_sent, is_read)
+        VALUES (%s, %s, NULL, %s, FALSE, FALSE), (%s, %s, NULL, %s, TRUE, TRUE)
+        ON DUPLICATE KEY UPDATE is_sent = is_sent OR VALUES(is_sent)
+    """, [receiver_id, message_id, f'user:{sender_id}', sender_id, message_id, f'user:{receiver_id}'])
+    _count_unread(cursor, "message_id = %s", [message_id])
+
+
+def deliver_announcement(cursor, message_id):
+    """Fan an announcement (course or global) out to its recipients and its sender. Returns recipient count."""
+    cursor.execute(f"""
+        INSERT IGNORE INTO Inbox (user_id, message_id, course_id, conversation, is_sent)
+        {_ANNOUNCEMENT_RECIPIENTS.format(where="m.message_id = %s")}
+    """, [message_id])
+    recipients = cursor.rowcount
+    cursor.execute("""
+        INSERT INTO Inbox (user_id, message_id, course_id, conversation, is_sent, is_read)
+        SELECT m.sender_id, m.message_id, a.course_id,
+               IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)),
+               TRUE, TRUE
+        FROM Message m JOIN Announcement a ON a.message_id = m.message_id
+        WHERE m.message_id = %s
+        ON DUPLICATE KEY UPDATE is_sent = TRUE, is_read = TRUE
+    """, [message_id])
+    _count_unread(cursor, "message_id = %s", [message_id])
+    return recipients
+
+
+@tasks.task('send_announcement')
+def send_announcement(message_id):
+    """Deliver an announcement and push it to live clients (task handler; a rerun does nothing)."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT m.sender_id, m.message_content, a.course_id
+            FROM Message m JOIN Announcement a ON a.message_id = m.message_id
+            WHERE m.message_id = %s
+            FOR UPDATE
+        """, [message_id])
+        row = cursor.fetchone()
+        if row is None:
+            return {'recipients': 0}
+        sender_id, content, course_id = row
+        # deliver_announcement() files the sender's own copy: if it is there, this already ran
+        cursor.execute("SELECT 1 FROM Inbox WHERE user_id = %s AND message_id = %s", [sender_id, message_id])
+        if cursor.fetchone():
+            return {'recipients': None}
+        recipients = deliver_announcement(cursor, message_id)
+        notify(message_id, 'announcement', sender_id, content, course_id=course_id)
+    return {'recipients': recipients}
+
+
+def deliver_enrollment(cursor, student_id, course_id):
+    """
+    Give a newly enrolled student the course's announcements and its
+    instructor's global ones. They land at the top of the inbox, like mail
+    delivered today.
+    """
+    deliver_enrollments(cursor, [student_id], course_id)
+
+
+def deliver_enrollments(cursor, student_ids, course_id):
+    """deliver_enrollment() for many students of one course at once (roster imports)."""
+    student_ids = tuple(student_ids)
+    if not student_ids:
+        return
+    # Only announcements already fanned out (the sender's copy is filed); send_announcement delivers the rest
+    where = """e.student_id IN %s AND c.course_id = %s
+        AND EXISTS (SELECT 1 FROM Inbox s WHERE s.message_id = m.message_id AND s.user_id = m.sender_id)"""
+    cursor.execute(f"""
+        INSERT IGNORE INTO Inbox (user_id, message_id, course_id, conversation, is_sent)
+        {_ANNOUNCEMENT_RECIPIENTS.format(where=where)}
+    """, [student_ids, course_id])
+    if cursor.rowcount:
+        cursor.execute("DELETE FROM Unread_Counter WHERE user_id IN %s", [student_ids])
+        _count_unread(cursor, "user_id IN %s", [student_ids])
+
+
+def recount(cursor, user_id=None):
+    """Rebuild unread counters from the Inbox read flags, for one user or everyone."""
+    if user_id is None:
+        cursor.execute("DELETE FROM Unread_Counter")
+        _count_unread(cursor, "TRUE", [])
+    else:
+        cursor.execute("DELETE FROM Unread_Counter WHERE user_id = %s", [user_id])
+        _count_unread(cursor, "user_id = %s", [user_id])
+
+
+def unread_counts(cursor, user_id):
+    """{'total': n, 'conversations': {conversation: n}} straight from the counter rows."""
+    cursor.execute("SELECT conversation, unread FROM Unread_Counter WHERE user_id = %s AND unread > 0", [user_id])
+    conversations = dict(cursor.fetchall())
+    return {'total': conversations.pop(TOTAL, 0), 'conversations': conversations}
+
+
+def mark_read(cursor, user_id, message_ids=None, conversation=None):
+    """
+    Mark the user's unread entries read: the given messages, one conversation,
+    or (neither given) everything. Counters drop by exactly the entries that
+    flipped. Returns how many did.
+    """
+    where, params = ["user_id = %s", "is_read = FALSE"], [user_id]
+    if message_ids is not None:
+        if not message_ids:
+            return 0
+        where.append("message_id IN %s")
+        params.append(tuple(message_ids))
+    if conversation is not None:
+        where.append("conversation = %s")
+        params.append(conversation)
+    where = " AND ".join(where)
+
+    # Lock the entries first so a concurrent mark-read cannot decrement them twice
+    cursor.execute(f"""
+        SELECT conversation, COUNT(*) FROM Inbox WHERE {where}
+        GROUP BY conversation FOR UPDATE
+    """, params)
+    flipped = dict(cursor.fetchall())
+    if not flipped:
+        return 0
+    cursor.execute(f"UPDATE Inbox SET is_read = TRUE WHERE {where}", params)
+
+    flipped[TOTAL] = sum(flipped.values())
+    for key, count in flipped.items():
+        cursor.execute("""
+            UPDATE Unread_Counter SET unread = GREATEST(unread - %s, 0)
+            WHERE user_id = %s AND conversation = %s
+        """, [count, user_id, key])
+    return flipped[TOTAL]
+
+
+def notify(message_id, message_type, sender_id, content, receiver_id=None, course_id=None):
+    """Push a new message to connected clients once the sending transaction commits."""
+    event = {
+        'type': 'message',
+        'message_id': message_id,
+        'message_type': message_type,
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'course_id': course_id,
+        'content': content,
+    }
+    if message_type == 'private':
+        pubsub.publish_on_commit(f'user:{receiver_id}', {**event, 'conversation': f'user:{sender_id}'})
+        pubsub.publish_on_commit(f'user:{sender_id}', {**event, 'conversation': f'user:{receiver_id}'})
+    else:
+        conversation = f'course:{course_id}' if course_id else f'instructor:{sender_id}'
+        pubsub.publish_on_commit(conversation, {**event, 'conversation': conversation})
+
+
+def backfill(cursor):
+    """
+    File every existing message, oldest first so inbox_id order follows send
+    order. History predates read tracking, so it is filed as read. Returns rows added.
+    """
+    cursor.execute("""
+        INSERT IGNORE INTO Inbox (user_id, message_id, course_id, conversation, is_sent, is_read)
+        SELECT user_id, message_id, course_id, conversation, is_sent, TRUE FROM (
+            SELECT pm.receiver_id AS user_id, m.message_id, NULL AS course_id,
+                   CONCAT('user:', m.sender_id) AS conversation, FALSE AS is_sent, m.timestamp
+            FROM Message m JOIN PrivateMessage pm ON pm.message_id = m.message_id
+            UNION ALL
+            SELECT m.sender_id, m.message_id, NULL, CONCAT('user:', pm.receiver_id), TRUE, m.timestamp
+            FROM Message m JOIN PrivateMessage pm ON pm.message_id = m.message_id
+            UNION ALL
+            SELECT DISTINCT e.student_id, m.message_id, a.course_id,
+                   IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)),
+                   FALSE, m.timestamp
+            FROM Message m
+            JOIN Announcement a ON a.message_id = m.message_id
+            JOIN Course c ON (a.course_id IS NOT NULL AND c.course_id = a.course_id)
+                          OR (a.course_id IS NULL AND c.instructor_id = m.sender_id)
+            JOIN Enrollment e ON e.course_id = c.course_id AND e.status = 'enrolled'
+            UNION ALL
+            SELECT m.sender_id, m.message_id, a.course_id,
+                   IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)),
+                   TRUE, m.timestamp
+            FROM Message m JOIN Announcement a ON a.message_id = m.message_id
+        ) deliveries
+        ORDER BY timestamp, message_id, is_sent
+    """)
+    return cursor.rowcount
+
+
+def fetch(cursor, user_id, before=None, since=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of a user's inbox, newest first. Returns (rows, next_cursor).
+
+    `before` pages backwards from an inbox_id (the previous page's
+    next_cursor). `since` is for incremental refresh: it returns the entries
+    following an inbox_id the client already has, oldest `limit` first, and
+    next_cursor is then the `since` to ask with next while more remain.
+    `limit=None` returns every matching entry in one page.
+    """
+    where, params = ["i.user_id = %s"], [user_id]
+    if before is not None:
+        where.append("i.inbox_id < %s")
+        params.append(before)
+    if since is not None:
+        where.append("i.inbox_id > %s")
+        params.append(since)
+    order = "ASC" if since is not None else "DESC"
+    # One extra row tells us whether another page exists
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(limit + 1)
+    cursor.execute(f"""
+        SELECT
+            i.inbox_id,
+            m.message_id,
+            m.sender_id,
+            u_sender.first_name as sender_first_name,
+            u_sender.last_name as sender_last_name,
+            u_sender.username as sender_username,
+            pm.receiver_id,
+            u_receiver.first_name as receiver_first_name,
+            u_receiver.last_name as receiver_last_name,
+            u_receiver.username as receiver_username,
+            m.message_content,
+            m.timestamp,
+            m.message_type,
+            i.course_id,
+            c.course_name,
+            i.conversation,
+            i.is_read,
+            i.is_sent as is_sent_by_me
+        FROM Inbox i
+        JOIN Message m ON m.message_id = i.message_id
+        JOIN Users u_sender ON m.sender_id = u_sender.user_id
+        LEFT JOIN PrivateMessage pm ON pm.message_id = m.message_id
+        LEFT JOIN Users u_receiver ON pm.receiver_id = u_receiver.user_id
+        LEFT JOIN Course c ON c.course_id = i.course_id
+        WHERE {" AND ".join(where)}
+        ORDER BY i.inbox_id {order}
+        {limit_clause}
+    """, params)
+    columns = [col[0] for col in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        row['is_sent_by_me'] = bool(row['is_sent_by_me'])
+        row['is_read'] = bool(row['is_read'])
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]['inbox_id']
+    if since is not None:
+        rows.reverse()
+    return rows, next_cursor
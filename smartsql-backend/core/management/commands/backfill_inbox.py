@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import inbox
+
+
+class Command(BaseCommand):
+    help = "File every existing private message and announcement into the Inbox table (safe to rerun)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Also rebuild every Unread_Counter row from the Inbox read flags.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            added = inbox.backfill(cursor)
+            if options['recount']:
+                inbox.recount(cursor)
+        self.stdout.write(self.style.SUCCESS(f"Inbox backfilled: {added} new entries"))
@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from core import submission_store
+
+
+class Command(BaseCommand):
+    help = ("Compare Student_Exercise write throughput with the group-commit buffer off and on, "
+            "simulating many students submitting at once. Writes real rows: use a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=2000, help='Attempts per run (default 2000).')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent submitting threads (default 64).')
+        parser.add_argument('--mode', choices=['both', 'inline', 'buffered'], default='both')
+        parser.add_argument('--yes', action='store_true', help='Confirm that overwriting attempts in this database is fine.')
+
+    def handle(self, *args, **options):
+        if not options['yes']:
+            raise CommandError("This overwrites Student_Exercise rows; rerun with --yes on a scratch database.")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT student_id FROM Student")
+            students = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT exercise_id FROM Exercise")
+            exercises = [row[0] for row in cursor.fetchall()]
+        if not students or not exercises:
+            raise CommandError("Need at least one student and one exercise.")
+
+        rng = random.Random(42)
+        attempts = [
+            (rng.choice(students), rng.choice(exercises), '-- benchmark', rng.random() < 0.5)
+            for _ in range(options['submissions'])
+        ]
+        modes = ['inline', 'buffered'] if options['mode'] == 'both' else [options['mode']]
+        for mode in modes:
+            self.report(mode, *self.run(attempts, mode == 'buffered', options['concurrency']))
+
+    def run(self, attempts, buffered, concurrency):
+        def submit(attempt):
+            student_id, exercise_id, answer, is_correct = attempt
+            started = time.perf_counter()
+            try:
+                submission_store.save(student_id, exercise_id, answer, is_correct,
+                                      100.0 if is_correct else 0.0, 'benchmark', buffered=buffered)
+            finally:
+                # Like the end of a request (this thread's connections only)
+                connections.close_all()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(submit, attempts))
+        return time.perf_counter() - started, latencies
+
+    def report(self, mode, elapsed, latencies):
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{mode:>8}: {len(latencies)} submissions in {elapsed:.2f}s = {len(latencies) / elapsed:,.0f}/s, "
+            f"latency p50 {statistics.median(latencies) * 1000:.1f}ms, p99 {p99 * 1000:.1f}ms"
+        )
@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import datasets
+from core.catalog import parse_table_schema
+from student import sandbox
+
+
+class Command(BaseCommand):
+    help = "Prebuild the on-disk sandbox image of every Dataset (run after deploys), optionally pruning unused datasets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete datasets no exercise references, and their images.')
+
+    def handle(self, *args, **options):
+        if not settings.SANDBOX_IMAGE_DIR:
+            raise CommandError("SANDBOX_IMAGE_DIR is empty, so sandbox images are disabled.")
+
+        if options['prune']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                pruned = datasets.prune(cursor)
+            for dataset_hash in pruned:
+                path = sandbox.image_path(dataset_hash)
+                if os.path.exists(path):
+                    os.remove(path)
+            self.stdout.write(f"Pruned {len(pruned)} unused datasets")
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT dataset_hash, table_schema FROM Dataset ORDER BY dataset_hash")
+            rows = cursor.fetchall()
+
+        started = time.perf_counter()
+        built = failed = 0
+        for dataset_hash, table_schema in rows:
+            if os.path.exists(sandbox.image_path(dataset_hash)):
+                continue
+            try:
+                sandbox.prebuild(parse_table_schema(table_schema), key=dataset_hash)
+                built += 1
+            except sandbox.SandboxError as e:
+                failed += 1
+                self.stdout.write(f"{dataset_hash}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} datasets, {built} images built, {failed} failed in {time.perf_counter() - started:.2f}s "
+            f"({settings.SANDBOX_IMAGE_DIR})"))
@@ -0,0 +1,52 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import roster
+
+
+class Command(BaseCommand):
+    help = "Enroll a CSV or JSON roster of students (by email or username) in a course, creating missing accounts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('path', help='Roster file (.csv or .json).')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Default: from the file extension / content.')
+        parser.add_argument('--no-create', action='store_true', help='Do not create accounts for unknown students.')
+        parser.add_argument('--dry-run', action='store_true', help='Report outcomes without changing anything.')
+        parser.add_argument('--report', help='Write per-row outcomes (and generated passwords) to this CSV file.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('json' if path.lower().endswith('.json') else 'csv' if path.lower().endswith('.csv') else None)
+        try:
+            with open(path, 'rb') as f:
+                rows = roster.parse(f.read(), fmt)
+        except (OSError, roster.RosterError) as e:
+            raise CommandError(str(e))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM Course WHERE course_id = %s", [options['course_id']])
+            if not cursor.fetchone():
+                raise CommandError(f"Course {options['course_id']} does not exist.")
+
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            summary, results = roster.import_roster(cursor, options['course_id'], rows,
+                                                    create_missing=not options['no_create'])
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        elapsed = time.perf_counter() - started
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.DictWriter(f, ['row', 'email', 'username', 'user_id', 'outcome', 'error', 'password'])
+                writer.writeheader()
+                writer.writerows(results)
+        for result in results:
+            if result.get('error'):
+                self.stdout.write(f"row {result['row']}: {result['outcome']}: {result['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} rows in {elapsed:.2f}s{' (dry run, nothing saved)' if options['dry_run'] else ''}: {summary}"))
@@ -0,0 +1,73 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+def month_start(day, offset=0):
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = ("Keep the monthly partitions of the Submission log in shape: split p_future into the "
+            "upcoming months and optionally drop months past retention. Run it from cron, e.g. daily.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Make sure partitions exist for this many months after the current one (default 3).')
+        parser.add_argument('--drop-older-than', type=int, metavar='MONTHS',
+                            help='Drop partitions whose rows are all older than this many months. Deletes history!')
+        parser.add_argument('--dry-run', action='store_true', help='Print the statements instead of running them.')
+
+    def partitions(self, cursor):
+        """[(name, upper bound date or None for MAXVALUE)] in partition order."""
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Submission'
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """)
+        result = []
+        for name, description in cursor.fetchall():
+            if name is None:
+                raise CommandError("Submission is not partitioned; recreate it from static/dbDDL.sql.")
+            bound = None if description == 'MAXVALUE' else date.fromisoformat(description.strip("'")[:10])
+            result.append((name, bound))
+        return result
+
+    def run(self, cursor, sql, dry_run):
+        self.stdout.write(sql)
+        if not dry_run:
+            cursor.execute(sql)
+
+    def handle(self, *args, **options):
+        today = date.today()
+        dry_run = options['dry_run']
+        with connection.cursor() as cursor:
+            existing = self.partitions(cursor)
+            if not existing or existing[-1] != ('p_future', None):
+                raise CommandError("Expected Submission's last partition to be p_future (MAXVALUE).")
+
+            # Split new months off the front of p_future, oldest first
+            last_bound = max((bound for _, bound in existing if bound), default=month_start(today))
+            added = 0
+            month = last_bound
+            while month < month_start(today, options['ahead'] + 1):
+                upper = month_start(month, 1)
+                self.run(cursor, f"""
+                    ALTER TABLE Submission REORGANIZE PARTITION p_future INTO (
+                        PARTITION p{month:%Y%m} VALUES LESS THAN ('{upper.isoformat()}'),
+                        PARTITION p_future VALUES LESS THAN (MAXVALUE)
+                    )""", dry_run)
+                month = upper
+                added += 1
+
+            dropped = []
+            if options['drop_older_than'] is not None:
+                cutoff = month_start(today, -options['drop_older_than'])
+                dropped = [name for name, bound in existing if bound is not None and bound <= cutoff]
+                if dropped:
+                    self.run(cursor, f"ALTER TABLE Submission DROP PARTITION {', '.join(dropped)}", dry_run)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Submission partitions: {added} added, {len(dropped)} dropped{' (dry run)' if dry_run else ''}"))
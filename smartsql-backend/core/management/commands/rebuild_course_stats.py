@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import course_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute Course_Stats (module, exercise and enrolled counts) from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int,
+                            help='Only these courses (default: every course).')
+
+    def handle(self, *args, **options):
+        course_ids = options['course_ids'] or None
+        with transaction.atomic(), connection.cursor() as cursor:
+            course_stats.refresh(cursor, course_ids)
+            cursor.execute("SELECT COUNT(*) FROM Course_Stats")
+            rows = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f"Course_Stats refreshed ({rows} courses tracked)"))
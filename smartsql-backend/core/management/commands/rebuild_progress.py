@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from core import progress
+
+
+def _init_worker():
+    """Each worker process must open its own database connection."""
+    connections.close_all()
+
+
+def _chunk_range(chunk, chunk_size):
+    return chunk * chunk_size, (chunk + 1) * chunk_size - 1
+
+
+def _diff_chunk(cursor, student_range):
+    """Count rollup rows that are missing or stale compared to the source tables."""
+    module_sql, course_sql, params = progress.rollup_queries(student_range=student_range)
+    stats = {}
+    for name, sql, table, keys in (
+        ('module', module_sql, 'Student_Module', ('student_id', 'module_id')),
+        ('course', course_sql, 'Student_Course', ('student_id', 'course_id')),
+    ):
+        join = " AND ".join(f"r.{k} = t.{k}" for k in keys)
+        cursor.execute(f"""
+            SELECT
+                SUM(r.{keys[1]} IS NULL) AS missing,
+                SUM(r.{keys[1]} IS NOT NULL AND (r.total_exercises <> t.total_exercises
+                    OR r.completed_exercises <> t.completed_exercises)) AS stale
+            FROM ({sql}) t
+            LEFT JOIN {table} r ON {join}
+        """, params)
+        missing, stale = cursor.fetchone()
+        stats[f'{name}_missing'] = int(missing or 0)
+        stats[f'{name}_stale'] = int(stale or 0)
+    return stats
+
+
+def _process_chunk(chunk, chunk_size, dry_run):
+    """Rebuild (or diff) the rollups of one student id range. Runs in a worker process."""
+    student_range = _chunk_range(chunk, chunk_size)
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        # Consistent non-locking reads of Student_Exercise / Enrollment, so the
+        # INSERT ... SELECT does not hold shared locks on the hot source tables.
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        cursor.execute("SELECT COUNT(DISTINCT student_id) FROM Enrollment WHERE student_id BETWEEN %s AND %s",
+                       list(student_range))
+        students = cursor.fetchone()[0]
+        if dry_run:
+            stats = _diff_chunk(cursor, student_range)
+        else:
+            with transaction.atomic():
+                written = progress.rebuild_rollups(cursor, student_range=student_range)
+                pruned = progress.prune_orphan_rollups(cursor, student_range)
+            stats = {'written': written, 'pruned': pruned}
+    stats['students'] = students
+    stats['elapsed'] = time.monotonic() - started
+    return chunk, stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild Student_Module / Student_Course progress rollups from Student_Exercise, "
+        "Module_Exercise and Enrollment, in parallel student-id chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Width of each student_id range processed in one transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes.')
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / '.rebuild_progress.json'),
+                            help='File recording finished chunks, used by --resume.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip chunks already recorded in the checkpoint file.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many rollup rows are missing or stale.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+        dry_run = options['dry_run']
+        checkpoint_path = options['checkpoint']
+
+        done = set()
+        if options['resume'] and not dry_run and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                checkpoint = json.load(fh)
+            if checkpoint.get('chunk_size') != chunk_size:
+                raise CommandError(
+                    f"Checkpoint was written with --chunk-size {checkpoint.get('chunk_size')}; "
+                    f"rerun with the same value or without --resume.")
+            done = set(checkpoint.get('done', []))
+
+        with connection.cursor() as cursor:
+            # Include students that only have rollup rows left, so their orphans get pruned
+            cursor.execute("""
+                SELECT DISTINCT s.student_id DIV %s FROM (
+                    SELECT student_id FROM Enrollment
+                    UNION SELECT student_id FROM Student_Course
+                ) s ORDER BY 1
+            """, [chunk_size])
+            chunks = [row[0] for row in cursor.fetchall() if row[0] not in done]
+        # Forked workers must not share the parent's socket
+        connections.close_all()
+
+        self.stdout.write(
+            f"{'Diffing' if dry_run else 'Rebuilding'} {len(chunks)} chunks "
+            f"({len(done)} already done) with {options['workers']} workers")
+
+        totals = {}
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_process_chunk, chunk, chunk_size, dry_run) for chunk in chunks]
+            for n, future in enumerate(as_completed(futures), 1):
+                chunk, stats = future.result()
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+                if not dry_run:
+                    done.add(chunk)
+                    self._write_checkpoint(checkpoint_path, chunk_size, done)
+                lo, hi = _chunk_range(chunk, chunk_size)
+                detail = ", ".join(f"{k}={v}" for k, v in stats.items() if k != 'elapsed')
+                self.stdout.write(f"[{n}/{len(chunks)}] students {lo}-{hi}: {detail} ({stats['elapsed']:.2f}s)")
+
+        elapsed = time.monotonic() - started
+        students = totals.pop('students', 0)
+        totals.pop('elapsed', None)
+        rate = students / elapsed if elapsed else 0
+        summary = ", ".join(f"{k}={v}" for k, v in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {students} students ({rate:.0f}/s). {summary}"))
+        if not dry_run and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    @staticmethod
+    def _write_checkpoint(path, chunk_size, done):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as fh:
+            json.dump({'chunk_size': chunk_size, 'done': sorted(done)}, fh)
+        os.replace(tmp, path)
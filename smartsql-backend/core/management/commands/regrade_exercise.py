@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from student import regrade
+
+
+class Command(BaseCommand):
+    help = "Regrade every stored submission of an exercise in the foreground (or rerun a stuck --job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('exercise_id', type=int, nargs='?')
+        parser.add_argument('--job', type=int, help='Rerun this queued / running job instead of creating one.')
+
+    def handle(self, *args, **options):
+        job_id = options['job']
+        if job_id is None:
+            if options['exercise_id'] is None:
+                raise CommandError("Give an exercise_id or --job.")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM Exercise WHERE exercise_id = %s", [options['exercise_id']])
+                if not cursor.fetchone():
+                    raise CommandError(f"Exercise {options['exercise_id']} does not exist.")
+            with transaction.atomic(), connection.cursor() as cursor:
+                # No task is queued for this job: it runs here, in the foreground
+                cursor.execute("INSERT INTO Regrade_Job (exercise_id, status) VALUES (%s, %s)",
+                               [options['exercise_id'], regrade.QUEUED])
+                job_id = cursor.lastrowid
+
+        started = time.perf_counter()
+        regrade.run(job_id)
+        with connection.cursor() as cursor:
+            job = regrade.get_job(cursor, job_id)
+        if job is None:
+            raise CommandError(f"Regrade job {job_id} does not exist.")
+        summary = (f"job {job_id}: {job['status']}, {job['total_submissions']} submissions, "
+                   f"{job['distinct_answers']} distinct answers, {job['changed_submissions']} changed, "
+                   f"{job['failed_answers']} could not be graded in {time.perf_counter() - started:.1f}s")
+        if job['status'] == regrade.FAILED:
+            raise CommandError(f"{summary}: {job['error']}")
+        self.stdout.write(self.style.SUCCESS(summary))
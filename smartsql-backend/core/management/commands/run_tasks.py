@@ -0,0 +1,70 @@
+import json
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the Task queue until stopped (SIGINT / SIGTERM finish running tasks first)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Tasks run at once (one thread each).')
+        parser.add_argument('--only', help='Comma-separated task names this worker runs (default: all).')
+        parser.add_argument('--min-priority', type=int, help='Only claim tasks of at least this priority.')
+        parser.add_argument('--visibility-timeout', type=int,
+                            help="Lease length in seconds for claimed tasks, instead of each task's own.")
+        parser.add_argument('--poll-interval', type=float, help=f'Seconds between polls when idle '
+                            f'(default {settings.TASK_POLL_INTERVAL}).')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due.')
+        parser.add_argument('--stats-interval', type=int, default=60,
+                            help='Seconds between throughput / queue depth reports (0 disables them).')
+        parser.add_argument('--metrics', action='store_true', help='Print queue metrics as JSON and exit.')
+        parser.add_argument('--allow-unshared', action='store_true',
+                            help='Run even though the cache / pub-sub backends are per-process (development only: '
+                                 'web processes then miss the invalidations and events of the tasks run here).')
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            with connection.cursor() as cursor:
+                self.stdout.write(json.dumps(tasks.metrics(cursor), indent=2))
+            return
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        problem = tasks.shared_backend_problem()
+        if problem and not options['allow_unshared']:
+            raise CommandError(f"{problem} Tasks run by this worker would leave the web processes' caches stale "
+                               f"(pass --allow-unshared to run anyway).")
+
+        names = [name.strip() for name in options['only'].split(',') if name.strip()] if options['only'] else None
+        worker = tasks.Worker(options['concurrency'], names=names, min_priority=options['min_priority'],
+                              visibility_timeout=options['visibility_timeout'],
+                              poll_interval=options['poll_interval'], exit_when_idle=options['once'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        started = time.perf_counter()
+        tasks.run_worker(worker)
+        self.stdout.write(f"Worker {worker.id}: {options['concurrency']} threads"
+                          f"{', tasks ' + ', '.join(names) if names else ''}")
+        last_report, last_succeeded = time.monotonic(), 0
+        while worker.is_alive():
+            worker.stopping.wait(1)
+            interval = options['stats_interval']
+            if interval and time.monotonic() - last_report >= interval:
+                with connection.cursor() as cursor:
+                    depth = tasks.metrics(cursor, window=interval)
+                rate = (worker.succeeded - last_succeeded) * 60 / (time.monotonic() - last_report)
+                self.stdout.write(f"📊 {rate:.1f} tasks/min here, {worker.failed} failed attempts; queue: "
+                                  f"{depth['ready']} ready, {depth['delayed']} delayed, {depth['running']} running, "
+                                  f"oldest {depth['oldest_ready_seconds'] or 0}s")
+                last_report, last_succeeded = time.monotonic(), worker.succeeded
+        worker.join()
+        connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker {worker.id} stopped: {worker.succeeded} tasks done, {worker.failed} failed attempts "
+            f"in {time.perf_counter() - started:.1f}s"))
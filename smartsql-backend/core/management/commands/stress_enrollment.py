@@ -0,0 +1,90 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from core import course_stats, enrollment, progress
+
+
+class Command(BaseCommand):
+    help = ("Registration-rush stress test: every student enrolls in a fresh seat-limited course "
+            "several times at once, then the result is checked for over-enrollment and double counting. "
+            "The temporary course is deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, help='Seat limit of the test course (default: half the students).')
+        parser.add_argument('--repeat', type=int, default=3, help='Enroll requests per student (default 3).')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent request threads (default 64).')
+        parser.add_argument('--keep', action='store_true', help='Keep the test course for inspection.')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT student_id FROM Student")
+            students = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT instructor_id FROM Instructor ORDER BY instructor_id LIMIT 1")
+            instructor = cursor.fetchone()
+        if len(students) < 2 or instructor is None:
+            raise CommandError("Need at least two students and one instructor.")
+        seats = options['seats'] if options['seats'] is not None else len(students) // 2
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO Course (course_name, course_code, instructor_id, course_description, state, seat_limit)
+                VALUES ('Enrollment stress test', 'STRESS', %s, 'Temporary course created by stress_enrollment', 'active', %s)
+            """, [instructor[0], seats])
+            course_id = cursor.lastrowid
+            course_stats.refresh(cursor, [course_id])
+
+        try:
+            requests = [student_id for _ in range(options['repeat']) for student_id in students]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                results = Counter(pool.map(lambda student_id: self.enroll(student_id, course_id), requests))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{len(requests)} enroll requests in {elapsed:.2f}s "
+                              f"({len(requests) / elapsed:,.0f}/s): {dict(results)}")
+            self.check(course_id, seats, len(students))
+        finally:
+            if not options['keep']:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    progress.drop_course_rollups(cursor, course_id)
+                    cursor.execute("DELETE FROM Course WHERE course_id = %s", [course_id])
+
+    def enroll(self, student_id, course_id):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                return enrollment.enroll(cursor, student_id, course_id)
+        except Exception as e:
+            return f"error: {type(e).__name__}"
+        finally:
+            connections.close_all()
+
+    def check(self, course_id, seats, student_count):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT status, COUNT(*), COUNT(DISTINCT student_id) FROM Enrollment
+                WHERE course_id = %s GROUP BY status
+            """, [course_id])
+            rows = {status: (count, distinct) for status, count, distinct in cursor.fetchall()}
+            cursor.execute("SELECT enrolled_count FROM Course_Stats WHERE course_id = %s", [course_id])
+            counter = cursor.fetchone()[0]
+
+        enrolled, enrolled_distinct = rows.get('enrolled', (0, 0))
+        waitlisted, _ = rows.get('waitlisted', (0, 0))
+        problems = []
+        if enrolled > seats:
+            problems.append(f"over-enrolled: {enrolled} enrolled for {seats} seats")
+        if enrolled != enrolled_distinct:
+            problems.append("duplicate enrollment rows")
+        if counter != enrolled:
+            problems.append(f"Course_Stats.enrolled_count is {counter}, but {enrolled} rows are enrolled")
+        if enrolled != min(seats, student_count):
+            problems.append(f"{enrolled} enrolled, expected {min(seats, student_count)}")
+        if enrolled + waitlisted != student_count:
+            problems.append(f"{enrolled + waitlisted} students enrolled or waitlisted, expected {student_count}")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            f"OK: {enrolled}/{seats} seats taken, {waitlisted} waitlisted, counter consistent"))
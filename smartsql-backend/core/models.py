@@ -53,6 +53,7 @@ class Student_Exercise(models.Model):
     completed_at = models.DateTimeField(auto_now_add=True)
     score = models.FloatField(default=0.0)
     submission_count = models.IntegerField(default=0)
+    best_score = models.FloatField(null=True, blank=True)
     last_submission = models.TextField(null=True, blank=True)
     is_correct = models.BooleanField(default=False)
     is_completed = models.BooleanField(default=False)
@@ -66,6 +67,9 @@ class Student_Exercise(models.Model):
 class Student_Module(models.Model):
     student_id = models.IntegerField()
     module_id = models.IntegerField()
+    course_id = models.IntegerField(null=True, blank=True)
+    total_exercises = models.IntegerField(default=0)
+    completed_exercises = models.IntegerField(default=0)
     completed_at = models.DateTimeField(null=True, blank=True)
     is_completed = models.BooleanField(default=False)
     progress = models.FloatField(default=0.0)  # 完成百分比
@@ -79,6 +83,8 @@ class Student_Module(models.Model):
 class Student_Course(models.Model):
     student_id = models.IntegerField()
     course_id = models.IntegerField()
+    total_exercises = models.IntegerField(default=0)
+    completed_exercises = models.IntegerField(default=0)
     completed_at = models.DateTimeField(null=True, blank=True)
     is_completed = models.BooleanField(default=False)
     progress = models.FloatField(default=0.0)  # 完成百分比
@@ -95,7 +101,7 @@ class Exercise(models.Model):
     description = models.TextField()
     hint = models.TextField(blank=True, null=True)
     difficulty = models.IntegerField()
-    table_schema = models.TextField(blank=True, null=True)  # 根据需求调整类型
+    dataset_hash = models.CharField(max_length=64, blank=True, null=True)  # Dataset.dataset_hash（表结构按内容哈希共享）
 
     def __str__(self):
         return self.title
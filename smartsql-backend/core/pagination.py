@@ -0,0 +1,37 @@
+"""
+Opaque keyset-pagination cursors.
+
+A cursor is the sort key of the last row of a page, JSON-encoded and wrapped in
+URL-safe base64 so clients treat it as a token rather than something to edit.
+"""
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decode a cursor that must hold exactly `size` values; raises InvalidCursor otherwise."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor.')
+    return values
+
+
+def page_size(raw, default, maximum):
+    """Parse a ?limit= value, clamped to [1, maximum]."""
+    if raw in (None, ''):
+        return default
+    try:
+        return max(1, min(int(raw), maximum))
+    except (TypeError, ValueError):
+        return default
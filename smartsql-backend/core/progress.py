@@ -0,0 +1,264 @@
+"""
+Incrementally maintained progress rollups (Student_Module / Student_Course).
+
+Every helper takes an open cursor so it runs inside the caller's transaction:
+the rollup rows change in the same commit as the submission, enrollment or
+exercise-membership change that caused them. Full rebuilds that may touch a
+whole course can instead be queued as a background task (rebuild_rollups_task).
+"""
+from django.db import connection, transaction
+
+from core import tasks
+
+# Progress / completion columns recomputed from the count columns. Only used in
+# single-table UPDATEs, where MySQL applies assignments left to right, so these
+# see the already-updated counts.
+_DERIVED_SET = """
+    progress = CASE WHEN total_exercises > 0
+                    THEN ROUND(100 * completed_exercises / total_exercises, 2) ELSE 0 END,
+    is_completed = (total_exercises > 0 AND completed_exercises >= total_exercises),
+    completed_at = CASE WHEN total_exercises > 0 AND completed_exercises >= total_exercises
+                        THEN COALESCE(completed_at, NOW()) END
+"""
+
+_MODULE_ROLLUP_SELECT = """
+    SELECT en.student_id, m.module_id, m.course_id,
+           COUNT(DISTINCT me.exercise_id) AS total_exercises,
+           COUNT(DISTINCT se.exercise_id) AS completed_exercises
+    FROM Enrollment en
+    JOIN Module m ON m.course_id = en.course_id
+    LEFT JOIN Module_Exercise me ON me.module_id = m.module_id
+    LEFT JOIN Student_Exercise se ON se.exercise_id = me.exercise_id
+        AND se.student_id = en.student_id AND se.is_correct = TRUE
+    WHERE {where}
+    GROUP BY en.student_id, m.module_id, m.course_id
+"""
+
+_COURSE_ROLLUP_SELECT = """
+    SELECT en.student_id, en.course_id,
+           COUNT(DISTINCT me.exercise_id) AS total_exercises,
+           COUNT(DISTINCT se.exercise_id) AS completed_exercises
+    FROM Enrollment en
+    LEFT JOIN Module m ON m.course_id = en.course_id
+    LEFT JOIN Module_Exercise me ON me.module_id = m.module_id
+    LEFT JOIN Student_Exercise se ON se.exercise_id = me.exercise_id
+        AND se.student_id = en.student_id AND se.is_correct = TRUE
+    WHERE {where}
+    GROUP BY en.student_id, en.course_id
+"""
+
+_UPSERT_DERIVED = """
+    progress = VALUES(progress),
+    is_completed = VALUES(is_completed),
+    completed_at = IF(VALUES(is_completed), COALESCE(completed_at, VALUES(completed_at)), NULL)
+"""
+
+
+def _enrollment_filter(student_ids=None, course_ids=None, student_range=None):
+    """Build the WHERE clause selecting the (student, course) pairs to recompute."""
+    clauses, params = ["en.status = 'enrolled'"], []
+    if student_range is not None:
+        clauses.append("en.student_id BETWEEN %s AND %s")
+        params.extend(student_range)
+    if student_ids is not None:
+        clauses.append("en.student_id IN %s")
+        params.append(tuple(student_ids))
+    if course_ids is not None:
+        clauses.append("en.course_id IN %s")
+        params.append(tuple(course_ids))
+    return " AND ".join(clauses), params
+
+
+def rollup_queries(student_ids=None, course_ids=None, student_range=None):
+    """Return (module_sql, course_sql, params) computing rollups from the source tables."""
+    where, params = _enrollment_filter(student_ids, course_ids, student_range)
+    return _MODULE_ROLLUP_SELECT.format(where=where), _COURSE_ROLLUP_SELECT.format(where=where), params
+
+
+def rebuild_rollups(cursor, student_ids=None, course_ids=None, student_range=None):
+    """
+    Recompute module and course rollups for the enrolled pairs matching the
+    filters. Returns the number of rollup rows written.
+    """
+    if (student_ids is not None and not student_ids) or (course_ids is not None and not course_ids):
+        return 0
+    module_sql, course_sql, params = rollup_queries(student_ids, course_ids, student_range)
+
+    cursor.execute(f"""
+        INSERT INTO Student_Module (student_id, module_id, course_id, total_exercises,
+                                    completed_exercises, progress, is_completed, completed_at)
+        SELECT t.student_id, t.module_id, t.course_id, t.total_exercises, t.completed_exercises,
+               CASE WHEN t.total_exercises > 0
+                    THEN ROUND(100 * t.completed_exercises / t.total_exercises, 2) ELSE 0 END,
+               t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises,
+               CASE WHEN t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises THEN NOW() END
+        FROM ({module_sql}) t
+        ON DUPLICATE KEY UPDATE
+            course_id = VALUES(course_id),
+            total_exercises = VALUES(total_exercises),
+            completed_exercises = VALUES(completed_exercises),
+            {_UPSERT_DERIVED}
+    """, params)
+    written = cursor.rowcount
+
+    cursor.execute(f"""
+        INSERT INTO Student_Course (student_id, course_id, total_exercises,
+                                    completed_exercises, progress, is_completed, completed_at)
+        SELECT t.student_id, t.course_id, t.total_exercises, t.completed_exercises,
+               CASE WHEN t.total_exercises > 0
+                    THEN ROUND(100 * t.completed_exercises / t.total_exercises, 2) ELSE 0 END,
+               t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises,
+               CASE WHEN t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises THEN NOW() END
+        FROM ({course_sql}) t
+        ON DUPLICATE KEY UPDATE
+            total_exercises = VALUES(total_exercises),
+            completed_exercises = VALUES(completed_exercises),
+            {_UPSERT_DERIVED}
+    """, params)
+    return written + cursor.rowcount
+
+
+@tasks.task('rebuild_rollups')
+def rebuild_rollups_task(student_ids=None, course_ids=None):
+    """rebuild_rollups() in its own transaction (task handler; recomputing is idempotent)."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        return {'rows': rebuild_rollups(cursor, student_ids=student_ids, course_ids=course_ids)}
+
+
+def prune_orphan_rollups(cursor, student_range):
+    """
+    Delete rollup rows in the student id range that no longer match an
+    enrollment (dropped students, modules moved to another course).
+    Returns the number of rows deleted.
+    """
+    cursor.execute("""
+        DELETE sm FROM Student_Module sm
+        LEFT JOIN Module m ON m.module_id = sm.module_id
+        LEFT JOIN Enrollment en ON en.student_id = sm.student_id
+            AND en.course_id = m.course_id AND en.status = 'enrolled'
+        WHERE sm.student_id BETWEEN %s AND %s AND en.enrollment_id IS NULL
+    """, list(student_range))
+    deleted = cursor.rowcount
+    cursor.execute("""
+        DELETE sc FROM Student_Course sc
+        LEFT JOIN Enrollment en ON en.student_id = sc.student_id
+            AND en.course_id = sc.course_id AND en.status = 'enrolled'
+        WHERE sc.student_id BETWEEN %s AND %s AND en.enrollment_id IS NULL
+    """, list(student_range))
+    return deleted + cursor.rowcount
+
+
+def annotate_locks(modules):
+    """
+    Set 'locked' on modules ordered by module_id, in a single pass: a module is
+    locked while any earlier module still has unsolved exercises. Modules
+    without exercises never lock the ones after them.
+    """
+    blocked = False
+    for module in modules:
+        module['locked'] = 1 if blocked else 0
+        if module['completed_exercises'] < module['total_exercises']:
+            blocked = True
+    return modules
+
+
+def record_exercise_result(cursor, student_id, exercise_id, was_correct, is_correct):
+    """Shift the student's rollups when an exercise flips between solved and unsolved."""
+    if bool(was_correct) == bool(is_correct):
+        return
+    delta = 1 if is_correct else -1
+
+    cursor.execute(f"""
+        UPDATE Student_Module
+        SET completed_exercises = GREATEST(completed_exercises + %s, 0),
+            {_DERIVED_SET}
+        WHERE student_id = %s
+          AND module_id IN (SELECT module_id FROM Module_Exercise WHERE exercise_id = %s)
+    """, [delta, student_id, exercise_id])
+
+    cursor.execute(f"""
+        UPDATE Student_Course
+        SET completed_exercises = GREATEST(completed_exercises + %s, 0),
+            {_DERIVED_SET}
+        WHERE student_id = %s
+          AND course_id IN (
+              SELECT m.course_id FROM Module_Exercise me
+              JOIN Module m ON me.module_id = m.module_id
+              WHERE me.exercise_id = %s)
+    """, [delta, student_id, exercise_id])
+
+
+def apply_exercise_membership(cursor, exercise_id, module_ids, delta):
+    """
+    Adjust rollups for an exercise being added to (delta=1) or removed from
+    (delta=-1) the given modules. Call after inserting or before deleting the
+    Module_Exercise rows, so solved flags are still visible.
+
+    Course rollups count distinct exercises (as rebuild_rollups does), so a
+    course only moves when the exercise enters or leaves it entirely: courses
+    where another of its modules still links the exercise are left alone.
+    """
+    module_ids = tuple(module_ids)
+    if not module_ids:
+        return
+    cursor.execute("""
+        SELECT DISTINCT m.course_id
+        FROM Module m
+        WHERE m.module_id IN %s AND m.course_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM Module_Exercise me
+                          JOIN Module other ON other.module_id = me.module_id
+                          WHERE me.exercise_id = %s AND other.course_id = m.course_id
+                            AND me.module_id NOT IN %s)
+    """, [module_ids, exercise_id, module_ids])
+    course_ids = tuple(row[0] for row in cursor.fetchall())
+
+    solved = """
+        EXISTS (SELECT 1 FROM Student_Exercise se
+                WHERE se.student_id = {table}.student_id
+                  AND se.exercise_id = %s AND se.is_correct = TRUE)
+    """
+    cursor.execute(f"""
+        UPDATE Student_Module
+        SET total_exercises = GREATEST(total_exercises + %s, 0),
+            completed_exercises = GREATEST(completed_exercises + %s * {solved.format(table='Student_Module')}, 0),
+            {_DERIVED_SET}
+        WHERE module_id IN %s
+    """, [delta, delta, exercise_id, module_ids])
+
+    if not course_ids:
+        return
+    cursor.execute(f"""
+        UPDATE Student_Course
+        SET total_exercises = GREATEST(total_exercises + %s, 0),
+            completed_exercises = GREATEST(completed_exercises + %s * {solved.format(table='Student_Course')}, 0),
+            {_DERIVED_SET}
+        WHERE course_id IN %s
+    """, [delta, delta, exercise_id, course_ids])
+
+
+def seed_module_rollups(cursor, module_id):
+    """Create empty rollup rows for a new module for every enrolled student."""
+    cursor.execute("""
+        INSERT IGNORE INTO Student_Module (student_id, module_id, course_id)
+        SELECT en.student_id, m.module_id, m.course_id
+        FROM Module m
+        JOIN Enrollment en ON en.course_id = m.course_id AND en.status = 'enrolled'
+        WHERE m.module_id = %s
+    """, [module_id])
+
+
+def drop_module_rollups(cursor, module_id):
+    """Remove rollup rows of a module that was deleted or moved to another course."""
+    cursor.execute("DELETE FROM Student_Module WHERE module_id = %s", [module_id])
+
+
+def drop_student_course_rollups(cursor, student_id, course_id):
+    """Remove one student's rollup rows for a course they dropped."""
+    cursor.execute("DELETE FROM Student_Module WHERE student_id = %s AND course_id = %s", [student_id, course_id])
+    cursor.execute("DELETE FROM Student_Course WHERE student_id = %s AND course_id = %s", [student_id, course_id])
+
+
+def drop_course_rollups(cursor, course_id):
+    """Remove all rollup rows of a deleted course."""
+    cursor.execute("DELETE FROM Student_Module WHERE course_id = %s", [course_id])
+    cursor.execute("DELETE FROM Student_Course WHERE course_id = %s", [course_id])
@@ -0,0 +1,182 @@
+"""
+Publish / subscribe for server-push events.
+
+Subscribers are async SSE responses waiting on an asyncio.Queue; publishers are
+ordinary (sync) request handlers. The in-process Hub hands events from one to
+the other with call_soon_threadsafe, so a waiting client costs nothing but a
+parked coroutine.
+
+Publishing goes through a broadcast backend chosen by settings.PUBSUB_BACKEND:
+
+- LocalBroadcast delivers straight into this process's hub. Enough for a
+  single ASGI worker and for tests.
+- RedisBroadcast publishes to Redis pub/sub and a listener thread in every
+  process feeds what it receives into the local hub, so all workers see every
+  event. Needs the optional `redis` package.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+_event_ids = itertools.count(1)
+
+
+class Subscription:
+    """A bounded queue of (channel, event) pairs for one consumer on one event loop."""
+
+    def __init__(self, hub, channels, maxsize):
+        self.hub = hub
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        # Set when events had to be dropped; the consumer should resync from the database
+        self.overflowed = False
+
+    def _put(self, item):
+        # Runs on self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflowed = True
+        self.queue.put_nowait(item)
+
+    async def get(self, timeout=None):
+        """Next (channel, event), or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Hub:
+    """Channel name -> live subscriptions in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._taps = []
+
+    def add_tap(self, prefix, callback):
+        """Call callback(channel, event) synchronously for every event on channels starting with prefix."""
+        with self._lock:
+            self._taps.append((prefix, callback))
+
+    def subscribe(self, channels, maxsize=100):
+        """Must be called from the subscriber's event loop."""
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def dispatch(self, channel, event):
+        """Hand an event to every local subscriber of the channel. Safe from any thread."""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            taps = [callback for prefix, callback in self._taps if channel.startswith(prefix)]
+        for callback in taps:
+            callback(channel, event)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, (channel, event))
+            except RuntimeError:
+                # The subscriber's loop is gone (worker shutting down)
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+
+hub = Hub()
+
+
+class LocalBroadcast:
+    """Deliver events to this process only."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channel, event):
+        self.hub.dispatch(channel, event)
+
+
+class RedisBroadcast:
+    """Fan events out to every process through Redis pub/sub."""
+
+    PREFIX = 'smartsql:events:'
+
+    def __init__(self, hub):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroadcast requires the 'redis' package.")
+        self.hub = hub
+        self.client = redis.Redis.from_url(settings.PUBSUB_REDIS_URL)
+        listener = threading.Thread(target=self._listen, name='pubsub-redis', daemon=True)
+        listener.start()
+
+    def publish(self, channel, event):
+        self.client.publish(self.PREFIX + channel, json.dumps(event, default=str))
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.PREFIX + '*')
+        for message in pubsub.listen():
+            channel = message['channel']
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            self.hub.dispatch(channel[len(self.PREFIX):], json.loads(message['data']))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.PUBSUB_BACKEND)(hub)
+    return _backend
+
+
+def publish(channel, event):
+    """Publish an event dict now. Adds a process-unique 'id' for the SSE stream."""
+    event = {'id': next(_event_ids), **event}
+    get_backend().publish(channel, event)
+
+
+def publish_on_commit(channel, event):
+    """Publish once the current transaction commits, so clients never see rolled-back data."""
+    transaction.on_commit(lambda: publish(channel, event))
+
+
+def subscribe(channels, maxsize=100):
+    """Subscribe the calling coroutine's event loop to these channels. Use as a context manager."""
+    get_backend()
+    return hub.subscribe(channels, maxsize)
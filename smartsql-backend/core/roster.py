@@ -0,0 +1,218 @@
+"""
+Bulk roster import: enroll a whole section in one transaction.
+
+A roster is a list of students identified by email or username, from CSV (with
+a header row: email, username, first_name, last_name, password) or JSON (a list
+of such objects, or of bare emails / usernames). Every identifier is resolved
+with one query, missing students get Users and Student rows the way signup_api
+creates them, and everyone is enrolled with multi-row INSERTs of up to
+BATCH_SIZE rows. Rollups, Course_Stats and inbox delivery are then updated once
+for the whole roster rather than per student.
+
+The instructor's roster is authoritative: listed students are enrolled even
+past the course's seat_limit, and waitlisted or dropped ones are (re)enrolled.
+import_roster() returns one outcome per input row.
+"""
+import csv
+import io
+import json
+import re
+import secrets
+from collections import Counter
+
+from core import course_stats, dashboard, inbox, progress
+
+BATCH_SIZE = 1000
+
+USERNAME_RE = re.compile(r'^[a-zA-Z0-9_-]{8,}$')
+
+FIELDS = ('email', 'username', 'first_name', 'last_name', 'password')
+
+# Per-row outcomes
+ENROLLED = 'enrolled'
+CREATED = 'created_and_enrolled'
+REENROLLED = 're_enrolled'
+ALREADY_ENROLLED = 'already_enrolled'
+NOT_FOUND = 'not_found'
+NOT_A_STUDENT = 'not_a_student'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+
+class RosterError(ValueError):
+    pass
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse(content, fmt=None):
+    """Parse roster text (CSV or JSON; guessed from the content when fmt is None) into row dicts."""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    fmt = fmt or ('json' if content.lstrip()[:1] in ('[', '{') else 'csv')
+    if fmt == 'json':
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise RosterError(f"Invalid JSON roster: {e}")
+        if isinstance(data, dict):
+            data = data.get('students')
+        return normalize(data)
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content))
+        if not reader.fieldnames or not {'email', 'username'} & {f.strip().lower() for f in reader.fieldnames}:
+            raise RosterError("CSV roster needs a header row with an 'email' or 'username' column.")
+        return normalize([{(k or '').strip().lower(): v for k, v in row.items()} for row in reader])
+    raise RosterError(f"Unknown roster format: {fmt}")
+
+
+def normalize(entries):
+    """Roster entries (dicts, or bare email / username strings) as dicts with every FIELDS key."""
+    if not isinstance(entries, list):
+        raise RosterError("A roster must be a list of students.")
+    rows = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'email' if '@' in entry else 'username': entry}
+        if not isinstance(entry, dict):
+            raise RosterError("Roster entries must be objects or strings.")
+        rows.append({field: str(entry.get(field) or '').strip() for field in FIELDS})
+    for row in rows:
+        row['email'] = row['email'].lower()
+    return rows
+
+
+def _new_user_error(row):
+    if not row['email'] or '@' not in row['email']:
+        return 'a valid email is required to create an account'
+    if not USERNAME_RE.match(row['username']):
+        return 'username must be at least 8 letters, digits, underscores or hyphens'
+    if not row['first_name'] or not row['last_name']:
+        return 'first_name and last_name are required to create an account'
+    if row['password'] and len(row['password']) < 8:
+        return 'password must be at least 8 characters'
+    return None
+
+
+def _resolve(cursor, emails, usernames):
+    """{('email' | 'username', value): (user_id, user_type)} for the matching Users rows."""
+    found = {}
+    for column, values in (('email', emails), ('username', usernames)):
+        for chunk in _chunks(sorted(values)):
+            cursor.execute(f"SELECT user_id, user_type, {column} FROM Users WHERE {column} IN %s", [tuple(chunk)])
+            for user_id, user_type, value in cursor.fetchall():
+                key = (column, value.lower() if column == 'email' else value)
+                # Usernames are not unique: an ambiguous one resolves to nobody
+                found[key] = None if key in found else (user_id, user_type)
+    return found
+
+
+def import_roster(cursor, course_id, rows, create_missing=True):
+    """
+    Enroll the roster in the course; must run inside transaction.atomic.
+    Returns (summary counts, per-row results in input order).
+    """
+    results = [{'row': index + 1, 'email': row['email'], 'username': row['username']}
+               for index, row in enumerate(rows)]
+
+    # Identify each row by email, else username
+    keys, seen = [], set()
+    for row, result in zip(rows, results):
+        key = ('email', row['email']) if row['email'] else ('username', row['username']) if row['username'] else None
+        if key is None:
+            result['outcome'], result['error'] = INVALID, 'email or username is required'
+        elif key in seen:
+            result['outcome'] = DUPLICATE
+            key = None
+        else:
+            seen.add(key)
+        keys.append(key)
+
+    found = _resolve(cursor, {k[1] for k in keys if k and k[0] == 'email'},
+                     {k[1] for k in keys if k and k[0] == 'username'})
+
+    to_create = []
+    for row, result, key in zip(rows, results, keys):
+        if key is None:
+            continue
+        match = found.get(key)
+        if key in found and match is None:
+            result['outcome'], result['error'] = INVALID, 'username matches several accounts; use the email'
+        elif match is None:
+            # Accounts can only be created from rows that carry an email
+            error = _new_user_error(row) if create_missing and key[0] == 'email' else None
+            if not create_missing or key[0] != 'email':
+                result['outcome'] = NOT_FOUND
+            elif error:
+                result['outcome'], result['error'] = INVALID, error
+            else:
+                to_create.append((row, result))
+        elif match[1] != 'Student':
+            result['outcome'] = NOT_A_STUDENT
+        else:
+            result['user_id'] = match[0]
+
+    _create_students(cursor, to_create)
+
+    student_rows = [r for r in results if 'user_id' in r]
+    student_ids = sorted({r['user_id'] for r in student_rows})
+    new_ids = _enroll(cursor, course_id, student_ids, student_rows)
+
+    if new_ids:
+        progress.rebuild_rollups(cursor, student_ids=new_ids, course_ids=[course_id])
+        inbox.deliver_enrollments(cursor, new_ids, course_id)
+        dashboard.invalidate(*new_ids)
+    course_stats.refresh(cursor, [course_id])
+
+    return dict(Counter(r['outcome'] for r in results)), results
+
+
+def _create_students(cursor, to_create):
+    """Create Users + Student rows (as signup_api does) and record their ids in the results."""
+    for chunk in _chunks(to_create):
+        values = []
+        for row, result in chunk:
+            if not row['password']:
+                row['password'] = result['password'] = secrets.token_urlsafe(9)
+            values.append((row['username'], row['email'], row['password'], row['first_name'], row['last_name']))
+        cursor.execute(f"""
+            INSERT INTO Users (username, email, password, first_name, last_name, user_type)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s, 'Student')"] * len(values))}
+        """, [value for row in values for value in row])
+        # Concurrent inserts may interleave auto-increment ids, so look them up
+        cursor.execute("SELECT user_id, email FROM Users WHERE email IN %s", [tuple(v[1] for v in values)])
+        ids = {email.lower(): user_id for user_id, email in cursor.fetchall()}
+        cursor.execute(f"INSERT INTO Student (student_id) VALUES {', '.join(['(%s)'] * len(ids))}", list(ids.values()))
+        for row, result in chunk:
+            result['user_id'] = ids[row['email']]
+            result['outcome'] = CREATED
+
+
+def _enroll(cursor, course_id, student_ids, student_rows):
+    """Enroll the students; set each row's outcome. Returns the ids not previously enrolled."""
+    previous = {}
+    for chunk in _chunks(student_ids):
+        cursor.execute("""
+            SELECT student_id, status FROM Enrollment
+            WHERE course_id = %s AND student_id IN %s
+            FOR UPDATE
+        """, [course_id, tuple(chunk)])
+        previous.update(cursor.fetchall())
+
+    new_ids = [s for s in student_ids if previous.get(s) != 'enrolled']
+    for chunk in _chunks(new_ids):
+        cursor.execute(f"""
+            INSERT INTO Enrollment (student_id, course_id, status)
+            VALUES {", ".join(["(%s, %s, 'enrolled')"] * len(chunk))}
+            ON DUPLICATE KEY UPDATE status = 'enrolled'
+        """, [value for student_id in chunk for value in (student_id, course_id)])
+
+    for result in student_rows:
+        if result.get('outcome') == CREATED:
+            continue
+        status = previous.get(result['user_id'])
+        result['outcome'] = ENROLLED if status is None else ALREADY_ENROLLED if status == 'enrolled' else REENROLLED
+    return new_ids
@@ -0,0 +1,85 @@
+"""
+Per-student attempted / solved exercise sets.
+
+Each set is a Python int used as a bitmap indexed by exercise_id (ids are
+AUTO_INCREMENT, so the bitmaps stay dense and a few hundred bytes cover a
+whole course catalog). Together with the catalog's per-module and per-course
+masks, completion flags become bit tests and progress counts become
+popcounts of an AND, instead of joins against Student_Exercise.
+
+The bitmaps are loaded with one indexed query and cached per student. Every
+committed submission bumps the student's cache version, so the next get()
+reloads; patching the cached value in place would race with a concurrent
+get() that loaded Student_Exercise before the commit. Other processes only
+see the bump through a shared cache; without one they keep their copy for at
+most LOCAL_CACHE_MAX_AGE seconds (cache_utils.ttl).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core.cache_utils import bump_on_commit, ttl, versioned_key
+
+NAMESPACE = 'student_solved'
+
+
+def mask(exercise_ids):
+    """Bitmap with the bits of these exercise ids set."""
+    bits = 0
+    for exercise_id in exercise_ids:
+        bits |= 1 << exercise_id
+    return bits
+
+
+class SolvedSet:
+    __slots__ = ('attempted', 'solved')
+
+    def __init__(self, attempted=0, solved=0):
+        self.attempted = attempted
+        self.solved = solved
+
+    def is_attempted(self, exercise_id):
+        return bool(self.attempted >> exercise_id & 1)
+
+    def is_solved(self, exercise_id):
+        return bool(self.solved >> exercise_id & 1)
+
+    def count_attempted(self, exercise_mask):
+        return (self.attempted & exercise_mask).bit_count()
+
+    def count_solved(self, exercise_mask):
+        return (self.solved & exercise_mask).bit_count()
+
+
+def _key(student_id):
+    return versioned_key(NAMESPACE, student_id, 'bitmaps')
+
+
+def _load(student_id):
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT exercise_id, is_correct
+            FROM Student_Exercise
+            WHERE student_id = %s
+        """, [student_id])
+        attempted = solved = 0
+        for exercise_id, is_correct in cursor.fetchall():
+            attempted |= 1 << exercise_id
+            if is_correct:
+                solved |= 1 << exercise_id
+    return attempted, solved
+
+
+def get(student_id):
+    """The student's SolvedSet, from the cache when possible."""
+    key = _key(student_id)
+    bitmaps = cache.get(key)
+    if bitmaps is None:
+        bitmaps = _load(student_id)
+        cache.set(key, bitmaps, ttl(settings.SOLVED_CACHE_TTL))
+    return SolvedSet(*bitmaps)
+
+
+def invalidate(*student_ids):
+    """Reload these students' bitmaps once the current transaction commits (submissions, regrades)."""
+    bump_on_commit(NAMESPACE, student_ids)
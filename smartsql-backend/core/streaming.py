@@ -0,0 +1,132 @@
+"""
+Streaming NDJSON / CSV responses for large result sets.
+
+stream_query() runs a SELECT on a MySQL server-side cursor (SSCursor), which
+hands rows over as the server produces them instead of buffering the whole
+result in the client, and writes them out STREAM_CHUNK_ROWS at a time through
+a StreamingHttpResponse. Only one chunk is ever held in memory, however many
+rows the query returns.
+
+Under ASGI the rows are pulled by an async generator that fetches each chunk
+with sync_to_async on the request's database thread; Django 4.2 would
+otherwise read a sync iterator to the end before sending anything.
+
+Views opt in with @renderer_classes(STREAM_RENDERERS) and check
+wants_stream(request). That way `?format=ndjson|csv` (or an Accept header) is
+negotiated by DRF instead of being rejected as an unknown format. The
+renderers themselves only handle the non-streamed responses of such views
+(errors, mostly).
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _dumps(value):
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return "".join(_dumps(row) + "\n" for row in rows).encode()
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            # Errors and other non-tabular payloads
+            data = [{'detail': _dumps(data)}]
+        columns = list(dict.fromkeys(key for row in data for key in row))
+        return _csv_lines([columns] + [[row.get(c) for c in columns] for row in data]).encode()
+
+
+STREAM_RENDERERS = [JSONRenderer, NDJSONRenderer, CSVRenderer]
+
+
+def wants_stream(request):
+    """The streaming format ('ndjson' / 'csv') DRF negotiated for this request, or None."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer is not None and renderer.format in CONTENT_TYPES else None
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _open_cursor():
+    connection.ensure_connection()
+    if connection.vendor == 'mysql':
+        from MySQLdb.cursors import SSCursor
+        return connection.connection.cursor(SSCursor)
+    return connection.cursor()
+
+
+def iter_chunks(sql, params, fmt, chunk_rows=None):
+    """Yield the rendered result of a query piece by piece: header / first line, then one string per chunk."""
+    chunk_rows = chunk_rows or settings.STREAM_CHUNK_ROWS
+    cursor = _open_cursor()
+    try:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        if fmt == 'csv':
+            yield _csv_lines([columns])
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            if fmt == 'csv':
+                yield _csv_lines(rows)
+            else:
+                yield "".join(_dumps(dict(zip(columns, row))) + "\n" for row in rows)
+    finally:
+        # Closing an SSCursor drains what is left, so the connection stays usable
+        cursor.close()
+
+
+async def _aiter_chunks(chunks):
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Client went away early: release the server-side cursor on its own thread
+        await sync_to_async(chunks.close)()
+
+
+def stream_query(request, sql, params, fmt, filename=None):
+    """StreamingHttpResponse with the query's rows as NDJSON or CSV."""
+    chunks = iter_chunks(sql, params, fmt)
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        chunks = _aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,67 @@
+"""
+Live submission feed for instructors.
+
+submit_exercise_api publishes one event per graded submission to the course's
+channel once it commits. Every process keeps the last SUBMISSION_FEED_BUFFER
+events of each course in a ring buffer (filled by a hub tap, so it also
+receives events published by other workers through the broadcast backend);
+a viewer who joins mid-session is first replayed that buffer. Events carry
+everything the feed shows, so viewers never query the database per event.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import catalog, pubsub
+
+PREFIX = 'submissions:course:'
+
+_buffers = {}
+_lock = threading.Lock()
+
+
+def channel(course_id):
+    return f'{PREFIX}{course_id}'
+
+
+def _record(channel_name, event):
+    course_id = int(channel_name[len(PREFIX):])
+    with _lock:
+        buffer = _buffers.get(course_id)
+        if buffer is None:
+            buffer = _buffers[course_id] = deque(maxlen=settings.SUBMISSION_FEED_BUFFER)
+    buffer.append(event)
+
+
+pubsub.hub.add_tap(PREFIX, _record)
+
+
+def recent(course_id, module_id=None):
+    """Buffered events of a course, oldest first, optionally for one module only."""
+    with _lock:
+        events = list(_buffers.get(course_id, ()))
+    if module_id is not None:
+        events = [e for e in events if e.get('module_id') == module_id]
+    return events
+
+
+def publish_submission(user, exercise_id, is_correct, score):
+    """Announce a graded submission on its course's feed after the transaction commits."""
+    exercise = catalog.get_exercise(exercise_id)
+    if not exercise or exercise['course_id'] is None:
+        return
+    pubsub.publish_on_commit(channel(exercise['course_id']), {
+        'type': 'submission',
+        'course_id': exercise['course_id'],
+        'module_id': exercise['module_id'],
+        'module_name': exercise['module_name'],
+        'exercise_id': exercise_id,
+        'exercise_title': exercise['title'],
+        'student_id': user.user_id,
+        'student_name': f"{user.first_name} {user.last_name}".strip() or user.username,
+        'is_correct': bool(is_correct),
+        'score': float(score),
+        'submitted_at': timezone.now().isoformat(),
+    })
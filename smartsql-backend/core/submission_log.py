@@ -0,0 +1,143 @@
+"""
+Append-only history of every answer submitted.
+
+Student_Exercise keeps one row per student and exercise (the latest answer,
+the best score, and the attempt count). Every attempt is also appended to
+Submission, which is never updated, so attempt counts and learning curves can
+be rebuilt at any time.
+
+Rows go through a BatchWriter (settings.SUBMISSION_LOG_BUFFERED) that writes
+them with one multi-row INSERT per batch. append() still waits for its batch to
+commit (at most SUBMISSION_LOG_TIMEOUT seconds), so a lost or failed write
+reaches the submit request instead of silently leaving Submission behind
+Student_Exercise.submission_count.
+
+Submission is partitioned by month on submitted_at (see the
+manage_submission_partitions command). Its indexes all end in submitted_at, so
+per-student, per-exercise and per-course time ranges are index range scans and
+a bounded range only touches the partitions it overlaps.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.batch_writer import BatchWriter
+from core.pagination import decode_cursor, encode_cursor
+from core.pagination import page_size as _page_size
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows in one streamed export (?format=ndjson|csv)
+MAX_EXPORT_ROWS = 1000000
+
+_INSERT = """
+    INSERT INTO Submission (student_id, exercise_id, course_id, submitted_answer,
+                            is_correct, score, ai_feedback, submitted_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def write_rows(cursor, rows):
+    # mysqlclient folds executemany() of a plain INSERT into one multi-row statement
+    cursor.executemany(_INSERT, rows)
+
+
+_writer = BatchWriter(
+    'submission-log', write_rows,
+    max_batch=settings.SUBMISSION_LOG_BATCH_SIZE,
+    max_delay=settings.SUBMISSION_LOG_FLUSH_MS / 1000,
+)
+
+
+def row(student_id, exercise_id, course_id, answer, is_correct, score, feedback, submitted_at=None):
+    """One attempt as a write_rows() row."""
+    # Naive UTC, the way Django stores DATETIME columns with USE_TZ
+    submitted_at = (submitted_at or timezone.now()).replace(tzinfo=None)
+    return student_id, exercise_id, course_id, answer, bool(is_correct), score, feedback, submitted_at
+
+
+def append(student_id, exercise_id, course_id, answer, is_correct, score, feedback, submitted_at=None):
+    """
+    Log one attempt. Call it after the submission has committed
+    (transaction.on_commit) so rolled-back attempts are never logged.
+    Blocks until the row is committed; raises if it could not be written.
+    """
+    attempt = row(student_id, exercise_id, course_id, answer, is_correct, score, feedback, submitted_at)
+    if settings.SUBMISSION_LOG_BUFFERED:
+        _writer.submit(attempt).result(timeout=settings.SUBMISSION_LOG_TIMEOUT)
+        return
+    with connection.cursor() as cursor:
+        write_rows(cursor, [attempt])
+
+
+def page_size(raw):
+    return _page_size(raw, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def parse_bound(raw):
+    """A ?from= / ?to= value (date or ISO datetime) as naive UTC, or None. Raises ValueError."""
+    if raw in (None, ''):
+        return None
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValueError(f"Invalid date: {raw}")
+        value = datetime(day.year, day.month, day.day)
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, dt_timezone.utc)
+    return value
+
+
+def history_query(student_id=None, exercise_id=None, course_id=None,
+                  since=None, until=None, limit=DEFAULT_PAGE_SIZE, after=None):
+    """
+    (sql, params) selecting attempts matching the filters, newest first, at
+    most `limit` rows. `since` is inclusive and `until` exclusive; `after` is a
+    previous next_cursor. Raises pagination.InvalidCursor for a bad cursor.
+    """
+    where, params = [], []
+    for column, value in (('s.student_id', student_id), ('s.exercise_id', exercise_id), ('s.course_id', course_id)):
+        if value is not None:
+            where.append(f"{column} = %s")
+            params.append(value)
+    if since is not None:
+        where.append("s.submitted_at >= %s")
+        params.append(since)
+    if until is not None:
+        where.append("s.submitted_at < %s")
+        params.append(until)
+    if after:
+        last_at, last_id = decode_cursor(after, 2)
+        where.append("(s.submitted_at < %s OR (s.submitted_at = %s AND s.submission_id < %s))")
+        params.extend([last_at, last_at, last_id])
+    params.append(limit)
+
+    return f"""
+        SELECT s.submission_id, s.student_id, s.exercise_id, s.course_id,
+               s.submitted_answer, s.is_correct, s.score, s.ai_feedback, s.submitted_at
+        FROM Submission s
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY s.submitted_at DESC, s.submission_id DESC
+        LIMIT %s
+    """, params
+
+
+def history(cursor, limit=DEFAULT_PAGE_SIZE, **filters):
+    """One page of history_query() as (rows, next_cursor)."""
+    # One extra row tells us whether another page exists
+    cursor.execute(*history_query(limit=limit + 1, **filters))
+    columns = [col[0] for col in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        row['is_correct'] = bool(row['is_correct'])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last['submitted_at'].isoformat(sep=' '), last['submission_id']])
+    return rows, next_cursor
@@ -0,0 +1,84 @@
+"""
+Persisting graded attempts into Student_Exercise.
+
+write_batch() upserts any number of attempts with one multi-row
+INSERT ... ON DUPLICATE KEY UPDATE, after locking the rows it replaces so the
+progress rollups move by exactly the solved / unsolved flips. Attempts by the
+same student on the same exercise within a batch are applied in arrival order.
+
+save() writes a single attempt either inline, in its own transaction, or,
+with settings.SUBMISSION_WRITE_BUFFER on, through a BatchWriter that coalesces
+the attempts of all concurrent requests into one transaction every
+SUBMISSION_WRITE_FLUSH_MS. Either way it returns only after the commit, so a
+response never acknowledges an attempt that is not durable.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import progress
+from core.batch_writer import BatchWriter
+
+
+def write_batch(cursor, attempts):
+    """
+    Upsert (student_id, exercise_id, answer, is_correct, score, feedback)
+    attempts. Returns, per attempt, whether the exercise was solved just before it.
+    """
+    keys = sorted({(a[0], a[1]) for a in attempts})
+    # Lock in key order so concurrent batches queue up instead of deadlocking
+    cursor.execute(f"""
+        SELECT student_id, exercise_id, is_correct FROM Student_Exercise
+        WHERE (student_id, exercise_id) IN ({", ".join(["(%s, %s)"] * len(keys))})
+        ORDER BY student_id, exercise_id
+        FOR UPDATE
+    """, [value for key in keys for value in key])
+    initial = {(row[0], row[1]): bool(row[2]) for row in cursor.fetchall()}
+
+    current = dict(initial)
+    was_correct = []
+    for student_id, exercise_id, _, is_correct, _, _ in attempts:
+        was_correct.append(current.get((student_id, exercise_id), False))
+        current[(student_id, exercise_id)] = bool(is_correct)
+
+    # Rows of one key stay in arrival order, so the last attempt's values win
+    ordered = sorted(attempts, key=lambda a: (a[0], a[1]))
+    cursor.execute(f"""
+        INSERT INTO Student_Exercise (student_id, exercise_id, submitted_answer, is_correct, score, completed_at, ai_feedback,
+                                      submission_count, best_score)
+        VALUES {", ".join(["(%s, %s, %s, %s, %s, NOW(), %s, 1, %s)"] * len(ordered))}
+        ON DUPLICATE KEY UPDATE
+            submitted_answer = VALUES(submitted_answer),
+            is_correct = VALUES(is_correct),
+            score = VALUES(score),
+            completed_at = NOW(),
+            ai_feedback = VALUES(ai_feedback),
+            submission_count = submission_count + 1,
+            best_score = GREATEST(COALESCE(best_score, 0), VALUES(score))
+    """, [value for a in ordered for value in (*a, a[4])])
+
+    # Rollups only care about the net change of each key over the batch
+    for key in keys:
+        progress.record_exercise_result(cursor, key[0], key[1], initial.get(key, False), current[key])
+    return was_correct
+
+
+_writer = BatchWriter(
+    'student-exercise', write_batch,
+    max_batch=settings.SUBMISSION_WRITE_BATCH_SIZE,
+    max_delay=settings.SUBMISSION_WRITE_FLUSH_MS / 1000,
+)
+
+
+def save(student_id, exercise_id, answer, is_correct, score, feedback, buffered=None):
+    """
+    Persist one graded attempt and return whether the exercise was solved
+    before it. Blocks until the attempt is committed. `buffered` overrides
+    settings.SUBMISSION_WRITE_BUFFER (used by the write benchmark).
+    """
+    attempt = (student_id, exercise_id, answer, bool(is_correct), score, feedback)
+    if buffered is None:
+        buffered = settings.SUBMISSION_WRITE_BUFFER
+    if buffered:
+        return _writer.submit(attempt).result(timeout=settings.SUBMISSION_WRITE_TIMEOUT)
+    with transaction.atomic(), connection.cursor() as cursor:
+        return write_batch(cursor, [attempt])[0]
@@ -0,0 +1,474 @@
+"""
+Durable background tasks, queued in the Task table.
+
+Slow work a request should not wait for (AI grading, announcement fan-out,
+progress rebuilds, regrades) is recorded with enqueue() on the caller's cursor,
+so the task commits, or rolls back, together with the change that needs it.
+There is no broker: workers claim due tasks with SELECT ... FOR UPDATE SKIP
+LOCKED, highest priority first, so any number of them share the table without
+waiting on each other or taking the same row.
+
+A claimed task is leased for its timeout (the visibility timeout). If its
+worker dies or hangs, reap() puts it back in the queue once the lease runs out,
+or fails it when it has no attempts left. A handler that raises is retried with
+exponential backoff up to max_attempts. Either way a task can run more than
+once, so handlers must be idempotent; one whose writes are not can make them
+in the same transaction as checkpoint(), which lets only one attempt commit.
+
+Handlers are registered with @task(name) in the modules listed in
+settings.TASK_MODULES and called with the task's payload as keyword arguments.
+They run on worker threads: `manage.py run_tasks` in a dedicated process, and
+TASK_INLINE_WORKERS threads in each web process. Web processes opt in
+explicitly: smartsql/asgi.py and wsgi.py call start_inline_workers() once the
+application is loaded, so tasks left over from before a restart are picked up
+at once. Anything else that loads Django (management commands, scripts, tests,
+multiprocessing children) never claims tasks.
+
+A task may run in another process than the one that queued it, so the cache
+invalidations and pub/sub events of its handler only reach the web processes
+through a shared cache (CACHE_BACKEND) and RedisBroadcast. run_tasks and the
+inline workers refuse to start without them (TASK_INLINE_ALLOW_UNSHARED allows
+it for a lone development server).
+"""
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from importlib import import_module
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from core import cache_utils
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Priorities: higher runs first
+HIGH = 10
+NORMAL = 0
+LOW = -10
+
+MAX_BACKOFF_SECONDS = 3600
+MAINTENANCE_SECONDS = 30
+
+_registry = {}
+# The task the current worker thread is running (see current())
+_running = threading.local()
+_wakeup = threading.Condition()
+_local_lock = threading.Lock()
+_local_worker = None
+_local_pid = None
+
+
+class Registration:
+
+    def __init__(self, name, func, priority, max_attempts, timeout, inline):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.inline = inline
+
+
+def task(name, priority=NORMAL, max_attempts=None, timeout=None, inline=True):
+    """
+    Register the decorated function as the handler of tasks called `name`.
+    inline=False keeps the task out of web processes' inline workers: only
+    run_tasks runs it (for heavy tasks, e.g. ones that start process pools).
+    """
+    def decorator(func):
+        _registry[name] = Registration(name, func, priority, max_attempts, timeout, inline)
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import the modules that register handlers (settings.TASK_MODULES)."""
+    for module in settings.TASK_MODULES:
+        import_module(module)
+
+
+def _registration(name):
+    if name not in _registry:
+        autodiscover()
+    if name not in _registry:
+        raise LookupError(f"No handler registered for task '{name}'")
+    return _registry[name]
+
+
+def enqueue(cursor, name, payload=None, priority=None, delay=0, created_by=None):
+    """
+    Queue a task on the caller's cursor; workers see it once the transaction
+    commits. Returns its task_id.
+    """
+    registration = _registration(name)
+    cursor.execute("""
+        INSERT INTO Task (name, payload, priority, max_attempts, timeout_seconds, run_after, created_by)
+        VALUES (%s, %s, %s, %s, %s, NOW(3) + INTERVAL %s SECOND, %s)
+    """, [name, json.dumps(payload or {}),
+          registration.priority if priority is None else priority,
+          registration.max_attempts or settings.TASK_MAX_ATTEMPTS,
+          registration.timeout or settings.TASK_VISIBILITY_TIMEOUT,
+          delay, created_by])
+    task_id = cursor.lastrowid
+    transaction.on_commit(_wake)
+    return task_id
+
+
+def status_url(task_id):
+    return f"/api/tasks/{task_id}/"
+
+
+def _loads(value):
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def get(cursor, task_id):
+    """A task as a dict (payload and result decoded), or None."""
+    cursor.execute("SELECT * FROM Task WHERE task_id = %s", [task_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    found = dict(zip([col[0] for col in cursor.description], row))
+    found['payload'] = _loads(found['payload'])
+    found['result'] = _loads(found['result'])
+    return found
+
+
+def claim(worker_id, limit=1, names=None, min_priority=None, visibility_timeout=None):
+    """
+    Lease up to `limit` due tasks to this worker, highest priority first. Rows
+    other workers are claiming right now are skipped, not waited for.
+    `visibility_timeout` overrides the tasks' own lease length.
+    """
+    where, params = ["status = %s", "run_after <= NOW(3)"], [QUEUED]
+    if names:
+        where.append("name IN %s")
+        params.append(tuple(names))
+    if min_priority is not None:
+        where.append("priority >= %s")
+        params.append(min_priority)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT task_id FROM Task
+            WHERE {' AND '.join(where)}
+            ORDER BY priority DESC, run_after, task_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, params + [limit])
+        task_ids = tuple(row[0] for row in cursor.fetchall())
+        if not task_ids:
+            return []
+        # A fresh token per claim: a worker whose lease expired cannot finish a task someone else re-claimed
+        lease = f"{worker_id}/{uuid.uuid4().hex[:8]}"
+        cursor.execute("""
+            UPDATE Task
+            SET status = %s, attempts = attempts + 1, locked_by = %s, started_at = NOW(3),
+                locked_until = NOW(3) + INTERVAL COALESCE(%s, timeout_seconds) SECOND
+            WHERE task_id IN %s
+        """, [RUNNING, lease, visibility_timeout, task_ids])
+        cursor.execute("""
+            SELECT task_id, name, payload, attempts, max_attempts FROM Task
+            WHERE task_id IN %s
+            ORDER BY priority DESC, task_id
+        """, [task_ids])
+        return [{'task_id': task_id, 'name': name, 'payload': _loads(payload) or {},
+                 'attempts': attempts, 'max_attempts': max_attempts, 'lease': lease}
+                for task_id, name, payload, attempts, max_attempts in cursor.fetchall()]
+
+
+def current():
+    """The claimed task (task_id, attempts, max_attempts, ...) this thread is running, or None."""
+    return getattr(_running, 'task', None)
+
+
+def is_last_attempt():
+    """Whether the running task will not be retried if it fails now."""
+    claimed = current()
+    return claimed is None or claimed['attempts'] >= claimed['max_attempts']
+
+
+def checkpoint(cursor, result):
+    """
+    Store the running task's result on the caller's cursor, to commit together
+    with the handler's own writes. Returns None the first time, or the result
+    an earlier attempt already committed: the handler should then return that
+    and write nothing.
+    """
+    task_id = current()['task_id']
+    cursor.execute("SELECT result FROM Task WHERE task_id = %s FOR UPDATE", [task_id])
+    row = cursor.fetchone()
+    earlier = _loads(row[0]) if row else None
+    if earlier is not None:
+        return earlier
+    cursor.execute("UPDATE Task SET result = %s WHERE task_id = %s", [json.dumps(result, default=str), task_id])
+    return None
+
+
+def execute(claimed):
+    """Run a claimed task's handler and record the outcome. Returns True if it succeeded."""
+    started = time.perf_counter()
+    _running.task = claimed
+    try:
+        result = _registration(claimed['name']).func(**claimed['payload'])
+    except Exception as e:
+        if connection.needs_rollback or not connection.is_usable():
+            connection.close()
+        _fail(claimed, e)
+        return False
+    finally:
+        _running.task = None
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE Task
+            SET status = %s, result = %s, error = NULL, finished_at = NOW(3), locked_by = NULL, locked_until = NULL
+            WHERE task_id = %s AND status = %s AND locked_by = %s
+        """, [DONE, json.dumps(result, default=str), claimed['task_id'], RUNNING, claimed['lease']])
+        if cursor.rowcount == 0:
+            print(f"⚠️ Task {claimed['task_id']} ({claimed['name']}) finished after its lease expired")
+    print(f"✅ Task {claimed['task_id']} ({claimed['name']}) done in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return True
+
+
+def _fail(claimed, error):
+    """Schedule a retry with exponential backoff, or fail the task for good when out of attempts."""
+    final = claimed['attempts'] >= claimed['max_attempts']
+    backoff = min(settings.TASK_RETRY_BACKOFF * 2 ** (claimed['attempts'] - 1), MAX_BACKOFF_SECONDS)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE Task
+            SET status = %s, error = %s, locked_by = NULL, locked_until = NULL,
+                run_after = IF(%s, run_after, NOW(3) + INTERVAL %s SECOND),
+                finished_at = IF(%s, NOW(3), NULL)
+            WHERE task_id = %s AND status = %s AND locked_by = %s
+        """, [FAILED if final else QUEUED, f"{type(error).__name__}: {error}"[:2000],
+              final, backoff, final, claimed['task_id'], RUNNING, claimed['lease']])
+    if final:
+        print(f"❌ Task {claimed['task_id']} ({claimed['name']}) failed after {claimed['attempts']} attempts: {error}")
+    else:
+        print(f"🔁 Task {claimed['task_id']} ({claimed['name']}) attempt {claimed['attempts']} failed, "
+              f"retrying in {backoff}s: {error}")
+
+
+def reap(cursor):
+    """
+    Take back tasks whose lease ran out: requeue them, or fail those with no
+    attempts left. Returns the number of tasks reaped.
+    """
+    cursor.execute("""
+        UPDATE Task
+        SET status = IF(attempts >= max_attempts, %s, %s),
+            finished_at = IF(attempts >= max_attempts, NOW(3), NULL),
+            error = 'Visibility timeout expired before the task finished',
+            locked_by = NULL, locked_until = NULL
+        WHERE status = %s AND locked_until < NOW(3)
+    """, [FAILED, QUEUED, RUNNING])
+    return cursor.rowcount
+
+
+def prune(cursor, days=None):
+    """Delete finished tasks older than TASK_RETENTION_DAYS. Returns the number deleted."""
+    cursor.execute("""
+        DELETE FROM Task WHERE status IN (%s, %s) AND finished_at < NOW(3) - INTERVAL %s DAY
+    """, [DONE, FAILED, settings.TASK_RETENTION_DAYS if days is None else days])
+    return cursor.rowcount
+
+
+def metrics(cursor, window=300):
+    """
+    Queue depth (ready, delayed for a retry, running), the age of the oldest
+    ready task, and throughput over the last `window` seconds, in total and per task name.
+    """
+    by_name = {}
+
+    def entry(name):
+        return by_name.setdefault(name, {'ready': 0, 'delayed': 0, 'running': 0, 'done': 0, 'failed': 0,
+                                         'avg_ms': None})
+
+    cursor.execute("""
+        SELECT name, status, SUM(run_after <= NOW(3)), COUNT(*)
+        FROM Task WHERE status IN (%s, %s)
+        GROUP BY name, status
+    """, [QUEUED, RUNNING])
+    for name, status, due, count in cursor.fetchall():
+        if status == QUEUED:
+            entry(name)['ready'] = int(due)
+            entry(name)['delayed'] = count - int(due)
+        else:
+            entry(name)['running'] = count
+
+    cursor.execute("""
+        SELECT TIMESTAMPDIFF(SECOND, MIN(run_after), NOW(3)) FROM Task
+        WHERE status = %s AND run_after <= NOW(3)
+    """, [QUEUED])
+    oldest = cursor.fetchone()[0]
+
+    cursor.execute("""
+        SELECT name, status, COUNT(*), AVG(TIMESTAMPDIFF(MICROSECOND, started_at, finished_at)) / 1000
+        FROM Task WHERE finished_at >= NOW(3) - INTERVAL %s SECOND
+        GROUP BY name, status
+    """, [window])
+    for name, status, count, avg_ms in cursor.fetchall():
+        entry(name)[status] = count
+        if status == DONE and avg_ms is not None:
+            entry(name)['avg_ms'] = round(float(avg_ms))
+
+    totals = {key: sum(counts[key] for counts in by_name.values())
+              for key in ('ready', 'delayed', 'running', 'done', 'failed')}
+    return {
+        **totals,
+        'oldest_ready_seconds': oldest,
+        'window_seconds': window,
+        'per_minute': round(totals['done'] * 60 / window, 2),
+        'tasks': by_name,
+    }
+
+
+class Worker:
+
+    def __init__(self, concurrency, names=None, min_priority=None, visibility_timeout=None,
+                 poll_interval=None, exit_when_idle=False, name=None):
+        """
+        Runs `concurrency` threads, each claiming and running one task at a
+        time on its own database connection. With exit_when_idle each thread
+        stops once no task is due (run_tasks --once).
+        """
+        self.concurrency = concurrency
+        self.names = names
+        self.min_priority = min_priority
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = settings.TASK_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.exit_when_idle = exit_when_idle
+        self.id = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.succeeded = 0
+        self.failed = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._last_maintenance = 0.0
+        self._last_prune = 0.0
+
+    def start(self):
+        autodiscover()
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(index,), name=f'task-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stop claiming; tasks already running are finished."""
+        self.stopping.set()
+        _wake()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def _loop(self, index):
+        worker_id = f"{self.id}:{index}"
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    self._maintain()
+                    claimed = claim(worker_id, names=self.names, min_priority=self.min_priority,
+                                    visibility_timeout=self.visibility_timeout)
+                except Exception as e:
+                    print(f"❌ Task worker {worker_id}: could not claim: {e}")
+                    connection.close()
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                if not claimed:
+                    if self.exit_when_idle:
+                        break
+                    with _wakeup:
+                        _wakeup.wait(self.poll_interval)
+                    continue
+                for claimed_task in claimed:
+                    succeeded = execute(claimed_task)
+                    with self._lock:
+                        if succeeded:
+                            self.succeeded += 1
+                        else:
+                            self.failed += 1
+        finally:
+            connection.close()
+
+    def _maintain(self):
+        """Every MAINTENANCE_SECONDS one of the threads reaps expired leases (and prunes hourly)."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_maintenance < MAINTENANCE_SECONDS:
+                return
+            self._last_maintenance = now
+            prune_now = now - self._last_prune >= 3600
+            if prune_now:
+                self._last_prune = now
+        with connection.cursor() as cursor:
+            reaped = reap(cursor)
+            pruned = prune(cursor) if prune_now else 0
+        if reaped or pruned:
+            print(f"🧹 Task worker {self.id}: {reaped} expired leases reaped, {pruned} old tasks pruned")
+
+
+def _wake():
+    """Nudge idle worker threads of this process."""
+    with _wakeup:
+        _wakeup.notify_all()
+
+
+def run_worker(worker):
+    """Make `worker` this process's worker, so enqueues here do not start inline threads too."""
+    global _local_worker, _local_pid
+    with _local_lock:
+        _local_worker, _local_pid = worker, os.getpid()
+    return worker.start()
+
+
+def shared_backend_problem():
+    """Why tasks run here would not reach the web processes' caches / event streams, or None."""
+    if not cache_utils.is_shared():
+        return "CACHE_BACKEND is the per-process LocMemCache; point it at a shared cache."
+    if settings.PUBSUB_BACKEND.endswith('LocalBroadcast'):
+        return "PUBSUB_BACKEND is LocalBroadcast; use core.pubsub.RedisBroadcast."
+    return None
+
+
+def start_inline_workers():
+    """Start this web process's TASK_INLINE_WORKERS threads (called by the ASGI / WSGI entrypoints)."""
+    global _local_worker, _local_pid
+    if not settings.TASK_INLINE_WORKERS:
+        return
+    problem = shared_backend_problem()
+    if problem and not settings.TASK_INLINE_ALLOW_UNSHARED:
+        # Same rule as run_tasks: a task queued by another instance would leave this one's caches stale
+        print(f"⚠️ Inline task workers not started: {problem}")
+        return
+    if _local_pid == os.getpid() and _local_worker.is_alive():
+        return
+    with _local_lock:
+        if _local_pid == os.getpid() and _local_worker.is_alive():
+            return
+        autodiscover()
+        names = [name for name, registration in _registry.items() if registration.inline]
+        _local_worker = Worker(settings.TASK_INLINE_WORKERS, names=names,
+                               name=f"{socket.gethostname()}:{os.getpid()}:web").start()
+        _local_pid = os.getpid()
+
+
+@atexit.register
+def _stop_local_worker():
+    if _local_worker is not None and _local_pid == os.getpid():
+        _local_worker.stop()
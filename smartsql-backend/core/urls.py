@@ -1,6 +1,6 @@
 # core/urls.py
 from django.urls import path
-from . import views
+from . import events, views
 
 urlpatterns = [
     path('api/login/', views.login_api),
@@ -8,4 +8,9 @@ urlpatterns = [
     path('api/users/profile/', views.profile_api),
     path('api/users/profile/update/', views.update_profile_api),
     path('api/messages/', views.messages_api),
+    path('api/messages/unread-count/', views.unread_count_api),
+    path('api/messages/mark-read/', views.mark_read_api),
+    path('api/events/stream/', events.events_stream_api),
+    path('api/tasks/metrics/', views.task_metrics_api),
+    path('api/tasks/<int:task_id>/', views.task_status_api),
 ]
\ No newline at end of file
@@ -3,6 +3,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from core.models import Users, Student, Instructor
 from core.authentication import CustomJWTAuthentication
+from core import dashboard, inbox, tasks
 from rest_framework.response import Response
 from rest_framework import status
 from config import messages as msg
@@ -234,6 +235,7 @@ def update_profile_api(request):
 
         user.profile_info = profile_info
         user.save()
+        dashboard.invalidate(user.user_id)
 
         return Response({
             'status': 'success',
@@ -296,6 +298,8 @@ def messages_api(request):
                     INSERT INTO PrivateMessage (message_id, receiver_id)
                     VALUES (%s, %s)
                 """, [message_id, receiver_id])
+                inbox.deliver_private(cursor, message_id, user.user_id, receiver_id)
+                inbox.notify(message_id, 'private', user.user_id, content, receiver_id=receiver_id)
 
             
         return Response({
@@ -316,3 +320,136 @@ def messages_api(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def unread_count_api(request):
+    try:
+        # 只读计数器表（主键查找），不访问消息表
+        with connection.cursor() as cursor:
+            counts = inbox.unread_counts(cursor, request.user.user_id)
+
+        return Response({
+            'status': 'success',
+            'data': counts
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_read_api(request):
+    try:
+        user_id = request.user.user_id
+
+        # message_ids: 指定消息；conversation: 整个会话；都不传则全部标为已读
+        message_ids = request.data.get('message_ids')
+        conversation = request.data.get('conversation')
+        if message_ids is not None:
+            if not isinstance(message_ids, list):
+                return Response({
+                    'status': 'error',
+                    'message': 'message_ids 必须是列表'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                message_ids = [int(m) for m in message_ids]
+            except (TypeError, ValueError):
+                return Response({
+                    'status': 'error',
+                    'message': 'message_ids 包含无效的ID'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                marked = inbox.mark_read(cursor, user_id, message_ids=message_ids, conversation=conversation)
+                counts = inbox.unread_counts(cursor, user_id)
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'marked': marked,
+                **counts
+            }
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def task_status_api(request, task_id):
+    """GET: 后台任务状态（仅限任务的创建者），完成后 data.result 为任务结果"""
+    try:
+        with connection.cursor() as cursor:
+            task = tasks.get(cursor, task_id)
+        if task is None or task['created_by'] != request.user.user_id:
+            return Response({
+                'status': 'error',
+                'message': 'Task not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'task_id': task['task_id'],
+                'name': task['name'],
+                'state': task['status'],
+                'attempts': task['attempts'],
+                'max_attempts': task['max_attempts'],
+                'result': task['result'],
+                'error': task['error'],
+                'created_at': task['created_at'],
+                'started_at': task['started_at'],
+                'finished_at': task['finished_at'],
+                # 失败后等待重试时的下次运行时间
+                'retry_at': task['run_after'] if task['status'] == tasks.QUEUED and task['attempts'] else None,
+            }
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def task_metrics_api(request):
+    """GET: 任务队列深度与吞吐量（?window= 秒，默认 300），仅限教师"""
+    try:
+        if request.user.user_type != 'Instructor':
+            return Response({
+                'status': 'error',
+                'message': 'Only instructors can view task metrics.'
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            window = min(max(int(request.query_params.get('window', 300)), 60), 86400)
+        except ValueError:
+            window = 300
+
+        with connection.cursor() as cursor:
+            metrics = tasks.metrics(cursor, window=window)
+
+        return Response({
+            'status': 'success',
+            'data': metrics
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'status': 'error',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,33 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+
+from core import events, pubsub, submission_feed
+from instructor.views import check_instructor_ownership
+
+
+async def course_submissions_stream(request, course_id):
+    """GET: SSE feed of graded submissions in one of the instructor's courses (?module_id= to narrow it)."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    user = await events.authenticate(request)
+    if user is None or user.user_type != 'Instructor':
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+
+    # Ownership is checked once per connection; events themselves need no queries
+    is_owner, _ = await sync_to_async(check_instructor_ownership)(user.user_id, course_id=course_id)
+    if not is_owner:
+        return JsonResponse({'error': '无权访问此课程'}, status=403)
+
+    module_id = request.GET.get('module_id')
+    try:
+        module_id = int(module_id) if module_id else None
+    except ValueError:
+        return JsonResponse({'error': '无效的 module_id'}, status=400)
+
+    def accept(channel, event):
+        return module_id is None or event.get('module_id') == module_id
+
+    # Subscribe before reading the buffer so nothing published in between is missed
+    subscription = pubsub.subscribe([submission_feed.channel(course_id)], maxsize=500)
+    initial = [('submission', e) for e in submission_feed.recent(course_id, module_id)]
+    return events.sse_response(events.stream(subscription, initial=initial, accept=accept))
@@ -1,6 +1,6 @@
 # core/urls.py
 from django.urls import path
-from . import views
+from . import live, views
 
 urlpatterns = [
     # --- Course Management ---
@@ -9,6 +9,7 @@ urlpatterns = [
     path('api/instructor/courses/update/', views.instructor_course_update, name='instructor_course_update'), # Uses ?course_id=
     path('api/instructor/courses/delete/', views.instructor_course_delete, name='instructor_course_delete'), # Uses ?course_id=
     path('api/instructor/courses/<int:course_id>/', views.instructor_course_detail, name='instructor_course_detail'),
+    path('api/instructor/courses/<int:course_id>/submissions/stream/', live.course_submissions_stream, name='instructor_course_submissions_stream'), # SSE, ?module_id= optional
 
     # --- Module Management ---
     path('api/instructor/modules/', views.instructor_modules, name='instructor_modules_list'), # GET (all or filtered), POST
@@ -17,10 +18,13 @@ urlpatterns = [
     # --- Exercise Management ---
     path('api/instructor/exercises/', views.instructor_exercises, name='instructor_exercises_list'), # GET (all or filtered), POST
     path('api/instructor/exercises/<int:exercise_id>/', views.instructor_exercise_detail, name='instructor_exercise_detail'), # GET (detail), PUT, DELETE
+    path('api/instructor/exercises/<int:exercise_id>/regrade/', views.instructor_exercise_regrade, name='instructor_exercise_regrade'), # GET job progress, POST start a regrade
 
     # --- View specific lists ---
     path('api/instructor/courses/<int:course_id>/modules/', views.instructor_modules_by_course, name='instructor_modules_by_course'), # GET modules for a specific course
     path('api/instructor/modules/<int:module_id>/exercises/', views.instructor_exercises_by_module, name='instructor_exercises_by_module'), # GET exercises for a specific module
+    path('api/instructor/courses/<int:course_id>/roster/', views.instructor_course_roster, name='instructor_course_roster'), # POST bulk-enroll a CSV / JSON roster
+    path('api/instructor/courses/<int:course_id>/submissions/', views.instructor_course_submissions, name='instructor_course_submissions'), # GET submission history (filter by student / exercise / date range)
 
     # --- Student Management (New Endpoints) ---
     path('api/instructor/students/', views.instructor_students, name='instructor_students_list'), # GET students enrolled in instructor's courses
@@ -1,10 +1,11 @@
 from django.db import connection, transaction
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from core.authentication import CustomJWTAuthentication
-import json
+from core import catalog, course_search, course_stats, dashboard, datasets, enrollment, inbox, pagination, progress, roster, streaming, submission_log, tasks
+from student import regrade
 from functools import wraps
 import decimal
 
@@ -44,6 +45,15 @@ def map_term_to_str(term_num):
     """Convert term number to string."""
     return TERM_MAP.get(term_num, 'Unknown')
 
+def parse_seat_limit(raw):
+    """Seat limit from request data: None (unlimited) or a non-negative int. Raises ValueError."""
+    if raw in (None, ''):
+        return None
+    seat_limit = int(raw)
+    if seat_limit < 0:
+        raise ValueError(raw)
+    return seat_limit
+
 def check_instructor_ownership(instructor_id, course_id=None, module_id=None, exercise_id=None):
     """Checks resource ownership and returns (bool, Response or None)."""
     with connection.cursor() as cursor:
@@ -83,41 +93,30 @@ def instructor_courses(request):
     search_term = request.query_params.get('search', '')
     term_filter = request.query_params.get('term', '')
     state_filter = request.query_params.get('state', '')
+    # Pagination is opt-in: course pickers across the UI expect the full list
+    paginate = 'limit' in request.query_params or 'cursor' in request.query_params
 
-    with connection.cursor() as cursor:
-        query = """
-            SELECT c.course_id, c.course_name, c.course_code, c.instructor_id,
-                   c.course_description, c.year, c.term, c.state,
-                   COUNT(e.student_id) as enrolled_students
-            FROM Course c
-            LEFT JOIN Enrollment e ON c.course_id = e.course_id AND e.status = 'enrolled'
-            WHERE c.instructor_id = %s """
-        params = [instructor_id]
-
-        if search_term:
-            query += " AND (c.course_name LIKE %s OR c.course_code LIKE %s OR c.course_description LIKE %s) "
-            like = f"%{search_term}%"
-            params.extend([like, like, like])
-        if term_filter:
-            term_num = get_term_number(term_filter)
-            if term_num:
-                query += " AND c.term = %s "
-                params.append(term_num)
-        if state_filter:
-            query += " AND c.state = %s "
-            params.append(state_filter)
-
-        query += """
-            GROUP BY c.course_id, c.course_name, c.course_code, c.instructor_id,
-                     c.course_description, c.year, c.term, c.state
-            ORDER BY c.year DESC, c.term DESC, c.course_name """
-        cursor.execute(query, params)
-        courses = dictfetchall(cursor)
+    try:
+        with connection.cursor() as cursor:
+            courses, next_cursor = course_search.search(
+                cursor,
+                text=search_term,
+                year=course_search.parse_year(request.query_params.get('year')),
+                term=get_term_number(term_filter) if term_filter else None,
+                state=state_filter or None,
+                instructor_id=instructor_id,
+                extra_select=", COALESCE(cs.enrolled_count, 0) as enrolled_students",
+                extra_join="LEFT JOIN Course_Stats cs ON cs.course_id = c.course_id",
+                limit=course_search.page_size(request.query_params.get('limit')) if paginate else None,
+                after=request.query_params.get('cursor'),
+            )
+    except pagination.InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     for c in courses:
         c['term'] = map_term_to_str(c['term'])
 
-    return Response({'courses': courses})
+    return Response({'courses': courses, 'next_cursor': next_cursor})
 
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
@@ -135,6 +134,8 @@ def instructor_course_insert(request):
     term_str = data.get('term')
     state = data.get('state', 'active')
     course_description = data.get('course_description', '')
+    try: seat_limit = parse_seat_limit(data.get('seat_limit'))
+    except (TypeError, ValueError): return Response({'error': f'无效的名额上限: {data.get("seat_limit")}'}, status=status.HTTP_400_BAD_REQUEST)
 
     if not all([course_name, course_code, year, term_str]):
         return Response({'error': '缺少必要的课程信息 (名称, 代码, 年份, 学期)'}, status=status.HTTP_400_BAD_REQUEST)
@@ -143,11 +144,13 @@ def instructor_course_insert(request):
     if term is None:
          return Response({'error': f'无效的学期: {term_str}'}, status=status.HTTP_400_BAD_REQUEST)
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            INSERT INTO Course (course_name, course_code, instructor_id, course_description, year, term, state)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, [course_name, course_code, instructor_id, course_description, year, term, state])
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO Course (course_name, course_code, instructor_id, course_description, year, term, state, seat_limit)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, [course_name, course_code, instructor_id, course_description, year, term, state, seat_limit])
+            course_stats.refresh(cursor, [cursor.lastrowid])
 
     return Response({'message': '课程添加成功'}, status=status.HTTP_201_CREATED)
 
@@ -173,9 +176,12 @@ def instructor_course_update(request):
     update_fields = {}
     if 'course_name' in data: update_fields['course_name'] = data['course_name']
     if 'course_code' in data: update_fields['course_code'] = data['course_code']
-    if 'year' in data: update_fields['year'] = data['year']
+    if 'year' in data: update_fields['year'] = data['year'] or 0  # Course.year is NOT NULL, 0 = not scheduled
     if 'state' in data: update_fields['state'] = data['state']
     if 'course_description' in data: update_fields['course_description'] = data['course_description']
+    if 'seat_limit' in data:
+        try: update_fields['seat_limit'] = parse_seat_limit(data['seat_limit'])
+        except (TypeError, ValueError): return Response({'error': f'无效的名额上限: {data["seat_limit"]}'}, status=status.HTTP_400_BAD_REQUEST)
     if 'term' in data:
         term = get_term_number(data['term'])
         if term is None: return Response({'error': f'无效的学期: {data["term"]}'}, status=status.HTTP_400_BAD_REQUEST)
@@ -186,8 +192,12 @@ def instructor_course_update(request):
     set_clause = ", ".join([f"{key} = %s" for key in update_fields])
     values = list(update_fields.values()) + [course_id]
 
-    with connection.cursor() as cursor:
+    with transaction.atomic(), connection.cursor() as cursor:
         cursor.execute(f"UPDATE Course SET {set_clause} WHERE course_id = %s", values)
+        if 'seat_limit' in update_fields:
+            # A raised (or removed) limit admits waitlisted students straight away
+            enrollment.promote(cursor, course_id)
+    catalog.invalidate()
 
     return Response({'message': '课程更新成功'})
 
@@ -220,6 +230,8 @@ def instructor_course_delete(request):
         cursor.execute("DELETE FROM Course WHERE course_id = %s", [course_id])
         if cursor.rowcount == 0:
             return Response({'error': '课程未找到或已被删除'}, status=status.HTTP_404_NOT_FOUND)
+        progress.drop_course_rollups(cursor, course_id)
+        catalog.invalidate()
 
     return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -238,8 +250,11 @@ def instructor_course_detail(request, course_id):
 
     with connection.cursor() as cursor:
         cursor.execute("""
-            SELECT course_id, course_name, course_code, course_description, year, term, state
-            FROM Course WHERE course_id = %s AND instructor_id = %s
+            SELECT c.course_id, c.course_name, c.course_code, c.course_description, c.year, c.term, c.state,
+                   c.seat_limit, COALESCE(cs.enrolled_count, 0) AS enrolled_count,
+                   (SELECT COUNT(*) FROM Enrollment w WHERE w.course_id = c.course_id AND w.status = 'waitlisted') AS waitlist_count
+            FROM Course c LEFT JOIN Course_Stats cs ON cs.course_id = c.course_id
+            WHERE c.course_id = %s AND c.instructor_id = %s
         """, [course_id, instructor_id])
         course_data = dictfetchone(cursor)
 
@@ -248,6 +263,46 @@ def instructor_course_detail(request, course_id):
 
     return Response(course_data)
 
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+@safe_api_view
+def instructor_course_roster(request, course_id):
+    """
+    POST: Enroll a roster. Either upload a CSV / JSON file as 'file', or send
+    {'students': [...]} (objects or emails / usernames). Options: create_missing
+    (default true) and dry_run (report outcomes, change nothing).
+    """
+    instructor_id = request.user.user_id
+
+    is_owner, error_response = check_instructor_ownership(instructor_id, course_id=course_id)
+    if not is_owner: return error_response
+
+    data = request.data
+    try:
+        if 'file' in request.FILES:
+            upload = request.FILES['file']
+            fmt = 'json' if upload.name.lower().endswith('.json') else 'csv' if upload.name.lower().endswith('.csv') else None
+            rows = roster.parse(upload.read(), fmt)
+        elif isinstance(data.get('students'), list):
+            rows = roster.normalize(data['students'])
+        else:
+            return Response({'error': '请上传名单文件 (file) 或提供 students 列表'}, status=status.HTTP_400_BAD_REQUEST)
+    except roster.RosterError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def flag(name, default):
+        value = data.get(name, default)
+        return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+
+    dry_run = flag('dry_run', False)
+    with transaction.atomic(), connection.cursor() as cursor:
+        summary, results = roster.import_roster(cursor, course_id, rows, create_missing=flag('create_missing', True))
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return Response({'summary': summary, 'results': results, 'dry_run': dry_run})
+
 # === Module Views ===
 
 @api_view(['GET'])
@@ -271,6 +326,45 @@ def instructor_modules_by_course(request, course_id):
         modules = dictfetchall(cursor)
     return Response({'modules': modules})
 
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+@renderer_classes(streaming.STREAM_RENDERERS)
+@safe_api_view
+def instructor_course_submissions(request, course_id):
+    """
+    GET: Submission history for a course, newest first. Filters: student_id, exercise_id, from, to;
+    paged by cursor. ?format=ndjson|csv streams the whole filtered history as an export instead.
+    """
+    instructor_id = request.user.user_id
+
+    is_owner, error_response = check_instructor_ownership(instructor_id, course_id=course_id)
+    if not is_owner: return error_response
+
+    params = request.query_params
+    try:
+        since = submission_log.parse_bound(params.get('from'))
+        until = submission_log.parse_bound(params.get('to'))
+        student_id = int(params['student_id']) if params.get('student_id') else None
+        exercise_id = int(params['exercise_id']) if params.get('exercise_id') else None
+        fmt = streaming.wants_stream(request)
+        if fmt:
+            sql, sql_params = submission_log.history_query(
+                student_id=student_id, exercise_id=exercise_id, course_id=course_id,
+                since=since, until=until, limit=submission_log.MAX_EXPORT_ROWS, after=params.get('cursor'))
+            return streaming.stream_query(request, sql, sql_params, fmt, filename=f'course-{course_id}-submissions')
+        with connection.cursor() as cursor:
+            submissions, next_cursor = submission_log.history(
+                cursor, student_id=student_id, exercise_id=exercise_id, course_id=course_id,
+                since=since, until=until,
+                limit=submission_log.page_size(params.get('limit')),
+                after=params.get('cursor'),
+            )
+    except ValueError as e:  # includes pagination.InvalidCursor
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'submissions': submissions, 'next_cursor': next_cursor})
+
 @api_view(['GET', 'POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
@@ -286,7 +380,7 @@ def instructor_modules(request):
 
         with connection.cursor() as cursor:
             query = """
-                SELECT m.module_id, m.module_name, m.module_description, m.course_id,
+                SELECT m.module_id, m.module_name, m.module_description, m.course_id, m.due_date,
                        c.course_name, COUNT(me.exercise_id) as exercise_count
                 FROM Module m JOIN Course c ON m.course_id = c.course_id
                 LEFT JOIN Module_Exercise me ON m.module_id = me.module_id
@@ -299,7 +393,7 @@ def instructor_modules(request):
                 query += " AND (m.module_name LIKE %s OR m.module_description LIKE %s OR c.course_name LIKE %s) "
                 like = f"%{search_term}%"
                 params.extend([like, like, like])
-            query += " GROUP BY m.module_id, m.module_name, m.module_description, m.course_id, c.course_name ORDER BY c.course_name, m.module_name"
+            query += " GROUP BY m.module_id, m.module_name, m.module_description, m.course_id, m.due_date, c.course_name ORDER BY c.course_name, m.module_name"
             cursor.execute(query, params)
             modules_result = dictfetchall(cursor)
         return Response({'modules': modules_result})
@@ -309,6 +403,7 @@ def instructor_modules(request):
         module_name = data.get('module_name')
         module_description = data.get('module_description', '')
         course_id = data.get('course_id')
+        due_date = data.get('due_date') or None
 
         if not module_name or not course_id:
             return Response({'error': '模块名称和课程ID不能为空'}, status=status.HTTP_400_BAD_REQUEST)
@@ -316,9 +411,13 @@ def instructor_modules(request):
         is_owner, error_response = check_instructor_ownership(instructor_id, course_id=course_id)
         if not is_owner: return error_response
 
-        with connection.cursor() as cursor:
-            cursor.execute(""" INSERT INTO Module (module_name, module_description, course_id)
-                              VALUES (%s, %s, %s) """, [module_name, module_description, course_id])
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(""" INSERT INTO Module (module_name, module_description, course_id, due_date)
+                                  VALUES (%s, %s, %s, %s) """, [module_name, module_description, course_id, due_date])
+                progress.seed_module_rollups(cursor, cursor.lastrowid)
+                course_stats.adjust(cursor, course_id, modules=1)
+                catalog.invalidate()
         return Response({'message': '模块添加成功'}, status=status.HTTP_201_CREATED)
 
 
@@ -336,7 +435,7 @@ def instructor_module_detail(request, module_id):
 
     if request.method == 'GET':
         with connection.cursor() as cursor:
-            cursor.execute(""" SELECT m.module_id, m.module_name, m.module_description, m.course_id, c.course_name
+            cursor.execute(""" SELECT m.module_id, m.module_name, m.module_description, m.course_id, c.course_name, m.due_date
                              FROM Module m JOIN Course c ON m.course_id = c.course_id
                              WHERE m.module_id = %s """, [module_id])
             module_data = dictfetchone(cursor)
@@ -348,6 +447,7 @@ def instructor_module_detail(request, module_id):
         update_fields = {}
         if 'module_name' in data: update_fields['module_name'] = data['module_name']
         if 'module_description' in data: update_fields['module_description'] = data['module_description']
+        if 'due_date' in data: update_fields['due_date'] = data['due_date'] or None
         # Potentially update course_id, requires re-checking ownership
         if 'course_id' in data:
             new_course_id = data['course_id']
@@ -360,17 +460,36 @@ def instructor_module_detail(request, module_id):
         set_clause = ", ".join([f"{key} = %s" for key in update_fields])
         values = list(update_fields.values()) + [module_id]
 
-        with connection.cursor() as cursor:
-             cursor.execute(f"UPDATE Module SET {set_clause} WHERE module_id = %s", values)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT course_id FROM Module WHERE module_id = %s", [module_id])
+                old_course_id = cursor.fetchone()[0]
+                cursor.execute(f"UPDATE Module SET {set_clause} WHERE module_id = %s", values)
+                catalog.invalidate()
+                if 'course_id' in update_fields and str(update_fields['course_id']) != str(old_course_id):
+                    # Module moved between courses: both courses' rollups change. Rebuilding them
+                    # touches every enrolled student, so it runs as a background task
+                    progress.drop_module_rollups(cursor, module_id)
+                    course_ids = [old_course_id, int(update_fields['course_id'])]
+                    task_id = tasks.enqueue(cursor, 'rebuild_rollups', {'course_ids': course_ids},
+                                            created_by=instructor_id)
+                    course_stats.refresh(cursor, course_ids)
+                    return Response({'message': '模块更新成功，课程进度正在后台重新计算', 'taskId': task_id,
+                                     'statusUrl': tasks.status_url(task_id)}, status=status.HTTP_202_ACCEPTED)
         return Response({'message': '模块更新成功'})
 
     elif request.method == 'DELETE':
-        with connection.cursor() as cursor:
+        with transaction.atomic(), connection.cursor() as cursor:
+             cursor.execute("SELECT course_id FROM Module WHERE module_id = %s", [module_id])
+             module_course_id = cursor.fetchone()[0]
              cursor.execute("SELECT COUNT(*) FROM Module_Exercise WHERE module_id = %s", [module_id])
              if cursor.fetchone()[0] > 0:
                  return Response({'error': '无法删除: 该模块下关联了练习'}, status=status.HTTP_400_BAD_REQUEST)
              cursor.execute("DELETE FROM Module WHERE module_id = %s", [module_id])
              if cursor.rowcount == 0: return Response({'error': '模块未找到或已被删除'}, status=status.HTTP_404_NOT_FOUND)
+             progress.drop_module_rollups(cursor, module_id)
+             course_stats.adjust(cursor, module_course_id, modules=-1)
+             catalog.invalidate()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -389,13 +508,14 @@ def instructor_exercises_by_module(request, module_id):
     if not is_owner: return error_response
 
     with connection.cursor() as cursor:
-        cursor.execute(""" SELECT * FROM Exercise
-                                WHERE exercise_id IN (
+        cursor.execute(""" SELECT e.*, d.table_schema FROM Exercise e
+                                LEFT JOIN Dataset d ON e.dataset_hash = d.dataset_hash
+                                WHERE e.exercise_id IN (
                                     SELECT DISTINCT exercise_id
                                     FROM Module_Exercise
                                     WHERE module_id = %s
                                 )
-                                ORDER BY title
+                                ORDER BY e.title
                                 """, [module_id])
         exercises = dictfetchall(cursor)
 
@@ -424,9 +544,10 @@ def instructor_exercises(request):
 
         with connection.cursor() as cursor:
              query = """
-                 SELECT DISTINCT e.exercise_id, e.title, e.description, e.hint, e.expected_answer, e.difficulty, e.table_schema,
+                 SELECT DISTINCT e.exercise_id, e.title, e.description, e.hint, e.expected_answer, e.difficulty, d.table_schema,
                         m.module_id, m.module_name, c.course_name, c.course_id
-                 FROM Exercise e LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
+                 FROM Exercise e LEFT JOIN Dataset d ON e.dataset_hash = d.dataset_hash
+                 LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
                  LEFT JOIN Module m ON me.module_id = m.module_id
                  LEFT JOIN Course c ON m.course_id = c.course_id
                  WHERE e.created_by = %s OR c.instructor_id = %s """
@@ -469,23 +590,24 @@ def instructor_exercises(request):
          is_owner, error_response = check_instructor_ownership(instructor_id, module_id=module_id)
          if not is_owner: return error_response
 
-         table_schema_str = None
-         if table_schema: # Handle if schema is optional
-            try:
-                 if isinstance(table_schema, (dict, list)): table_schema_str = json.dumps(table_schema)
-                 elif isinstance(table_schema, str): json.loads(table_schema); table_schema_str = table_schema
-                 else: raise ValueError("Invalid format")
-            except (json.JSONDecodeError, ValueError):
-                 return Response({'error': 'Table Schema 格式无效或不是有效的 JSON'}, status=status.HTTP_400_BAD_REQUEST)
+         try:
+             if table_schema: datasets.canonical(table_schema)
+         except datasets.DatasetError:
+             return Response({'error': 'Table Schema 格式无效或不是有效的 JSON'}, status=status.HTTP_400_BAD_REQUEST)
 
          with transaction.atomic():
              with connection.cursor() as cursor:
-                 cursor.execute(""" INSERT INTO Exercise (created_by, title, description, hint, expected_answer, difficulty, table_schema)
+                 # 相同的表结构只存一份，练习按内容哈希引用
+                 dataset_hash = datasets.intern(cursor, table_schema)
+                 cursor.execute(""" INSERT INTO Exercise (created_by, title, description, hint, expected_answer, difficulty, dataset_hash)
                                    VALUES (%s, %s, %s, %s, %s, %s, %s) """,
-                                [instructor_id, title, description, hint, expected_answer, difficulty, table_schema_str])
+                                [instructor_id, title, description, hint, expected_answer, difficulty, dataset_hash])
                  exercise_id = cursor.lastrowid
                  cursor.execute(""" INSERT INTO Module_Exercise (module_id, exercise_id) VALUES (%s, %s) """,
                                 [module_id, exercise_id])
+                 progress.apply_exercise_membership(cursor, exercise_id, [module_id], 1)
+                 course_stats.adjust_exercises(cursor, [module_id], 1)
+                 catalog.invalidate()
          return Response({'message': '练习添加并关联成功', 'exercise_id': exercise_id}, status=status.HTTP_201_CREATED)
 
 
@@ -503,8 +625,9 @@ def instructor_exercise_detail(request, exercise_id):
 
     if request.method == 'GET':
         with connection.cursor() as cursor:
-             cursor.execute(""" SELECT e.*, m.module_id, m.module_name, c.course_name, c.course_id
-                              FROM Exercise e LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
+             cursor.execute(""" SELECT e.*, d.table_schema, m.module_id, m.module_name, c.course_name, c.course_id
+                              FROM Exercise e LEFT JOIN Dataset d ON e.dataset_hash = d.dataset_hash
+                              LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
                               LEFT JOIN Module m ON me.module_id = m.module_id LEFT JOIN Course c ON m.course_id = c.course_id
                               WHERE e.exercise_id = %s """, [exercise_id])
              exercise_raw = dictfetchone(cursor)
@@ -530,44 +653,92 @@ def instructor_exercise_detail(request, exercise_id):
         if 'expectedAnswer' in data: update_fields['expected_answer'] = data['expectedAnswer']
         if 'difficulty' in data: update_fields['difficulty'] = data['difficulty']
         if 'tableSchema' in data:
-            table_schema = data['tableSchema']
-            table_schema_str = None
-            if table_schema: # Handle optional schema
-                try:
-                     if isinstance(table_schema, (dict, list)): table_schema_str = json.dumps(table_schema)
-                     elif isinstance(table_schema, str): json.loads(table_schema); table_schema_str = table_schema
-                     else: raise ValueError()
-                except: return Response({'error': 'Table Schema 格式无效或不是有效的 JSON'}, status=status.HTTP_400_BAD_REQUEST)
-            update_fields['table_schema'] = table_schema_str # Store null if empty/invalid input
+            try:
+                if data['tableSchema']: datasets.canonical(data['tableSchema'])
+            except datasets.DatasetError:
+                return Response({'error': 'Table Schema 格式无效或不是有效的 JSON'}, status=status.HTTP_400_BAD_REQUEST)
 
         if 'moduleId' in data: new_module_id = data['moduleId']
 
-        if not update_fields and new_module_id is None:
+        if not update_fields and 'tableSchema' not in data and new_module_id is None:
             return Response({'error': '没有提供需要更新的字段'}, status=status.HTTP_400_BAD_REQUEST)
 
         with transaction.atomic():
             with connection.cursor() as cursor:
+                if 'tableSchema' in data:
+                    # Empty schema stores NULL; unreferenced datasets are left for build_dataset_images --prune
+                    update_fields['dataset_hash'] = datasets.intern(cursor, data['tableSchema'])
+                regrade_job_id = None
                 if update_fields:
+                    cursor.execute("SELECT expected_answer, dataset_hash FROM Exercise WHERE exercise_id = %s FOR UPDATE",
+                                   [exercise_id])
+                    grading_inputs = cursor.fetchone()
                     set_clause = ", ".join([f"{key} = %s" for key in update_fields])
                     values = list(update_fields.values()) + [exercise_id]
                     cursor.execute(f"UPDATE Exercise SET {set_clause} WHERE exercise_id = %s", values)
+                    # 标准答案或数据集变了：已有的评分全部过时，提交后台重新评分
+                    if grading_inputs and (update_fields.get('expected_answer', grading_inputs[0]) != grading_inputs[0]
+                                           or update_fields.get('dataset_hash', grading_inputs[1]) != grading_inputs[1]):
+                        regrade_job_id = regrade.enqueue(cursor, exercise_id, instructor_id)
 
                 if new_module_id is not None:
                      is_new_owner, error_response_new = check_instructor_ownership(instructor_id, module_id=new_module_id)
                      if not is_new_owner: raise Exception(error_response_new.data['error']) # Use Exception to trigger rollback
+                     cursor.execute("SELECT module_id FROM Module_Exercise WHERE exercise_id = %s", [exercise_id])
+                     old_module_ids = [row[0] for row in cursor.fetchall()]
+                     progress.apply_exercise_membership(cursor, exercise_id, old_module_ids, -1)
+                     course_stats.adjust_exercises(cursor, old_module_ids, -1)
                      cursor.execute("DELETE FROM Module_Exercise WHERE exercise_id = %s", [exercise_id])
                      cursor.execute("INSERT INTO Module_Exercise (module_id, exercise_id) VALUES (%s, %s)",
                                     [new_module_id, exercise_id])
-        return Response({'message': '练习更新成功'})
+                     progress.apply_exercise_membership(cursor, exercise_id, [new_module_id], 1)
+                     course_stats.adjust_exercises(cursor, [new_module_id], 1)
+                catalog.invalidate()
+        return Response({'message': '练习更新成功', 'regradeJobId': regrade_job_id})
 
     elif request.method == 'DELETE':
-        with connection.cursor() as cursor:
-            # Delete from Exercise first (CASCADE should handle Module_Exercise)
-            cursor.execute("DELETE FROM Exercise WHERE exercise_id = %s", [exercise_id])
-            if cursor.rowcount == 0: return Response({'error': '练习未找到或已被删除'}, status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Roll back the exercise's contribution before CASCADE removes Module_Exercise / Student_Exercise
+                cursor.execute("SELECT module_id FROM Module_Exercise WHERE exercise_id = %s", [exercise_id])
+                module_ids = [row[0] for row in cursor.fetchall()]
+                progress.apply_exercise_membership(cursor, exercise_id, module_ids, -1)
+                course_stats.adjust_exercises(cursor, module_ids, -1)
+                # Delete from Exercise first (CASCADE should handle Module_Exercise)
+                cursor.execute("DELETE FROM Exercise WHERE exercise_id = %s", [exercise_id])
+                if cursor.rowcount == 0: return Response({'error': '练习未找到或已被删除'}, status=status.HTTP_404_NOT_FOUND)
+                catalog.invalidate()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['GET', 'POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+@safe_api_view
+def instructor_exercise_regrade(request, exercise_id):
+    """GET: Progress of the exercise's latest (or ?job_id=) regrade job. POST: Regrade all its submissions now."""
+    user = request.user
+    instructor_id = user.user_id
+
+    is_owner, error_response = check_instructor_ownership(instructor_id, exercise_id=exercise_id)
+    if not is_owner: return error_response
+
+    if request.method == 'POST':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                job_id = regrade.enqueue(cursor, exercise_id, instructor_id)
+                job = regrade.get_job(cursor, job_id)
+        return Response({'message': '重新评分任务已提交', 'job': job}, status=status.HTTP_202_ACCEPTED)
+
+    job_id = request.query_params.get('job_id')
+    with connection.cursor() as cursor:
+        job = regrade.get_job(cursor, job_id=int(job_id)) if job_id and job_id.isdigit() \
+            else regrade.get_job(cursor, exercise_id=exercise_id)
+    if not job or job['exercise_id'] != exercise_id:
+        return Response({'error': '没有找到重新评分任务'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'job': job})
+
+
 # === Student Views ===
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
@@ -639,11 +810,11 @@ def instructor_students(request):
                 all_enrollments = dictfetchall(cursor)
 
                 # Step 3: Populate the enrollments list for each student
-                for enrollment in all_enrollments:
-                    student_id = enrollment['student_id']
+                for row in all_enrollments:
+                    student_id = row['student_id']
                     if student_id in students_data:
-                         enrollment['term'] = map_term_to_str(enrollment['term']) # Map term number to string
-                         students_data[student_id]['enrollments'].append(enrollment)
+                         row['term'] = map_term_to_str(row['term']) # Map term number to string
+                         students_data[student_id]['enrollments'].append(row)
 
     except Exception as e:
         print(f"Error fetching student enrollments: {e}")
@@ -715,11 +886,10 @@ def instructor_dashboard_data(request):
         cursor.execute("""
             SELECT
                 c.course_id, c.course_name, c.course_code, c.year, c.term, c.state,
-                COUNT(e.student_id) as enrolled_count
+                COALESCE(cs.enrolled_count, 0) as enrolled_count
             FROM Course c
-            LEFT JOIN Enrollment e ON c.course_id = e.course_id AND e.status = 'enrolled'
+            LEFT JOIN Course_Stats cs ON cs.course_id = c.course_id
             WHERE c.instructor_id = %s AND c.state = 'active'
-            GROUP BY c.course_id, c.course_name, c.course_code, c.year, c.term, c.state
             ORDER BY enrolled_count DESC
             LIMIT 5
         """, [instructor_id])
@@ -873,6 +1043,8 @@ def instructor_messages_api(request):
                         INSERT INTO PrivateMessage (message_id, receiver_id)
                         VALUES (%s, %s)
                     """, [message_id, receiver_id])
+                    inbox.deliver_private(cursor, message_id, instructor_id, receiver_id)
+                    inbox.notify(message_id, 'private', instructor_id, content, receiver_id=receiver_id)
                     msg_text = 'Private message sent successfully.'
 
                 elif message_type == 'announcement':
@@ -897,6 +1069,11 @@ def instructor_messages_api(request):
                             VALUES (%s, %s)
                         """, [message_id, course_id])
                         msg_text = 'Announcement sent successfully to the selected course.'
+                    # Fan-out to every recipient's inbox runs in the background (core/inbox.py send_announcement)
+                    task_id = tasks.enqueue(cursor, 'send_announcement', {'message_id': message_id},
+                                            created_by=instructor_id)
+                    return Response({'message': msg_text, 'messageId': message_id, 'taskId': task_id,
+                                     'statusUrl': tasks.status_url(task_id)}, status=status.HTTP_202_ACCEPTED)
                 else:
                     raise ValueError("Invalid message type.")
 
@@ -990,6 +1167,7 @@ def instructor_update_score(request):
                         INSERT INTO Score (student_id, course_id, total_score)
                         VALUES (%s, %s, %s)
                     """, [student_id, course_id, grade_decimal])
+                dashboard.invalidate(student_id)
         return Response({'message': '成绩更新成功'}, status=status.HTTP_200_OK)
     except Exception as e:
         # Log the error in a real application
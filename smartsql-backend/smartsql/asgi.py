@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The SSE endpoints in core/events.py hold connections open with async views, so
+production serves this application rather than smartsql.wsgi, e.g.:
+
+    gunicorn smartsql.asgi:application -k uvicorn.workers.UvicornWorker
+
+With more than one worker set PUBSUB_BACKEND to core.pubsub.RedisBroadcast so
+events published in one worker reach streams held by the others.
 """
 
 import os
@@ -14,3 +22,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartsql.settings')
 
 application = get_asgi_application()
+
+# Only serving processes run background tasks (core/tasks.py); each gunicorn worker imports this module itself
+from core import tasks  # noqa: E402
+
+tasks.start_inline_workers()
@@ -15,6 +15,7 @@ from pathlib import Path
 from datetime import timedelta
 from dotenv import dotenv_values, load_dotenv # Import load_dotenv
 from io import StringIO
+from corsheaders.defaults import default_headers as default_cors_headers
 
 
 print("🔥 settings.py loaded!")
@@ -174,6 +175,122 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# Cache
+# Defaults to per-process memory; point CACHE_BACKEND / CACHE_LOCATION at a shared
+# cache (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'smartsql'),
+    }
+}
+
+# Seconds before a process reloads the exercise catalog (core/catalog.py) even if
+# no invalidation reached it. Edits invalidate it at once only in processes that
+# share the cache, so keep this short unless CACHE_BACKEND is shared.
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', '30'))
+
+# Per-user caches below are invalidated by version bumps (core/cache_utils.py), which
+# only reach processes sharing the cache. With the per-process LocMemCache their
+# entries are therefore kept at most LOCAL_CACHE_MAX_AGE seconds: another instance
+# serves a student stale data for no longer than that.
+LOCAL_CACHE_MAX_AGE = int(os.environ.get('LOCAL_CACHE_MAX_AGE', '5'))
+
+# Seconds a student's dashboard snapshot may be served from cache.
+# Submissions, enrollments and grade changes invalidate it immediately in processes
+# sharing the cache; capped at LOCAL_CACHE_MAX_AGE under the per-process LocMemCache.
+STUDENT_DASHBOARD_CACHE_TTL = int(os.environ.get('STUDENT_DASHBOARD_CACHE_TTL', '300'))
+
+# Seconds a student's attempted / solved exercise bitmaps may be cached.
+# Submissions invalidate them on commit, so with a shared cache this only bounds drift
+# from direct DB edits (capped at LOCAL_CACHE_MAX_AGE otherwise).
+SOLVED_CACHE_TTL = int(os.environ.get('SOLVED_CACHE_TTL', '3600'))
+
+# Server-push events (core/pubsub.py). LocalBroadcast only reaches clients connected
+# to the same process; use core.pubsub.RedisBroadcast (+ PUBSUB_REDIS_URL) with several workers.
+PUBSUB_BACKEND = os.environ.get('PUBSUB_BACKEND', 'core.pubsub.LocalBroadcast')
+PUBSUB_REDIS_URL = os.environ.get('PUBSUB_REDIS_URL', 'redis://localhost:6379/0')
+# Seconds between keep-alive comments on idle SSE connections.
+PUBSUB_HEARTBEAT_SECONDS = int(os.environ.get('PUBSUB_HEARTBEAT_SECONDS', '25'))
+# Streams are closed after this long and the browser reconnects (bounds leaked streams).
+PUBSUB_STREAM_MAX_SECONDS = int(os.environ.get('PUBSUB_STREAM_MAX_SECONDS', '600'))
+# Recent submissions per course replayed to instructors who open the live feed late.
+SUBMISSION_FEED_BUFFER = int(os.environ.get('SUBMISSION_FEED_BUFFER', '200'))
+
+# Submission history (core/submission_log.py). When buffered, attempts are queued and
+# written by a background thread in batches of up to SUBMISSION_LOG_BATCH_SIZE rows,
+# at most SUBMISSION_LOG_FLUSH_MS after the first one arrives. Requests still wait for
+# their batch to commit (at most SUBMISSION_LOG_TIMEOUT seconds).
+SUBMISSION_LOG_BUFFERED = os.environ.get('SUBMISSION_LOG_BUFFERED', 'True') == 'True'
+SUBMISSION_LOG_BATCH_SIZE = int(os.environ.get('SUBMISSION_LOG_BATCH_SIZE', '200'))
+SUBMISSION_LOG_FLUSH_MS = int(os.environ.get('SUBMISSION_LOG_FLUSH_MS', '50'))
+SUBMISSION_LOG_TIMEOUT = int(os.environ.get('SUBMISSION_LOG_TIMEOUT', '10'))
+
+# Optional write-behind buffer for Student_Exercise (core/submission_store.py): concurrent
+# submissions are upserted together, one multi-row statement per SUBMISSION_WRITE_FLUSH_MS.
+# Requests still wait for their batch to commit (at most SUBMISSION_WRITE_TIMEOUT seconds).
+# Compare with `manage.py benchmark_submission_writes` before enabling.
+SUBMISSION_WRITE_BUFFER = os.environ.get('SUBMISSION_WRITE_BUFFER', 'False') == 'True'
+SUBMISSION_WRITE_BATCH_SIZE = int(os.environ.get('SUBMISSION_WRITE_BATCH_SIZE', '100'))
+SUBMISSION_WRITE_FLUSH_MS = int(os.environ.get('SUBMISSION_WRITE_FLUSH_MS', '5'))
+SUBMISSION_WRITE_TIMEOUT = int(os.environ.get('SUBMISSION_WRITE_TIMEOUT', '10'))
+
+# Request dedupe for submissions (core/idempotency.py). Responses to an Idempotency-Key
+# are replayed for IDEMPOTENCY_TTL seconds; without a key, an identical answer to the
+# same exercise within IDEMPOTENCY_WINDOW_SECONDS is treated as a retry. A repeat waits
+# up to IDEMPOTENCY_WAIT_SECONDS for the original (AI grading) to finish. The original's
+# claim is held for its worst-case duration (grading + commit timeouts), not this wait.
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_WINDOW_SECONDS', '30'))
+IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '60'))
+
+# Seconds a dynamic_sql_query_api result page may be served from the cache. Keys are
+# versioned on the underlying data, so this only bounds memory use.
+DYNAMIC_QUERY_CACHE_TTL = int(os.environ.get('DYNAMIC_QUERY_CACHE_TTL', '300'))
+# Rows fetched from the server-side cursor and written per chunk by streamed
+# ?format=ndjson|csv responses (core/streaming.py); bounds their memory use.
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', '1000'))
+# "Run my query" sandboxes (student/sandbox.py): template databases kept warm,
+# sample rows per table, and the per-run row / time caps. The heap limit is
+# shared by every sandbox in the process.
+SANDBOX_POOL_SIZE = int(os.environ.get('SANDBOX_POOL_SIZE', '64'))
+SANDBOX_SAMPLE_ROWS = int(os.environ.get('SANDBOX_SAMPLE_ROWS', '25'))
+SANDBOX_MAX_ROWS = int(os.environ.get('SANDBOX_MAX_ROWS', '200'))
+SANDBOX_TIMEOUT_MS = int(os.environ.get('SANDBOX_TIMEOUT_MS', '500'))
+SANDBOX_HEAP_LIMIT_MB = int(os.environ.get('SANDBOX_HEAP_LIMIT_MB', '256'))
+# Prebuilt sandbox databases, one SQLite file per dataset hash; empty disables them.
+SANDBOX_IMAGE_DIR = os.environ.get('SANDBOX_IMAGE_DIR', str(BASE_DIR / 'sandbox_images'))
+# Reject submissions with syntax errors or unknown tables / columns locally
+# (student/grading.py) instead of sending them to the AI grader.
+SQL_LINT_ENABLED = os.environ.get('SQL_LINT_ENABLED', 'True') == 'True'
+# Microbatched AI grading (student/grading.py): submissions arriving within
+# AI_GRADING_BATCH_MS share one completion of up to AI_GRADING_BATCH_SIZE;
+# AI_GRADING_CONCURRENCY batches may be in flight per process.
+AI_GRADING_BATCHED = os.environ.get('AI_GRADING_BATCHED', 'True') == 'True'
+AI_GRADING_BATCH_SIZE = int(os.environ.get('AI_GRADING_BATCH_SIZE', '8'))
+AI_GRADING_BATCH_MS = int(os.environ.get('AI_GRADING_BATCH_MS', '300'))
+AI_GRADING_CONCURRENCY = int(os.environ.get('AI_GRADING_CONCURRENCY', '4'))
+AI_GRADING_TIMEOUT = int(os.environ.get('AI_GRADING_TIMEOUT', '60'))
+# Worker processes grading answers in background regrade jobs (student/regrade.py).
+# Grading is mostly waiting on the AI API, so this may exceed the CPU count.
+REGRADE_WORKERS = int(os.environ.get('REGRADE_WORKERS', '8'))
+# Durable background tasks (core/tasks.py), run by `manage.py run_tasks` and, when
+# TASK_INLINE_WORKERS > 0, by that many threads in each web process.
+# Tasks run in another process than the request that queued them, so workers need a
+# shared CACHE_BACKEND and PUBSUB_BACKEND = core.pubsub.RedisBroadcast: run_tasks and
+# the inline workers refuse to start without them. TASK_INLINE_ALLOW_UNSHARED lifts
+# that for a single development server (runserver), where every task runs in-process.
+TASK_MODULES = ['core.inbox', 'core.progress', 'student.regrade', 'student.submissions']
+TASK_INLINE_WORKERS = int(os.environ.get('TASK_INLINE_WORKERS', '0'))
+TASK_INLINE_ALLOW_UNSHARED = os.environ.get('TASK_INLINE_ALLOW_UNSHARED', 'False') == 'True'
+TASK_POLL_INTERVAL = float(os.environ.get('TASK_POLL_INTERVAL', '1'))
+# Default lease of a claimed task; it is retried when the lease expires unfinished
+TASK_VISIBILITY_TIMEOUT = int(os.environ.get('TASK_VISIBILITY_TIMEOUT', '300'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '5'))
+# Seconds before the first retry, doubled for each further one
+TASK_RETRY_BACKOFF = int(os.environ.get('TASK_RETRY_BACKOFF', '10'))
+TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', '7'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -185,6 +302,7 @@ CORS_ALLOWED_ORIGINS = [
     "https://db-group2-cs5200-25spring.web.app",
 ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'idempotency-key')
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartsql.settings')
 
 application = get_wsgi_application()
+
+# Only serving processes run background tasks (core/tasks.py)
+from core import tasks  # noqa: E402
+
+tasks.start_inline_workers()
@@ -14,8 +14,17 @@ DROP TABLE IF EXISTS Course;
 DROP TABLE IF EXISTS Enrollment;
 DROP TABLE IF EXISTS Module;
 DROP TABLE IF EXISTS Exercise;
+DROP TABLE IF EXISTS Dataset;
 DROP TABLE IF EXISTS Module_Exercise;
 DROP TABLE IF EXISTS Student_Exercise;
+DROP TABLE IF EXISTS Regrade_Job;
+DROP TABLE IF EXISTS Task;
+DROP TABLE IF EXISTS Submission;
+DROP TABLE IF EXISTS Student_Module;
+DROP TABLE IF EXISTS Student_Course;
+DROP TABLE IF EXISTS Course_Stats;
+DROP TABLE IF EXISTS Inbox;
+DROP TABLE IF EXISTS Unread_Counter;
 DROP TABLE IF EXISTS Instructor;
 DROP TABLE IF EXISTS Student;
 DROP TABLE IF EXISTS Users;
@@ -51,9 +60,13 @@ CREATE TABLE Course (
     course_code VARCHAR(20) NOT NULL, -- eg.CS5200
     instructor_id INT NOT NULL,
     course_description TEXT,
-    year INT,
-    term TINYINT, 
+    year INT NOT NULL DEFAULT 0,      -- 0 = not scheduled; NOT NULL keeps the keyset ORDER BY on the indexes below
+    term TINYINT NOT NULL DEFAULT 0, 
     state ENUM('active', 'complete', 'discontinued'), 
+    seat_limit INT,                   -- NULL = unlimited; enforced by core/enrollment.py
+    FULLTEXT KEY ft_course_search (course_name, course_code, course_description),
+    KEY idx_course_browse (state, year, term, course_id),       -- keyset pages of the student catalog
+    KEY idx_course_instructor (instructor_id, year, term, course_id),
     FOREIGN KEY (instructor_id)
         REFERENCES Instructor (instructor_id)
 );
@@ -64,6 +77,9 @@ CREATE TABLE Enrollment (
     student_id INT,
     course_id INT,
     status ENUM('enrolled', 'waitlisted', 'dropped') DEFAULT 'enrolled',
+    requested_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),  -- waitlist order
+    UNIQUE KEY uq_enrollment_student_course (student_id, course_id),
+    KEY idx_enrollment_waitlist (course_id, status, requested_at),
     FOREIGN KEY (student_id) REFERENCES Student(student_id) ON DELETE CASCADE,
     FOREIGN KEY (course_id) REFERENCES Course(course_id) ON DELETE CASCADE
 );
@@ -74,6 +90,7 @@ CREATE TABLE Module (
     course_id INT,
     module_name VARCHAR(255) NOT NULL,
     module_description TEXT,
+    due_date DATETIME,  -- optional deadline (UTC), shown as next_deadline on the student dashboard
     FOREIGN KEY (course_id) REFERENCES Course(course_id) ON DELETE SET NULL
 );
 
@@ -106,11 +123,18 @@ CREATE TABLE PrivateMessage (
 
 CREATE TABLE Announcement (
     message_id INT PRIMARY KEY,
-    course_id INT NOT NULL,
+    course_id INT,  -- NULL: global announcement to every course of the sender
     FOREIGN KEY (message_id) REFERENCES Message(message_id) ON DELETE CASCADE,
     FOREIGN KEY (course_id) REFERENCES Course(course_id)
 );
 
+-- 练习数据集：相同的 table_schema（表结构 + 可选种子数据）只存一份，按规范化 JSON 的 SHA-256 寻址
+CREATE TABLE Dataset (
+    dataset_hash CHAR(64) PRIMARY KEY,
+    table_schema JSON NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE Exercise (
     exercise_id INT AUTO_INCREMENT PRIMARY KEY,
     title VARCHAR(255),
@@ -118,10 +142,11 @@ CREATE TABLE Exercise (
     hint TEXT,
     expected_answer TEXT,
     difficulty VARCHAR(20),
-    table_schema JSON,
+    dataset_hash CHAR(64),
     tags VARCHAR(255),
     created_by INT NOT NULL,
-    FOREIGN KEY (created_by) REFERENCES Instructor(instructor_id)
+    FOREIGN KEY (created_by) REFERENCES Instructor(instructor_id),
+    FOREIGN KEY (dataset_hash) REFERENCES Dataset(dataset_hash)
 );
 
 CREATE TABLE Module_Exercise (
@@ -143,10 +168,148 @@ CREATE TABLE Student_Exercise (
     score DECIMAL(5,2),         -- 例如5.2表示最多5位数字，小数点后2位
     ai_feedback TEXT,           -- 存储AI反馈
     completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    submission_count INT NOT NULL DEFAULT 0,  -- attempts so far; every attempt is kept in Submission
+    best_score DECIMAL(5,2),
+    UNIQUE KEY uq_student_exercise (student_id, exercise_id),
     FOREIGN KEY (student_id) REFERENCES Student(student_id) ON DELETE CASCADE,
     FOREIGN KEY (exercise_id) REFERENCES Exercise(exercise_id) ON DELETE CASCADE
 );
 
+-- Append-only log of every attempt, written in batches by core/submission_log.py.
+-- Partitioned by month on submitted_at (manage.py manage_submission_partitions adds
+-- upcoming months and drops expired ones). Partitioned tables cannot have foreign keys,
+-- and the partition column must be part of the primary key.
+CREATE TABLE Submission (
+    submission_id BIGINT AUTO_INCREMENT,
+    student_id INT NOT NULL,
+    exercise_id INT NOT NULL,
+    course_id INT,
+    submitted_answer TEXT,
+    is_correct BOOLEAN NOT NULL DEFAULT FALSE,
+    score DECIMAL(5,2),
+    ai_feedback TEXT,
+    submitted_at DATETIME(3) NOT NULL,
+    PRIMARY KEY (submission_id, submitted_at),
+    KEY idx_submission_student (student_id, exercise_id, submitted_at),
+    KEY idx_submission_exercise (exercise_id, submitted_at),
+    KEY idx_submission_course (course_id, submitted_at)
+)
+PARTITION BY RANGE COLUMNS (submitted_at) (
+    PARTITION p_history VALUES LESS THAN ('2025-01-01'),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- 练习答案 / 数据集修改后的后台重新评分任务及进度（student/regrade.py）
+CREATE TABLE Regrade_Job (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    exercise_id INT NOT NULL,
+    status VARCHAR(20) NOT NULL,  -- queued / running / done / failed / superseded
+    requested_by INT,
+    total_submissions INT NOT NULL DEFAULT 0,
+    distinct_answers INT NOT NULL DEFAULT 0,
+    graded_answers INT NOT NULL DEFAULT 0,
+    failed_answers INT NOT NULL DEFAULT 0,
+    changed_submissions INT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME,
+    finished_at DATETIME,
+    KEY idx_regrade_exercise (exercise_id, job_id),
+    FOREIGN KEY (exercise_id) REFERENCES Exercise(exercise_id) ON DELETE CASCADE
+);
+
+-- Durable background task queue, claimed by workers with FOR UPDATE SKIP LOCKED (core/tasks.py)
+CREATE TABLE Task (
+    task_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',  -- queued / running / done / failed
+    priority SMALLINT NOT NULL DEFAULT 0,           -- higher runs first
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    timeout_seconds INT NOT NULL DEFAULT 300,       -- lease length (visibility timeout)
+    run_after DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    locked_by VARCHAR(200),
+    locked_until DATETIME(3),
+    result JSON,
+    error TEXT,
+    created_by INT,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    started_at DATETIME(3),
+    finished_at DATETIME(3),
+    KEY idx_task_queue (status, priority, run_after),
+    KEY idx_task_lease (status, locked_until),
+    KEY idx_task_finished (finished_at),
+    FOREIGN KEY (created_by) REFERENCES Users(user_id) ON DELETE SET NULL
+);
+
+-- Progress rollups, maintained incrementally by core/progress.py
+CREATE TABLE Student_Module (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    student_id INT NOT NULL,
+    module_id INT NOT NULL,
+    course_id INT,
+    total_exercises INT NOT NULL DEFAULT 0,
+    completed_exercises INT NOT NULL DEFAULT 0,
+    progress FLOAT NOT NULL DEFAULT 0,      -- 完成百分比
+    is_completed BOOLEAN NOT NULL DEFAULT FALSE,
+    completed_at DATETIME,
+    UNIQUE KEY uq_student_module (student_id, module_id),
+    KEY idx_student_module_course (student_id, course_id),
+    KEY idx_student_module_module (module_id),
+    FOREIGN KEY (student_id) REFERENCES Student(student_id) ON DELETE CASCADE,
+    FOREIGN KEY (module_id) REFERENCES Module(module_id) ON DELETE CASCADE
+);
+
+CREATE TABLE Student_Course (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    student_id INT NOT NULL,
+    course_id INT NOT NULL,
+    total_exercises INT NOT NULL DEFAULT 0,
+    completed_exercises INT NOT NULL DEFAULT 0,
+    progress FLOAT NOT NULL DEFAULT 0,      -- 完成百分比
+    is_completed BOOLEAN NOT NULL DEFAULT FALSE,
+    completed_at DATETIME,
+    UNIQUE KEY uq_student_course (student_id, course_id),
+    KEY idx_student_course_course (course_id),
+    FOREIGN KEY (student_id) REFERENCES Student(student_id) ON DELETE CASCADE,
+    FOREIGN KEY (course_id) REFERENCES Course(course_id) ON DELETE CASCADE
+);
+
+-- Per-user message inbox, filled at send time by core/inbox.py
+CREATE TABLE Inbox (
+    inbox_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    message_id INT NOT NULL,
+    course_id INT,                          -- announcement's course (NULL for private / global)
+    conversation VARCHAR(40) NOT NULL,      -- 'user:<peer>', 'course:<id>' or 'instructor:<sender>' (global)
+    is_sent BOOLEAN NOT NULL DEFAULT FALSE, -- the owner is the sender
+    is_read BOOLEAN NOT NULL DEFAULT FALSE,
+    UNIQUE KEY uq_inbox_user_message (user_id, message_id),
+    KEY idx_inbox_user (user_id, inbox_id),
+    KEY idx_inbox_unread (user_id, is_read, conversation),
+    FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (message_id) REFERENCES Message(message_id) ON DELETE CASCADE
+);
+
+-- Unread inbox entries per user and conversation; conversation '*' holds the user's total
+CREATE TABLE Unread_Counter (
+    user_id INT NOT NULL,
+    conversation VARCHAR(40) NOT NULL,
+    unread INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, conversation),
+    FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+);
+
+-- Per-course listing counters, maintained by core/course_stats.py
+CREATE TABLE Course_Stats (
+    course_id INT PRIMARY KEY,
+    module_count INT NOT NULL DEFAULT 0,
+    exercise_count INT NOT NULL DEFAULT 0,   -- Module_Exercise links in the course's modules
+    enrolled_count INT NOT NULL DEFAULT 0,   -- Enrollment rows with status 'enrolled'
+    FOREIGN KEY (course_id) REFERENCES Course(course_id) ON DELETE CASCADE
+);
+
 
 -- Student_Progress
 CREATE TABLE Student_Progress (
@@ -166,25 +166,40 @@ INSERT INTO Announcement (message_id, course_id) VALUES
 (14, 15);
 
 
-INSERT INTO Exercise (exercise_id, title, description, hint, expected_answer, difficulty, table_schema, tags, created_by)
+INSERT INTO Dataset (dataset_hash, table_schema) VALUES
+('6190f4e3e381c19e6af1c76de2675c9f13c23d6256f59e77ea57d2f2318eab4b', '[{"columns":["id","first_name","last_name","department","salary"],"name":"employees"}]'),
+('04a734436a03ee519943171d671186c8d6000ad31d5a340c5f1fcf93253caa68', '[{"columns":["id","name","department","salary"],"name":"employees"}]'),
+('4d9bb27d24803e7ec8a898f0c61152ff0d59c2f4dfd83a6e274c1761425e7231', '[{"columns":["id","name"],"name":"students"},{"columns":["id","student_id","course_id"],"name":"enrollments"},{"columns":["id","course_name"],"name":"courses"}]'),
+('c4a368adbc697665bcabe84c8d713806de4a366677eeb2f36c95061e51190981', '[{"columns":["id","name","age","major"],"name":"students"}]'),
+('e15f96e7e639ceb84cf321283943477479aa6b88eeec424c1e2cdc2874ee370d', '[{"columns":["department_id","department_name"],"name":"departments"}]'),
+('69b895c66d985024c8ba43d9d917c532dcff3f91981e90bf369d8fe8892b9c29', '[{"columns":["course_id","course_name","course_code"],"name":"courses"}]'),
+('6ee80412524a02e0a13fe2dfbee629380d30e4c37e77d324ca5748e68febd6a1', '[{"columns":["employee_id","name","salary"],"name":"employees"}]'),
+('ebcef0b49d9af2f2cafda7dd14c0a042f606a7683d975c5696154ffe6ccc71df', '[{"columns":["id","name"],"name":"students"},{"columns":["student_id","course_code"],"name":"enrollments"}]'),
+('fa97e449b31c51e7f9e96f32dd21b86d6dcf53e28cfcba5f93a58755e363760c', '[{"columns":["employee_id","department_id","salary"],"name":"employees"}]'),
+('34d56d6f2fe4d844b80e2f5af0cfcfe5064d83abfc6840943c791d683e83f1e5', '[{"columns":["employee_id","name","manager_id"],"name":"employees"}]'),
+('d655897ec0a9360287cf0f344e99dedd8d53ea91d5988ea5a74e3ee62c5d77f6', '[{"columns":["id","name"],"name":"students"}]'),
+('6d1d81ff3f96f02e598deafbd9d3f85cda5eb78347488d43cd38e0df988b27e7', '[{"columns":["course_code","course_name"],"name":"courses"},{"columns":["student_id","course_code"],"name":"enrollments"}]'),
+('1eefe2fde1e2da92e0c12c0b60f37d7d60deb58fd1525c3119b884c16a0c68a0', '[{"columns":["student_id","course_code"],"name":"enrollments"}]');
+
+INSERT INTO Exercise (exercise_id, title, description, hint, expected_answer, difficulty, dataset_hash, tags, created_by)
 VALUES
-(1, 'Simple SELECT Query', 'Write a SQL query to select all columns from the ''employees'' table.', 'Use SELECT * FROM employees;', 'SELECT * FROM employees;', 'Easy', '[{"name": "employees", "columns": ["id", "first_name", "last_name", "department", "salary"]}]', 'select, basics', 6),
-(2, 'Average Salary by Department', 'Write a SQL query to calculate the average salary for each department.', 'Use GROUP BY on the department column.', 'SELECT department, AVG(salary) FROM employees GROUP BY department;', 'Medium', '[{"name": "employees", "columns": ["id", "name", "department", "salary"]}]', 'aggregation, group by', 6),
-(3, 'Find Students and Their Courses', 'Write a SQL query to list student names along with the names of courses they are enrolled in.', 'Use JOIN between students, enrollments, and courses.', 'SELECT s.name, c.course_name \n        FROM students s\n        JOIN enrollments e ON s.id = e.student_id\n        JOIN courses c ON e.course_id = c.id;', 'Medium', '[{"name": "students", "columns": ["id", "name"]}, {"name": "enrollments", "columns": ["id", "student_id", "course_id"]}, {"name": "courses", "columns": ["id", "course_name"]}]', 'join, relational', 6),
-(4, 'Retrieve All Students', 'Retrieve all columns from the students table.', 'Use the SELECT * statement.', 'SELECT * FROM students;', 'Easy', '[{"name": "students", "columns": ["id", "name", "age", "major"]}]', 'basics, select', 6),
-(5, 'Retrieve Unique Departments', 'Retrieve distinct department names from the departments table.', 'Use the DISTINCT keyword.', 'SELECT DISTINCT department_name FROM departments;', 'Easy', '[{"name": "departments", "columns": ["department_id", "department_name"]}]', 'basics, distinct', 6),
-(6, 'Count Total Courses', 'Count the total number of courses in the courses table.', 'Use the COUNT function.', 'SELECT COUNT(*) FROM courses;', 'Easy', '[{"name": "courses", "columns": ["course_id", "course_name", "course_code"]}]', 'aggregation, count', 6),
-(7, 'Find Maximum Salary', 'Find the maximum salary from the employees table.', 'Use the MAX function.', 'SELECT MAX(salary) FROM employees;', 'Easy', '[{"name": "employees", "columns": ["employee_id", "name", "salary"]}]', 'aggregation, max', 6),
-(8, 'List Courses Starting with CS', 'List all courses where the course code starts with CS.', 'Use the LIKE operator with a wildcard.', 'SELECT * FROM courses WHERE course_code LIKE ''CS%'';', 'Medium', '[{"name": "courses", "columns": ["course_id", "course_name", "course_code"]}]', 'filtering, like', 6),
-(9, 'Retrieve Students Enrolled in CS101', 'Retrieve names of students enrolled in the course CS101.', 'Use a JOIN between students and enrollments tables.', 'SELECT s.name FROM students s JOIN enrollments e ON s.id = e.student_id WHERE e.course_code = ''CS101'';', 'Medium', '[{"name": "students", "columns": ["id", "name"]}, {"name": "enrollments", "columns": ["student_id", "course_code"]}]', 'join, filtering', 6),
-(10, 'Calculate Average Salary by Department', 'Calculate the average salary for each department.', 'Use GROUP BY and AVG functions.', 'SELECT department_id, AVG(salary) AS avg_salary FROM employees GROUP BY department_id;', 'Medium', '[{"name": "employees", "columns": ["employee_id", "department_id", "salary"]}]', 'aggregation, group by', 6),
-(11, 'Find Employees Without Managers', 'Find names of employees who do not have a manager.', 'Use WHERE clause to filter NULL values.', 'SELECT name FROM employees WHERE manager_id IS NULL;', 'Medium', '[{"name": "employees", "columns": ["employee_id", "name", "manager_id"]}]', 'filtering, null', 6),
-(12, 'Insert a New Student', 'Insert a new student named Alice into the students table.', 'Use the INSERT INTO statement.', 'INSERT INTO students (name) VALUES (''Alice'');', 'Easy', '[{"name": "students", "columns": ["id", "name"]}]', 'insert, basics', 6),
-(13, 'Update Course Name', 'Update the name of the course with code CS101 to Introduction to Computer Science.', 'Use the UPDATE statement with a WHERE clause.', 'UPDATE courses SET course_name = ''Introduction to Computer Science'' WHERE course_code = ''CS101'';', 'Easy', '[{"name": "courses", "columns": ["course_id", "course_name", "course_code"]}]', 'update, basics', 6),
-(14, 'Delete a Student Record', 'Delete the student record with ID 10 from the students table.', 'Use the DELETE FROM statement with a WHERE clause.', 'DELETE FROM students WHERE id = 10;', 'Easy', '[{"name": "students", "columns": ["id", "name"]}]', 'delete, basics', 6),
-(15, 'Retrieve Courses with No Enrollments', 'Retrieve courses that have no students enrolled.', 'Use a LEFT JOIN and filter for NULL values.', 'SELECT c.course_name FROM courses c LEFT JOIN enrollments e ON c.course_code = e.course_code WHERE e.student_id IS NULL;', 'Medium', '[{"name": "courses", "columns": ["course_code", "course_name"]}, {"name": "enrollments", "columns": ["student_id", "course_code"]}]', 'join, null', 6),
-(16, 'List Students Enrolled in Multiple Courses', 'List students who are enrolled in more than one course.', 'Use GROUP BY and HAVING clauses.', 'SELECT student_id FROM enrollments GROUP BY student_id HAVING COUNT(course_code) > 1;', 'Medium', '[{"name": "enrollments", "columns": ["student_id", "course_code"]}]', 'aggregation, group by, having', 6),
-(17, 'Retrieve Top 5 Highest Paid Employees', 'Retrieve the top 5 highest paid employees.', 'Use ORDER BY and LIMIT clauses.', 'SELECT name, salary FROM employees ORDER BY salary DESC LIMIT 5;', 'Medium', '[{"name": "employees", "columns": ["employee_id", "name", "salary"]}]', 'sorting, limit', 6);
+(1, 'Simple SELECT Query', 'Write a SQL query to select all columns from the ''employees'' table.', 'Use SELECT * FROM employees;', 'SELECT * FROM employees;', 'Easy', '6190f4e3e381c19e6af1c76de2675c9f13c23d6256f59e77ea57d2f2318eab4b', 'select, basics', 6),
+(2, 'Average Salary by Department', 'Write a SQL query to calculate the average salary for each department.', 'Use GROUP BY on the department column.', 'SELECT department, AVG(salary) FROM employees GROUP BY department;', 'Medium', '04a734436a03ee519943171d671186c8d6000ad31d5a340c5f1fcf93253caa68', 'aggregation, group by', 6),
+(3, 'Find Students and Their Courses', 'Write a SQL query to list student names along with the names of courses they are enrolled in.', 'Use JOIN between students, enrollments, and courses.', 'SELECT s.name, c.course_name \n        FROM students s\n        JOIN enrollments e ON s.id = e.student_id\n        JOIN courses c ON e.course_id = c.id;', 'Medium', '4d9bb27d24803e7ec8a898f0c61152ff0d59c2f4dfd83a6e274c1761425e7231', 'join, relational', 6),
+(4, 'Retrieve All Students', 'Retrieve all columns from the students table.', 'Use the SELECT * statement.', 'SELECT * FROM students;', 'Easy', 'c4a368adbc697665bcabe84c8d713806de4a366677eeb2f36c95061e51190981', 'basics, select', 6),
+(5, 'Retrieve Unique Departments', 'Retrieve distinct department names from the departments table.', 'Use the DISTINCT keyword.', 'SELECT DISTINCT department_name FROM departments;', 'Easy', 'e15f96e7e639ceb84cf321283943477479aa6b88eeec424c1e2cdc2874ee370d', 'basics, distinct', 6),
+(6, 'Count Total Courses', 'Count the total number of courses in the courses table.', 'Use the COUNT function.', 'SELECT COUNT(*) FROM courses;', 'Easy', '69b895c66d985024c8ba43d9d917c532dcff3f91981e90bf369d8fe8892b9c29', 'aggregation, count', 6),
+(7, 'Find Maximum Salary', 'Find the maximum salary from the employees table.', 'Use the MAX function.', 'SELECT MAX(salary) FROM employees;', 'Easy', '6ee80412524a02e0a13fe2dfbee629380d30e4c37e77d324ca5748e68febd6a1', 'aggregation, max', 6),
+(8, 'List Courses Starting with CS', 'List all courses where the course code starts with CS.', 'Use the LIKE operator with a wildcard.', 'SELECT * FROM courses WHERE course_code LIKE ''CS%'';', 'Medium', '69b895c66d985024c8ba43d9d917c532dcff3f91981e90bf369d8fe8892b9c29', 'filtering, like', 6),
+(9, 'Retrieve Students Enrolled in CS101', 'Retrieve names of students enrolled in the course CS101.', 'Use a JOIN between students and enrollments tables.', 'SELECT s.name FROM students s JOIN enrollments e ON s.id = e.student_id WHERE e.course_code = ''CS101'';', 'Medium', 'ebcef0b49d9af2f2cafda7dd14c0a042f606a7683d975c5696154ffe6ccc71df', 'join, filtering', 6),
+(10, 'Calculate Average Salary by Department', 'Calculate the average salary for each department.', 'Use GROUP BY and AVG functions.', 'SELECT department_id, AVG(salary) AS avg_salary FROM employees GROUP BY department_id;', 'Medium', 'fa97e449b31c51e7f9e96f32dd21b86d6dcf53e28cfcba5f93a58755e363760c', 'aggregation, group by', 6),
+(11, 'Find Employees Without Managers', 'Find names of employees who do not have a manager.', 'Use WHERE clause to filter NULL values.', 'SELECT name FROM employees WHERE manager_id IS NULL;', 'Medium', '34d56d6f2fe4d844b80e2f5af0cfcfe5064d83abfc6840943c791d683e83f1e5', 'filtering, null', 6),
+(12, 'Insert a New Student', 'Insert a new student named Alice into the students table.', 'Use the INSERT INTO statement.', 'INSERT INTO students (name) VALUES (''Alice'');', 'Easy', 'd655897ec0a9360287cf0f344e99dedd8d53ea91d5988ea5a74e3ee62c5d77f6', 'insert, basics', 6),
+(13, 'Update Course Name', 'Update the name of the course with code CS101 to Introduction to Computer Science.', 'Use the UPDATE statement with a WHERE clause.', 'UPDATE courses SET course_name = ''Introduction to Computer Science'' WHERE course_code = ''CS101'';', 'Easy', '69b895c66d985024c8ba43d9d917c532dcff3f91981e90bf369d8fe8892b9c29', 'update, basics', 6),
+(14, 'Delete a Student Record', 'Delete the student record with ID 10 from the students table.', 'Use the DELETE FROM statement with a WHERE clause.', 'DELETE FROM students WHERE id = 10;', 'Easy', 'd655897ec0a9360287cf0f344e99dedd8d53ea91d5988ea5a74e3ee62c5d77f6', 'delete, basics', 6),
+(15, 'Retrieve Courses with No Enrollments', 'Retrieve courses that have no students enrolled.', 'Use a LEFT JOIN and filter for NULL values.', 'SELECT c.course_name FROM courses c LEFT JOIN enrollments e ON c.course_code = e.course_code WHERE e.student_id IS NULL;', 'Medium', '6d1d81ff3f96f02e598deafbd9d3f85cda5eb78347488d43cd38e0df988b27e7', 'join, null', 6),
+(16, 'List Students Enrolled in Multiple Courses', 'List students who are enrolled in more than one course.', 'Use GROUP BY and HAVING clauses.', 'SELECT student_id FROM enrollments GROUP BY student_id HAVING COUNT(course_code) > 1;', 'Medium', '1eefe2fde1e2da92e0c12c0b60f37d7d60deb58fd1525c3119b884c16a0c68a0', 'aggregation, group by, having', 6),
+(17, 'Retrieve Top 5 Highest Paid Employees', 'Retrieve the top 5 highest paid employees.', 'Use ORDER BY and LIMIT clauses.', 'SELECT name, salary FROM employees ORDER BY salary DESC LIMIT 5;', 'Medium', '6ee80412524a02e0a13fe2dfbee629380d30e4c37e77d324ca5748e68febd6a1', 'sorting, limit', 6);
 
 INSERT INTO Module_Exercise (module_id, exercise_id, display_order) VALUES
 -- Course 1 (Modules 1,2,3)
@@ -226,3 +241,87 @@ WHERE user_id = 1;
 -- Remove message
 DELETE FROM Message
 WHERE message_id = 7;
+
+
+-- Progress rollups (core/progress.py), as `manage.py rebuild_progress` computes them
+INSERT INTO Student_Module (student_id, module_id, course_id, total_exercises, completed_exercises,
+                            progress, is_completed, completed_at)
+SELECT t.student_id, t.module_id, t.course_id, t.total_exercises, t.completed_exercises,
+       CASE WHEN t.total_exercises > 0 THEN ROUND(100 * t.completed_exercises / t.total_exercises, 2) ELSE 0 END,
+       t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises,
+       CASE WHEN t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises THEN NOW() END
+FROM (
+    SELECT en.student_id, m.module_id, m.course_id,
+           COUNT(DISTINCT me.exercise_id) AS total_exercises,
+           COUNT(DISTINCT se.exercise_id) AS completed_exercises
+    FROM Enrollment en
+    JOIN Module m ON m.course_id = en.course_id
+    LEFT JOIN Module_Exercise me ON me.module_id = m.module_id
+    LEFT JOIN Student_Exercise se ON se.exercise_id = me.exercise_id
+        AND se.student_id = en.student_id AND se.is_correct = TRUE
+    WHERE en.status = 'enrolled'
+    GROUP BY en.student_id, m.module_id, m.course_id
+) t;
+
+INSERT INTO Student_Course (student_id, course_id, total_exercises, completed_exercises,
+                            progress, is_completed, completed_at)
+SELECT t.student_id, t.course_id, t.total_exercises, t.completed_exercises,
+       CASE WHEN t.total_exercises > 0 THEN ROUND(100 * t.completed_exercises / t.total_exercises, 2) ELSE 0 END,
+       t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises,
+       CASE WHEN t.total_exercises > 0 AND t.completed_exercises >= t.total_exercises THEN NOW() END
+FROM (
+    SELECT en.student_id, en.course_id,
+           COUNT(DISTINCT me.exercise_id) AS total_exercises,
+           COUNT(DISTINCT se.exercise_id) AS completed_exercises
+    FROM Enrollment en
+    LEFT JOIN Module m ON m.course_id = en.course_id
+    LEFT JOIN Module_Exercise me ON me.module_id = m.module_id
+    LEFT JOIN Student_Exercise se ON se.exercise_id = me.exercise_id
+        AND se.student_id = en.student_id AND se.is_correct = TRUE
+    WHERE en.status = 'enrolled'
+    GROUP BY en.student_id, en.course_id
+) t;
+
+-- Course listing counters (core/course_stats.py), as `manage.py rebuild_course_stats` computes them
+INSERT INTO Course_Stats (course_id, module_count, exercise_count, enrolled_count)
+SELECT c.course_id,
+       (SELECT COUNT(*) FROM Module m WHERE m.course_id = c.course_id),
+       (SELECT COUNT(*) FROM Module_Exercise me
+        JOIN Module m ON me.module_id = m.module_id
+        WHERE m.course_id = c.course_id),
+       (SELECT COUNT(*) FROM Enrollment e
+        WHERE e.course_id = c.course_id AND e.status = 'enrolled')
+FROM Course c;
+
+-- Inboxes (core/inbox.py), as `manage.py backfill_inbox --recount` files them, except that
+-- the sample messages are left unread for their recipients
+INSERT INTO Inbox (user_id, message_id, course_id, conversation, is_sent, is_read)
+SELECT user_id, message_id, course_id, conversation, is_sent, is_sent FROM (
+    SELECT pm.receiver_id AS user_id, m.message_id, NULL AS course_id,
+           CONCAT('user:', m.sender_id) AS conversation, FALSE AS is_sent, m.timestamp
+    FROM Message m JOIN PrivateMessage pm ON pm.message_id = m.message_id
+    UNION ALL
+    SELECT m.sender_id, m.message_id, NULL, CONCAT('user:', pm.receiver_id), TRUE, m.timestamp
+    FROM Message m JOIN PrivateMessage pm ON pm.message_id = m.message_id
+    UNION ALL
+    SELECT DISTINCT e.student_id, m.message_id, a.course_id,
+           IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)),
+           FALSE, m.timestamp
+    FROM Message m
+    JOIN Announcement a ON a.message_id = m.message_id
+    JOIN Course c ON (a.course_id IS NOT NULL AND c.course_id = a.course_id)
+                  OR (a.course_id IS NULL AND c.instructor_id = m.sender_id)
+    JOIN Enrollment e ON e.course_id = c.course_id AND e.status = 'enrolled'
+    UNION ALL
+    SELECT m.sender_id, m.message_id, a.course_id,
+           IF(a.course_id IS NULL, CONCAT('instructor:', m.sender_id), CONCAT('course:', a.course_id)),
+           TRUE, m.timestamp
+    FROM Message m JOIN Announcement a ON a.message_id = m.message_id
+) deliveries
+ORDER BY timestamp, message_id, is_sent;
+
+-- Unread counts per conversation, plus each user's total under conversation '*'
+INSERT INTO Unread_Counter (user_id, conversation, unread)
+SELECT user_id, conversation, COUNT(*) FROM Inbox WHERE is_read = FALSE GROUP BY user_id, conversation
+UNION ALL
+SELECT user_id, '*', COUNT(*) FROM Inbox WHERE is_read = FALSE GROUP BY user_id;
@@ -16,14 +16,23 @@ DROP VIEW IF EXISTS UserMessages;
 DROP TABLE IF EXISTS Student_Progress;
 DROP TABLE IF EXISTS Knowledge_Graph;
 DROP TABLE IF EXISTS Error_Log;
+DROP TABLE IF EXISTS Unread_Counter;
+DROP TABLE IF EXISTS Inbox;
 DROP TABLE IF EXISTS PrivateMessage;
 DROP TABLE IF EXISTS Announcement;
 DROP TABLE IF EXISTS Message;
 DROP TABLE IF EXISTS Score;
 DROP TABLE IF EXISTS Enrollment;
+DROP TABLE IF EXISTS Student_Module;
+DROP TABLE IF EXISTS Student_Course;
+DROP TABLE IF EXISTS Course_Stats;
 DROP TABLE IF EXISTS Student_Exercise;
+DROP TABLE IF EXISTS Regrade_Job;
+DROP TABLE IF EXISTS Task;
+DROP TABLE IF EXISTS Submission;
 DROP TABLE IF EXISTS Module_Exercise;
 DROP TABLE IF EXISTS Exercise;
+DROP TABLE IF EXISTS Dataset;
 DROP TABLE IF EXISTS Module;
 DROP TABLE IF EXISTS Course;
 DROP TABLE IF EXISTS Question;
@@ -0,0 +1,327 @@
+"""
+Structured, parameterized queries for dynamic_sql_query_api.
+
+Clients describe a query instead of sending SQL fragments:
+
+    {"table_name": "Course",
+     "columns": ["course_id", "course_name"],
+     "conditions": [{"column": "year", "op": ">=", "value": 2024},
+                    {"column": "state", "op": "in", "value": ["active", "complete"]}],
+     "order_by": [{"column": "year", "direction": "desc"}],
+     "limit": 50,
+     "cursor": "<next_cursor of the previous page>"}
+
+Tables, columns and operators come from the TABLES allowlist; values are
+converted to the column's type and bound as parameters, never interpolated.
+Tables holding per-student data are always filtered to the requesting student.
+Every query has a LIMIT of at most MAX_LIMIT and pages with keyset cursors
+(the order columns plus the table key of the last row), so memory and latency
+stay bounded whatever the input. Streamed exports (?format=ndjson|csv, see
+core/streaming.py) may ask for up to MAX_STREAM_ROWS rows in one response.
+
+Results are cached under a hash of the normalized query. Keys include the
+catalog version for course content and the student's dashboard version for
+their own rows, so a cached page never outlives the data it was built from.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+from core import catalog, dashboard
+from core.cache_utils import get_version
+from core.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_STREAM_ROWS = 100000
+MAX_IN_VALUES = 100
+MAX_CONDITIONS = 10
+
+# column -> (type, nullable). Sorting is only allowed on non-nullable columns
+# so keyset comparisons never meet a NULL.
+TABLES = {
+    'Course': {
+        'key': 'course_id',
+        'columns': {
+            'course_id': ('int', False), 'course_name': ('str', False), 'course_code': ('str', False),
+            'course_description': ('str', True), 'instructor_id': ('int', False),
+            'year': ('int', False), 'term': ('int', False), 'state': ('str', True), 'seat_limit': ('int', True),
+        },
+        'scope': None,
+    },
+    'Module': {
+        'key': 'module_id',
+        'columns': {
+            'module_id': ('int', False), 'course_id': ('int', True), 'module_name': ('str', False),
+            'module_description': ('str', True), 'due_date': ('datetime', True),
+        },
+        'scope': None,
+    },
+    'Exercise': {
+        # expected_answer is deliberately not exposed
+        'key': 'exercise_id',
+        'columns': {
+            'exercise_id': ('int', False), 'title': ('str', True), 'description': ('str', True),
+            'hint': ('str', True), 'difficulty': ('str', True), 'tags': ('str', True),
+        },
+        'scope': None,
+    },
+    'Module_Exercise': {
+        'key': 'id',
+        'columns': {
+            'id': ('int', False), 'module_id': ('int', False), 'exercise_id': ('int', False),
+            'display_order': ('int', True),
+        },
+        'scope': None,
+    },
+    'Enrollment': {
+        'key': 'enrollment_id',
+        'columns': {'enrollment_id': ('int', False), 'course_id': ('int', True), 'status': ('str', True)},
+        'scope': 'student_id',
+    },
+    'Student_Exercise': {
+        'key': 'id',
+        'columns': {
+            'id': ('int', False), 'exercise_id': ('int', False), 'submitted_answer': ('str', True),
+            'is_correct': ('bool', True), 'score': ('decimal', True), 'ai_feedback': ('str', True),
+            'completed_at': ('datetime', True), 'submission_count': ('int', False), 'best_score': ('decimal', True),
+        },
+        'scope': 'student_id',
+    },
+    'Student_Course': {
+        'key': 'course_id',
+        'columns': {
+            'course_id': ('int', False), 'total_exercises': ('int', False), 'completed_exercises': ('int', False),
+            'progress': ('decimal', False), 'is_completed': ('bool', False), 'completed_at': ('datetime', True),
+        },
+        'scope': 'student_id',
+    },
+}
+
+OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'in', 'like', 'is_null'}
+
+
+class QueryError(ValueError):
+    """The query description is invalid; the message is safe to show the client."""
+
+
+def _convert(value, kind, column):
+    try:
+        if kind == 'int':
+            if isinstance(value, bool):
+                raise ValueError
+            return int(value)
+        if kind == 'decimal':
+            return decimal.Decimal(str(value))
+        if kind == 'bool':
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() in ('1', 'true', '0', 'false'):
+                return str(value).lower() in ('1', 'true')
+            raise ValueError
+        if kind == 'datetime':
+            parsed = parse_datetime(str(value)) if not isinstance(value, datetime.datetime) else value
+            if parsed is None:
+                raise ValueError
+            return parsed.replace(tzinfo=None)
+        if isinstance(value, (dict, list)):
+            raise ValueError
+        return str(value)
+    except (TypeError, ValueError, decimal.InvalidOperation):
+        raise QueryError(f"Invalid value for {column}: {value!r}")
+
+
+def _column(spec, name):
+    if not isinstance(name, str) or name not in spec['columns']:
+        raise QueryError(f"Unknown column: {name!r}")
+    return name
+
+
+def _order_entry(spec, entry):
+    if isinstance(entry, str):
+        parts = entry.split()
+        entry = {'column': parts[0] if parts else '', 'direction': parts[1] if len(parts) > 1 else 'asc'}
+    if not isinstance(entry, dict):
+        raise QueryError("order_by entries must be objects or 'column [asc|desc]' strings.")
+    column = _column(spec, entry.get('column'))
+    if spec['columns'][column][1]:
+        raise QueryError(f"Cannot sort by {column}: it may be NULL.")
+    direction = str(entry.get('direction', 'asc')).lower()
+    if direction not in ('asc', 'desc'):
+        raise QueryError(f"Invalid sort direction: {direction}")
+    return column, direction
+
+
+def normalize(data, max_limit=MAX_LIMIT):
+    """Validate a query description and return it in canonical form (also the cache key material)."""
+    table = data.get('table_name')
+    if table not in TABLES:
+        raise QueryError(f"Unknown table: {table!r}. Available: {', '.join(sorted(TABLES))}")
+    spec = TABLES[table]
+
+    columns = data.get('columns') or list(spec['columns'])
+    if not isinstance(columns, list):
+        raise QueryError("columns must be a list.")
+    columns = [_column(spec, c) for c in columns]
+
+    conditions = data.get('conditions') or []
+    if not isinstance(conditions, list) or len(conditions) > MAX_CONDITIONS:
+        raise QueryError(f"conditions must be a list of at most {MAX_CONDITIONS} objects.")
+    predicates = []
+    for condition in conditions:
+        if not isinstance(condition, dict):
+            raise QueryError("Each condition must be an object with column, op and value (raw SQL is not accepted).")
+        column = _column(spec, condition.get('column'))
+        kind = spec['columns'][column][0]
+        op = str(condition.get('op', '=')).lower()
+        if op not in OPERATORS:
+            raise QueryError(f"Unsupported operator: {op}")
+        value = condition.get('value')
+        if op == 'in':
+            if not isinstance(value, list) or not 0 < len(value) <= MAX_IN_VALUES:
+                raise QueryError(f"'in' takes a list of 1 to {MAX_IN_VALUES} values.")
+            value = sorted({_convert(v, kind, column) for v in value}, key=str)
+        elif op == 'is_null':
+            value = _convert(value if value is not None else True, 'bool', column)
+        elif op == 'like':
+            if kind != 'str':
+                raise QueryError(f"'like' only applies to text columns, not {column}.")
+            value = _convert(value, 'str', column)
+        else:
+            value = _convert(value, kind, column)
+        predicates.append((column, op, value))
+
+    order_by = data.get('order_by') or []
+    if not isinstance(order_by, list):
+        raise QueryError("order_by must be a list.")
+    order = [_order_entry(spec, entry) for entry in order_by]
+    if spec['key'] not in [column for column, _ in order]:
+        # The table key makes the order total, which keyset paging needs
+        order.append((spec['key'], order[-1][1] if order else 'asc'))
+
+    if data.get('offset') not in (None, '', 0, '0'):
+        raise QueryError("offset is not supported; page with the returned next_cursor instead.")
+    limit = data.get('limit', DEFAULT_LIMIT if max_limit == MAX_LIMIT else max_limit)
+    try:
+        limit = max(1, min(int(limit), max_limit))
+    except (TypeError, ValueError):
+        raise QueryError(f"Invalid limit: {limit!r}")
+
+    return {
+        'table': table,
+        'columns': columns,
+        'predicates': sorted(predicates, key=lambda p: (p[0], p[1], str(p[2]))),
+        'order': order,
+        'limit': limit,
+        'cursor': data.get('cursor') or None,
+    }
+
+
+def _cursor_values(spec, order, values):
+    """A decoded cursor's values converted to the types of the order columns; InvalidCursor if any does not fit."""
+    converted = []
+    for value, (column, _) in zip(values, order):
+        # Order columns are never NULL, so neither is a genuine cursor value
+        if value is None:
+            raise InvalidCursor("Invalid cursor.")
+        try:
+            converted.append(_convert(value, spec['columns'][column][0], column))
+        except QueryError:
+            raise InvalidCursor("Invalid cursor.")
+    return converted
+
+
+def build(query, student_id, stream=False):
+    """
+    (sql, params) for a normalized query. Raises pagination.InvalidCursor for a bad cursor.
+    Pages fetch one extra row and the order columns (for next_cursor); streams do not.
+    """
+    spec = TABLES[query['table']]
+    where, params = [], []
+    if spec['scope']:
+        where.append(f"`{spec['scope']}` = %s")
+        params.append(student_id)
+    for column, op, value in query['predicates']:
+        if op == 'in':
+            where.append(f"`{column}` IN %s")
+            params.append(tuple(value))
+        elif op == 'is_null':
+            where.append(f"`{column}` IS {'' if value else 'NOT '}NULL")
+        elif op == 'like':
+            where.append(f"`{column}` LIKE %s")
+            params.append(value)
+        else:
+            where.append(f"`{column}` {op} %s")
+            params.append(value)
+
+    order = query['order']
+    if query['cursor']:
+        last = _cursor_values(spec, order, decode_cursor(query['cursor'], len(order)))
+        # (a, b, c) after (x, y, z): a beyond x, or a = x and b beyond y, or ...
+        alternatives = []
+        for index, (column, direction) in enumerate(order):
+            terms = [f"`{c}` = %s" for c, _ in order[:index]]
+            terms.append(f"`{column}` {'>' if direction == 'asc' else '<'} %s")
+            alternatives.append("(" + " AND ".join(terms) + ")")
+            params.extend(last[:index + 1])
+        where.append("(" + " OR ".join(alternatives) + ")")
+
+    select = query['columns'] if stream else list(dict.fromkeys(query['columns'] + [column for column, _ in order]))
+    sql = (f"SELECT {', '.join(f'`{c}`' for c in select)} FROM `{query['table']}`"
+           f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+           f" ORDER BY {', '.join(f'`{c}` {d.upper()}' for c, d in order)}"
+           f" LIMIT %s")
+    params.append(query['limit'] if stream else query['limit'] + 1)
+    return sql, params
+
+
+def build_stream(data, student_id):
+    """(sql, params) for exporting a query's rows, up to MAX_STREAM_ROWS, with core.streaming."""
+    return build(normalize(data, max_limit=MAX_STREAM_ROWS), student_id, stream=True)
+
+
+def _cache_key(query, student_id):
+    spec = TABLES[query['table']]
+    if spec['scope']:
+        version = f"s{student_id}:{get_version(dashboard.NAMESPACE, student_id)}"
+    else:
+        version = f"c{get_version(catalog.NAMESPACE, 'all')}"
+    digest = hashlib.sha256(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()
+    return f"dynamic_query:{version}:{digest}"
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def execute(cursor, data, student_id):
+    """Run a query description. Returns (rows, next_cursor); raises QueryError / InvalidCursor."""
+    query = normalize(data)
+    key = _cache_key(query, student_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    sql, params = build(query, student_id)
+    cursor.execute(sql, params)
+    names = [col[0] for col in cursor.description]
+    rows = [dict(zip(names, (_jsonable(v) for v in row))) for row in cursor.fetchmany(query['limit'] + 1)]
+
+    next_cursor = None
+    if len(rows) > query['limit']:
+        rows = rows[:query['limit']]
+        next_cursor = encode_cursor([rows[-1][column] for column, _ in query['order']])
+    hidden = set(names) - set(query['columns'])
+    rows = [{k: v for k, v in row.items() if k not in hidden} for row in rows]
+
+    cache.set(key, (rows, next_cursor), settings.DYNAMIC_QUERY_CACHE_TTL)
+    return rows, next_cursor
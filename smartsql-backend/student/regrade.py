@@ -0,0 +1,273 @@
+"""
+Background regrading of an exercise's stored submissions.
+
+When an instructor changes an exercise's expected answer or dataset, every
+verdict already stored for it may be wrong. enqueue() records a Regrade_Job
+and queues a background task (core.tasks) that runs it, so the request returns
+immediately and a job interrupted by a restart is picked up again.
+
+A job collects the answers in Student_Exercise (each student's latest) and in
+the Submission history, and grades each distinct answer once: identical
+answers (up to surrounding whitespace) share a verdict. The grading calls run
+in parallel on a process pool of REGRADE_WORKERS processes, each taking a chunk
+of answers at a time so they share AI grading batches, and the job's row is
+updated with progress as chunks finish. The regrade task is only run by
+`manage.py run_tasks`, never by a web process's inline workers, so the pool
+lives in the worker's container.
+
+The new verdicts are swapped in in one transaction: Student_Exercise and
+Submission rows, best_score, the progress rollups of students whose result
+flipped, and their solved / dashboard caches. Rows a student resubmitted in the
+meantime (their answer was not part of the job) are left alone, and if the
+exercise changed again while the job ran, the job is marked superseded and
+writes nothing; the newer job will. Answers the AI could not grade keep their
+old verdict and are counted in failed_answers.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import dashboard, progress, solved, tasks
+from core.catalog import parse_table_schema
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+
+BATCH_SIZE = 1000
+# Lease of a regrade task: long enough for a large exercise, and a crashed one is retried
+TASK_TIMEOUT = 3600
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # A grading process never claims tasks itself (no nested regrades and pools)
+    os.environ['TASK_INLINE_WORKERS'] = '0'
+    import django
+    django.setup()
+
+
+def _grade_chunk(answers, expected_answer, table_schema):
+    """Grade distinct answers; None for those the AI could not grade. Runs in a worker process."""
+    from student import grading
+    verdicts = grading.grade_many(answers, expected_answer, table_schema, strict=True)
+    return answers, [(bool(v[0]), float(v[1]), v[2]) if v is not None else None for v in verdicts]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the web process has threads and open connections
+            _pool = ProcessPoolExecutor(max_workers=settings.REGRADE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+        return _pool
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def enqueue(cursor, exercise_id, requested_by=None):
+    """Create a regrade job for the exercise; a worker starts it once the current transaction commits."""
+    cursor.execute("""
+        INSERT INTO Regrade_Job (exercise_id, status, requested_by)
+        VALUES (%s, %s, %s)
+    """, [exercise_id, QUEUED, requested_by])
+    job_id = cursor.lastrowid
+    tasks.enqueue(cursor, 'regrade', {'job_id': job_id}, created_by=requested_by)
+    return job_id
+
+
+# Not inline: the process pool belongs in a run_tasks worker, not in a web container
+@tasks.task('regrade', priority=tasks.LOW, max_attempts=3, timeout=TASK_TIMEOUT, inline=False)
+def run_task(job_id):
+    """Task handler. Errors propagate so the task is retried; the job stays queued until the last attempt fails."""
+    try:
+        _run(job_id)
+    except Exception as e:
+        _failed(job_id, e, final=tasks.is_last_attempt())
+        raise
+    with connection.cursor() as cursor:
+        job = get_job(cursor, job_id)
+    return {'status': job['status'] if job else None}
+
+
+def get_job(cursor, job_id=None, exercise_id=None):
+    """A job as a dict (by id, or the exercise's latest), or None."""
+    if job_id is not None:
+        cursor.execute("SELECT * FROM Regrade_Job WHERE job_id = %s", [job_id])
+    else:
+        cursor.execute("SELECT * FROM Regrade_Job WHERE exercise_id = %s ORDER BY job_id DESC LIMIT 1",
+                       [exercise_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([col[0] for col in cursor.description], row))
+
+
+def _update_job(job_id, stamp=None, **fields):
+    """Update a job's columns; stamp names a timestamp column (started_at / finished_at) to set to NOW()."""
+    assignments = [f"{name} = %s" for name in fields] + ([f"{stamp} = NOW()"] if stamp else [])
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE Regrade_Job SET {', '.join(assignments)} WHERE job_id = %s",
+                       [*fields.values(), job_id])
+
+
+def run(job_id):
+    """Run a job to completion in the foreground; on error it is marked failed."""
+    try:
+        _run(job_id)
+    except Exception as e:
+        _failed(job_id, e, final=True)
+
+
+def _failed(job_id, error, final):
+    """Record a failed run: the job is failed for good, or back in the queue for the task's next attempt."""
+    global _pool
+    print(f"❌ Regrade job {job_id} failed{'' if final else ', will retry'}: {error}")
+    if isinstance(error, BrokenProcessPool):
+        with _pool_lock:
+            _pool = None
+    if final:
+        _update_job(job_id, stamp='finished_at', status=FAILED, error=str(error)[:1000])
+    else:
+        _update_job(job_id, status=QUEUED, error=str(error)[:1000])
+
+
+def _exercise_version(cursor, exercise_id, lock=False):
+    cursor.execute(f"""
+        SELECT e.expected_answer, e.dataset_hash, d.table_schema
+        FROM Exercise e LEFT JOIN Dataset d ON e.dataset_hash = d.dataset_hash
+        WHERE e.exercise_id = %s{' FOR UPDATE' if lock else ''}
+    """, [exercise_id])
+    return cursor.fetchone()
+
+
+def _distinct_answers(cursor, exercise_id):
+    """{normalized answer: set of stored spellings}, and the number of stored submissions."""
+    answers, total = {}, 0
+    for table in ('Student_Exercise', 'Submission'):
+        cursor.execute(f"""
+            SELECT submitted_answer, COUNT(*) FROM {table}
+            WHERE exercise_id = %s AND submitted_answer IS NOT NULL
+            GROUP BY submitted_answer
+        """, [exercise_id])
+        for answer, count in cursor.fetchall():
+            answers.setdefault(answer.strip(), set()).add(answer)
+            total += count
+    return answers, total
+
+
+def _run(job_id):
+    with connection.cursor() as cursor:
+        job = get_job(cursor, job_id)
+        if job is None or job['status'] not in (QUEUED, RUNNING):
+            return
+        exercise_id = job['exercise_id']
+        version = _exercise_version(cursor, exercise_id)
+        if version is None:
+            _update_job(job_id, stamp='finished_at', status=SUPERSEDED)
+            return
+        expected_answer, _, table_schema = version
+        answers, total = _distinct_answers(cursor, exercise_id)
+
+    _update_job(job_id, stamp='started_at', status=RUNNING, total_submissions=total,
+                distinct_answers=len(answers), graded_answers=0)
+    print(f"🔁 Regrade job {job_id}: exercise {exercise_id}, {total} submissions, {len(answers)} distinct answers")
+
+    schema = parse_table_schema(table_schema)
+    pool = _get_pool()
+    distinct = [answer for answer in answers if answer]
+    chunk_size = settings.AI_GRADING_BATCH_SIZE * settings.AI_GRADING_CONCURRENCY
+    futures = [pool.submit(_grade_chunk, chunk, expected_answer, schema) for chunk in _chunks(distinct, chunk_size)]
+    verdicts, graded, failed = {}, 0, 0
+    last_report = time.monotonic()
+    for future in as_completed(futures):
+        for answer, verdict in zip(*future.result()):
+            if verdict is None:
+                failed += 1
+            else:
+                verdicts[answer] = verdict
+        graded += chunk_size
+        if time.monotonic() - last_report >= 1:
+            _update_job(job_id, graded_answers=min(graded, len(distinct)), failed_answers=failed)
+            last_report = time.monotonic()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        current = _exercise_version(cursor, exercise_id, lock=True)
+        if current is None or current[:2] != version[:2]:
+            status, changed = SUPERSEDED, 0
+        else:
+            status, changed = DONE, _swap(cursor, exercise_id, answers, verdicts)
+    _update_job(job_id, stamp='finished_at', status=status, graded_answers=len(distinct), failed_answers=failed,
+                changed_submissions=changed, error=None)
+    print(f"✅ Regrade job {job_id}: {status}, {changed} verdicts changed, {failed} answers could not be graded")
+
+
+def _swap(cursor, exercise_id, answers, verdicts):
+    """Write the new verdicts and fix rollups and caches; must run inside transaction.atomic."""
+    cursor.execute("""
+        SELECT id, student_id, submitted_answer, is_correct, score, ai_feedback
+        FROM Student_Exercise
+        WHERE exercise_id = %s
+        ORDER BY id
+        FOR UPDATE
+    """, [exercise_id])
+    updates, students, flipped = [], set(), []
+    for row_id, student_id, answer, was_correct, score, feedback in cursor.fetchall():
+        verdict = verdicts.get((answer or '').strip())
+        if verdict is None:
+            continue
+        is_correct, new_score, new_feedback = verdict
+        if bool(was_correct) == is_correct and score is not None and float(score) == new_score \
+                and feedback == new_feedback:
+            continue
+        updates.append((is_correct, new_score, new_feedback, row_id))
+        students.add(student_id)
+        if bool(was_correct) != is_correct:
+            flipped.append((student_id, bool(was_correct), is_correct))
+
+    for chunk in _chunks(updates):
+        cursor.executemany("""
+            UPDATE Student_Exercise SET is_correct = %s, score = %s, ai_feedback = %s WHERE id = %s
+        """, chunk)
+    for student_id, was_correct, is_correct in flipped:
+        progress.record_exercise_result(cursor, student_id, exercise_id, was_correct, is_correct)
+
+    changed = len(updates)
+    for answer, verdict in verdicts.items():
+        is_correct, score, feedback = verdict
+        cursor.execute("""
+            UPDATE Submission SET is_correct = %s, score = %s, ai_feedback = %s
+            WHERE exercise_id = %s AND submitted_answer IN %s
+              AND NOT (is_correct <=> %s AND score <=> %s AND ai_feedback <=> %s)
+        """, [is_correct, score, feedback, exercise_id, tuple(answers[answer]), is_correct, score, feedback])
+        changed += cursor.rowcount
+
+    # The best score over the regraded history (or the latest attempt, if the history is empty)
+    cursor.execute("""
+        UPDATE Student_Exercise se
+        LEFT JOIN (
+            SELECT student_id, MAX(score) AS best FROM Submission WHERE exercise_id = %s GROUP BY student_id
+        ) b ON b.student_id = se.student_id
+        SET se.best_score = COALESCE(GREATEST(b.best, se.score), b.best, se.score)
+        WHERE se.exercise_id = %s
+    """, [exercise_id, exercise_id])
+
+    if students:
+        solved.invalidate(*students)
+        dashboard.invalidate(*students)
+    return changed
@@ -0,0 +1,310 @@
+"""
+Practice sandboxes: run a student's SELECT against sample data, never the real database.
+
+An exercise's table_schema lists its tables and columns, e.g.
+[{"name": "employees", "columns": ["id", "name", "department", "salary"]}].
+From it we build an in-memory SQLite database filled with deterministic sample
+rows (columns may also be {"name": ..., "type": ...} objects, and a table may
+bring its own "rows"). Building one is the slow part, so each distinct schema
+is built once and kept as a template in an LRU pool of SANDBOX_POOL_SIZE
+entries; every run gets a private copy made with SQLite's online backup API,
+which for these sizes takes well under a millisecond.
+
+Templates are keyed by the dataset's content hash (core/datasets.py) and also
+written to SANDBOX_IMAGE_DIR as SQLite files, so a restarted or freshly forked
+worker loads a prebuilt image instead of generating the data again. Images are
+named after IMAGE_VERSION too; bump it when the sample data generation changes.
+
+Each run is capped: an authorizer only permits reading (no writes, PRAGMA or
+ATTACH), a progress handler aborts queries running longer than
+SANDBOX_TIMEOUT_MS, at most SANDBOX_MAX_ROWS rows are returned, and SQLite's
+heap is limited to SANDBOX_HEAP_LIMIT_MB for the whole process.
+
+Queries run in SQLite's dialect, which covers the standard SELECT features the
+exercises use but not MySQL-only functions. BLOB results are returned as hex
+strings so every row can be rendered as JSON.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from core.datasets import content_hash
+
+IMAGE_VERSION = 1
+
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+if hasattr(sqlite3, 'SQLITE_RECURSIVE'):
+    _ALLOWED_ACTIONS.add(sqlite3.SQLITE_RECURSIVE)
+
+_FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'David', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy']
+_LAST_NAMES = ['Smith', 'Johnson', 'Lee', 'Brown', 'Garcia', 'Miller', 'Davis', 'Wilson', 'Moore', 'Clark']
+_DEPARTMENTS = ['Engineering', 'Sales', 'Marketing', 'HR', 'Finance']
+_CITIES = ['Boston', 'Seattle', 'Austin', 'Denver', 'Chicago']
+
+
+class SandboxError(Exception):
+    """The query was rejected or failed; the message is safe to show the student."""
+
+
+def _name(value):
+    return value.get('name') if isinstance(value, dict) else value
+
+
+def _quote(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _sample_value(column, kind, index, rng, row_count, is_key=False):
+    """A plausible value for a column, guessed from its declared type or its name."""
+    name = column.lower()
+    kind = (kind or '').lower()
+    if is_key:
+        return index
+    if name == 'id' or name.endswith('_id'):
+        # Foreign keys point at the 1..row_count keys of the other tables
+        return rng.randint(1, row_count)
+    if 'first_name' in name:
+        return rng.choice(_FIRST_NAMES)
+    if 'last_name' in name:
+        return rng.choice(_LAST_NAMES)
+    if name in ('name', 'full_name', 'student_name', 'employee_name', 'customer_name'):
+        return f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+    if 'email' in name:
+        return f"user{index}@example.com"
+    if 'department' in name or name == 'dept':
+        return rng.choice(_DEPARTMENTS)
+    if 'city' in name:
+        return rng.choice(_CITIES)
+    if 'date' in name or name.endswith('_at') or kind in ('date', 'datetime', 'timestamp'):
+        return (date(2024, 1, 1) + timedelta(days=rng.randint(0, 364))).isoformat()
+    if any(word in name for word in ('salary', 'price', 'amount', 'total', 'cost', 'balance')) \
+            or kind.startswith(('decimal', 'float', 'double', 'real', 'numeric')):
+        return round(rng.uniform(10, 10000), 2)
+    if any(word in name for word in ('age', 'count', 'quantity', 'qty', 'year', 'score', 'rank')) \
+            or kind.startswith(('int', 'bigint', 'smallint', 'tinyint')):
+        return rng.randint(1, 100)
+    return f"{column}_{index}"
+
+
+def _build(table_schema):
+    """A fresh in-memory database holding the schema's tables and sample rows."""
+    db = sqlite3.connect(':memory:', check_same_thread=False)
+    rng = random.Random(content_hash(table_schema))
+    row_count = settings.SANDBOX_SAMPLE_ROWS
+    try:
+        for table in table_schema:
+            if not isinstance(table, dict) or not table.get('name') or not table.get('columns'):
+                raise SandboxError("This exercise's table schema cannot be turned into a sandbox.")
+            columns = [c if isinstance(c, dict) else {'name': c} for c in table['columns']]
+            names = [str(_name(c)) for c in columns]
+            definitions = [f"{_quote(name)} {c.get('type') or ''}".strip() for name, c in zip(names, columns)]
+            db.execute(f"CREATE TABLE {_quote(table['name'])} ({', '.join(definitions)})")
+            rows = table.get('rows')
+            if rows is None:
+                # The first column is taken as the table's key when it looks like one
+                key = names[0].lower() == 'id' or names[0].lower().endswith('_id')
+                rows = [[_sample_value(name, c.get('type'), i, rng, row_count, is_key=key and n == 0)
+                         for n, (name, c) in enumerate(zip(names, columns))]
+                        for i in range(1, row_count + 1)]
+            rows = [[row.get(n) for n in names] if isinstance(row, dict) else list(row) for row in rows]
+            db.executemany(f"INSERT INTO {_quote(table['name'])} VALUES ({', '.join('?' * len(names))})", rows)
+        db.commit()
+    except (sqlite3.Error, TypeError) as e:
+        db.close()
+        raise SandboxError(f"This exercise's table schema cannot be turned into a sandbox: {e}")
+    except SandboxError:
+        db.close()
+        raise
+    return db
+
+
+def image_path(key):
+    image_dir = settings.SANDBOX_IMAGE_DIR
+    return os.path.join(image_dir, f"{key}.v{IMAGE_VERSION}.sqlite3") if image_dir else None
+
+
+def _load_image(key):
+    path = image_path(key)
+    if not path or not os.path.exists(path):
+        return None
+    db = sqlite3.connect(':memory:', check_same_thread=False)
+    try:
+        image = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            image.backup(db)
+        finally:
+            image.close()
+        return db
+    except sqlite3.Error as e:
+        print(f"⚠️ Ignoring unreadable sandbox image {path}: {e}")
+        db.close()
+        return None
+
+
+def _save_image(key, db):
+    path = image_path(key)
+    if not path or os.path.exists(path):
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename, so other workers never open a half-written image
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image = sqlite3.connect(partial)
+        try:
+            db.backup(image)
+        finally:
+            image.close()
+        os.replace(partial, path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ Could not save sandbox image {path}: {e}")
+
+
+def prebuild(table_schema, key=None):
+    """Write the on-disk image for a dataset if it is missing; returns its path (None if images are off)."""
+    key = key or content_hash(table_schema)
+    path = image_path(key)
+    if path and not os.path.exists(path):
+        db = _build(table_schema)
+        try:
+            _save_image(key, db)
+        finally:
+            db.close()
+    return path
+
+
+class _Template:
+    """A template database and the lock serializing backups from it and its closing."""
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def close(self):
+        # Waits for a backup in progress; later checkouts see `closed` and fetch a new template
+        with self.lock:
+            self.closed = True
+            self.db.close()
+
+
+class SandboxPool:
+    """LRU cache of template databases, one per distinct schema."""
+
+    def __init__(self, size):
+        self.size = size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _template(self, table_schema, key):
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry is not None:
+                self._templates.move_to_end(key)
+                return entry
+        # Build outside the pool lock; a racing builder just loses to the first insert
+        db = _load_image(key)
+        if db is None:
+            db = _build(table_schema)
+            _save_image(key, db)
+        built = _Template(db)
+        evicted = []
+        with self._lock:
+            entry = self._templates.setdefault(key, built)
+            self._templates.move_to_end(key)
+            # Never evict the entry being returned, even with SANDBOX_POOL_SIZE below 1
+            while len(self._templates) > max(self.size, 1):
+                evicted.append(self._templates.popitem(last=False)[1])
+        if entry is not built:
+            evicted.append(built)
+        # Closed outside the pool lock: close() waits for backups running from them
+        for old in evicted:
+            old.close()
+        return entry
+
+    def checkout(self, table_schema, key=None):
+        """A private, disposable copy of the schema's sample database."""
+        key = key or content_hash(table_schema)
+        clone = sqlite3.connect(':memory:', check_same_thread=False)
+        while True:
+            template = self._template(table_schema, key)
+            with template.lock:
+                # Evicted between lookup and lock: look it up again
+                if not template.closed:
+                    template.db.backup(clone)
+                    return clone
+
+
+pool = SandboxPool(settings.SANDBOX_POOL_SIZE)
+
+_heap_limited = False
+
+
+def _jsonable(value):
+    # BLOBs (randomblob(), zeroblob(), X'..' literals) come back as bytes, shown as hex
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def _limit_heap(db):
+    global _heap_limited
+    if not _heap_limited:
+        # Process-wide limit on SQLite's heap, shared by all sandboxes
+        db.execute(f"PRAGMA hard_heap_limit = {settings.SANDBOX_HEAP_LIMIT_MB * 1024 * 1024}")
+        _heap_limited = True
+
+
+def _authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def run(table_schema, query, key=None):
+    """
+    Run a read-only query in a sandbox for the schema (key: its dataset hash, if known). Returns
+    {'columns', 'rows', 'truncated', 'elapsed_ms'}; raises SandboxError.
+    """
+    if not table_schema:
+        raise SandboxError("This exercise has no sample tables to run queries against.")
+    query = (query or '').strip().rstrip(';')
+    if not query:
+        raise SandboxError("Please provide a query.")
+
+    db = pool.checkout(table_schema, key)
+    try:
+        _limit_heap(db)
+        db.set_authorizer(_authorizer)
+        deadline = time.monotonic() + settings.SANDBOX_TIMEOUT_MS / 1000
+        # Checked every 1000 VM instructions; a non-zero return interrupts the query
+        db.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+
+        started = time.perf_counter()
+        try:
+            cursor = db.execute(query)
+            if cursor.description is None:
+                raise SandboxError("Only SELECT queries can be run.")
+            rows = cursor.fetchmany(settings.SANDBOX_MAX_ROWS + 1)
+        except sqlite3.DatabaseError as e:
+            if time.monotonic() > deadline:
+                raise SandboxError(f"Query exceeded the {settings.SANDBOX_TIMEOUT_MS} ms time limit.")
+            if 'not authorized' in str(e):
+                raise SandboxError("Only SELECT queries can be run.")
+            raise SandboxError(str(e))
+        except (sqlite3.Warning, MemoryError) as e:
+            raise SandboxError(f"Query rejected: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        truncated = len(rows) > settings.SANDBOX_MAX_ROWS
+        return {
+            'columns': [col[0] for col in cursor.description],
+            'rows': [[_jsonable(value) for value in row] for row in rows[:settings.SANDBOX_MAX_ROWS]],
+            'truncated': truncated,
+            'elapsed_ms': round(elapsed_ms, 2),
+        }
+    finally:
+        db.close()
@@ -0,0 +1,68 @@
+"""
+Recording graded submissions, inline or from a background task.
+
+record() is everything that follows grading a submission: the Student_Exercise
+upsert (core.submission_store), the solved / dashboard caches, the course's
+live feed and the Submission history. The submit view calls it inline; with
+?async=1 it queues grade_submission instead and answers 202 with the task's
+status URL, where the verdict shows up once a worker has graded it. Workers
+grading side by side share AI grading batches (see student/grading.py).
+
+A task may be retried after its writes committed, so grade_submission makes
+them in one transaction with tasks.checkpoint(): a retry finds the stored
+verdict and returns it instead of counting the attempt again.
+"""
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import catalog, dashboard, solved, submission_feed, submission_log, submission_store, tasks
+from core.models import Users
+from student import grading
+
+
+def max_request_seconds():
+    """Longest a synchronous submit can block: AI grading (batch wait included), then both commit waits."""
+    return (settings.AI_GRADING_TIMEOUT + math.ceil(settings.AI_GRADING_BATCH_MS / 1000)
+            + settings.SUBMISSION_WRITE_TIMEOUT + settings.SUBMISSION_LOG_TIMEOUT)
+
+
+def _notify(user, exercise_id, is_correct, score):
+    """Caches and the live feed; all of it takes effect once the submission commits."""
+    solved.invalidate(user.user_id)
+    dashboard.invalidate(user.user_id)
+    submission_feed.publish_submission(user, exercise_id, is_correct, score)
+
+
+def record(user, exercise_id, course_id, answer, is_correct, score, feedback):
+    """Persist a graded submission; returns once the Student_Exercise row has committed."""
+    # Inline, or group-committed with other requests when SUBMISSION_WRITE_BUFFER is on
+    submission_store.save(user.user_id, exercise_id, answer, is_correct, score, feedback)
+    print(f"Successfully inserted/updated Student_Exercise for student {user.user_id}, exercise {exercise_id}")
+
+    _notify(user, exercise_id, is_correct, score)
+    # 每次提交都追加到 Submission 历史（批量写入，等待本批提交完成）
+    submission_log.append(user.user_id, exercise_id, course_id, answer, is_correct, score, feedback)
+
+
+@tasks.task('grade_submission', priority=tasks.HIGH, max_attempts=3)
+def grade_submission(student_id, exercise_id, answer):
+    """Task handler: grade and record one submission, returning the verdict as the task result."""
+    exercise = catalog.get_exercise(exercise_id)
+    if not exercise:
+        raise LookupError(f"Exercise {exercise_id} not found")
+    user = Users.objects.get(user_id=student_id)
+    is_correct, score, feedback, graded_by = grading.grade(answer, exercise['expected_answer'],
+                                                           exercise['table_schema'])
+    result = {'is_correct': is_correct, 'score': score, 'feedback': feedback, 'graded_by': graded_by}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        earlier = tasks.checkpoint(cursor, result)
+        if earlier is not None:
+            return earlier
+        submission_store.write_batch(cursor, [(student_id, exercise_id, answer, bool(is_correct), score, feedback)])
+        submission_log.write_rows(cursor, [submission_log.row(
+            student_id, exercise_id, exercise['course_id'], answer, is_correct, score, feedback)])
+        _notify(user, exercise_id, is_correct, score)
+    return result
@@ -9,6 +9,8 @@ urlpatterns = [
     path('api/student/courses/<int:course_id>/modules/<int:module_id>/exercises/', views.module_exercises_api, name='module_exercises'),
     path('api/student/exercises/<int:exercise_id>/submit/', views.submit_exercise_api, name='submit_exercise'),
     path('api/student/exercises/<int:exercise_id>/', views.get_exercise_detail, name='get_exercise_detail'),
+    path('api/student/exercises/<int:exercise_id>/submissions/', views.student_exercise_submissions_api, name='student_exercise_submissions'),
+    path('api/student/exercises/<int:exercise_id>/run/', views.run_exercise_query_api, name='run_exercise_query'),
     
     # 新增的API路由
     path('api/student/dashboard/', views.student_dashboard_api, name='student_dashboard'),
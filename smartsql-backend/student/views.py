@@ -2,9 +2,10 @@ from datetime import timezone
 from django.shortcuts import render
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes
 from core.models import Student_Exercise, Users, Student, Instructor
 from core.authentication import CustomJWTAuthentication
+from core import catalog, course_search, dashboard, enrollment, idempotency, inbox, pagination, progress, solved, streaming, submission_log, tasks
 from rest_framework.response import Response
 from rest_framework import status
 from config import messages as msg
@@ -12,61 +13,35 @@ from django.db.models import Q
 from django.db import connection, transaction
 from rest_framework.response import Response
 from rest_framework import status
-import json
-from openai import OpenAI, OpenAIError, APIError
-from django.conf import settings
+from student import grading, query_builder, sandbox, submissions
 
 # Create your views here.
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
+@renderer_classes(streaming.STREAM_RENDERERS)
 def dynamic_sql_query_api(request):
+    """
+    POST: 结构化查询（表/列白名单、参数化条件、LIMIT 上限、游标分页、结果缓存），
+    格式见 student/query_builder.py。?format=ndjson|csv 时逐块流式输出（不缓存）
+    """
     try:
-        # 获取请求参数
-        table_name = request.data.get('table_name')
-        columns = request.data.get('columns', [])
-        conditions = request.data.get('conditions', [])
-        order_by = request.data.get('order_by', [])
-        limit = request.data.get('limit')
-        offset = request.data.get('offset')
-
-        # 构建基础SQL查询
-        base_query = "SELECT "
-        
-        # 添加列
-        if columns:
-            base_query += ", ".join(columns)
-        else:
-            base_query += "*"
-            
-        base_query += f" FROM {table_name}"
-        
-        # 添加条件
-        if conditions:
-            base_query += " WHERE " + " AND ".join(conditions)
-            
-        # 添加排序
-        if order_by:
-            base_query += " ORDER BY " + ", ".join(order_by)
-            
-        # 添加分页
-        if limit is not None:
-            base_query += f" LIMIT {limit}"
-            if offset is not None:
-                base_query += f" OFFSET {offset}"
-                
-        # 执行查询
+        fmt = streaming.wants_stream(request)
+        if fmt:
+            sql, params = query_builder.build_stream(request.data, request.user.user_id)
+            return streaming.stream_query(request, sql, params, fmt, filename=request.data.get('table_name'))
+
         with connection.cursor() as cursor:
-            cursor.execute(base_query)
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
+            results, next_cursor = query_builder.execute(cursor, request.data, request.user.user_id)
+
         return Response({
             'status': 'success',
             'data': results,
-            'query': base_query
+            'next_cursor': next_cursor
         }, status=status.HTTP_200_OK)
-            
+
+    except (query_builder.QueryError, pagination.InvalidCursor) as e:
+        return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         print(f"❌ Error in dynamic_sql_query_api: {str(e)}") 
         return Response({
@@ -95,16 +70,16 @@ def student_courses_api(request):
                     c.state,
                     i.user_id as instructor_id, -- 获取 instructor 的 user_id
                     CONCAT(i.first_name, ' ', i.last_name) as instructor_name, -- 获取 instructor 的全名
-                    (SELECT COUNT(*) 
-                     FROM Module m 
-                     WHERE m.course_id = c.course_id) AS total_modules,
-                    (SELECT COUNT(*) 
-                     FROM Module_Exercise me
-                     JOIN Module m ON me.module_id = m.module_id
-                     WHERE m.course_id = c.course_id) AS total_exercises
+                    COALESCE(cs.module_count, 0) AS total_modules,
+                    -- 进度来自增量维护的 Student_Course 汇总行
+                    COALESCE(sc.total_exercises, 0) AS total_exercises,
+                    COALESCE(sc.completed_exercises, 0) AS completed_exercises,
+                    COALESCE(sc.progress, 0) AS progress
                 FROM Course c
                 JOIN Enrollment e ON c.course_id = e.course_id
                 JOIN Users i ON c.instructor_id = i.user_id -- JOIN Users 表获取 instructor 信息
+                LEFT JOIN Student_Course sc ON sc.course_id = c.course_id AND sc.student_id = e.student_id
+                LEFT JOIN Course_Stats cs ON cs.course_id = c.course_id
                 WHERE e.student_id = %s AND e.status = 'enrolled'
                 ORDER BY c.year DESC, c.term DESC
             """, [student_id])
@@ -167,39 +142,22 @@ def course_modules_api(request, course_id):
             course_columns = [col[0] for col in cursor.description]
             course = dict(zip(course_columns, course_row))
             
-            # 获取模块信息
-            cursor.execute("""
-                SELECT 
-                    m.module_id,
-                    m.module_name,
-                    m.module_description,
-                    COUNT(DISTINCT me.exercise_id) as total_exercises,
-                    COUNT(DISTINCT CASE WHEN se.is_correct = TRUE THEN me.exercise_id END) as completed_exercises,
-                    CASE 
-                        WHEN m.module_id = (SELECT MIN(module_id) FROM Module WHERE course_id = m.course_id) THEN 0
-                        WHEN EXISTS (
-                            SELECT 1 
-                            FROM Module prev_m
-                            JOIN Module_Exercise prev_me ON prev_m.module_id = prev_me.module_id
-                            LEFT JOIN Student_Exercise prev_se ON prev_me.exercise_id = prev_se.exercise_id 
-                                AND prev_se.student_id = %s AND prev_se.is_correct = TRUE
-                            WHERE prev_m.course_id = m.course_id 
-                              AND prev_m.module_id < m.module_id
-                              AND prev_se.id IS NULL
-                        ) THEN 1
-                        ELSE 0
-                    END as locked
-                FROM Module m
-                LEFT JOIN Module_Exercise me ON m.module_id = me.module_id
-                LEFT JOIN Student_Exercise se ON me.exercise_id = se.exercise_id 
-                    AND se.student_id = %s
-                WHERE m.course_id = %s
-                GROUP BY m.module_id, m.module_name, m.module_description
-                ORDER BY m.module_id
-            """, [student_id, student_id, course_id])
-            
-            module_columns = [col[0] for col in cursor.description]
-            modules = [dict(zip(module_columns, row)) for row in cursor.fetchall()]
+        # 获取模块信息：模块来自目录缓存，完成数 = 学生已答对位图与模块练习位图的交集计数
+        solved_set = solved.get(student_id)
+        modules = []
+        for entry in sorted(catalog.course_modules(course_id), key=lambda m: m['module_id']):
+            total = len(entry['exercise_ids'])
+            completed = solved_set.count_solved(entry['exercise_mask'])
+            modules.append({
+                'module_id': entry['module_id'],
+                'module_name': entry['module_name'],
+                'module_description': entry['module_description'],
+                'total_exercises': total,
+                'completed_exercises': completed,
+                'progress': round(100 * completed / total, 2) if total else 0,
+            })
+        # 单次有序遍历计算锁定状态，替代逐模块的关联 EXISTS 子查询
+        progress.annotate_locks(modules)
             
         return Response({
             'status': 'success',
@@ -224,7 +182,7 @@ def module_exercises_api(request, course_id, module_id):
     try:
         student_id = request.user.user_id
         print("✅ 当前用户 ID", student_id)
-        # 验证学生是否注册了该课程
+        # 验证学生是否注册了该课程，并取出该学生在此模块中已答对的练习
         with connection.cursor() as cursor:
             cursor.execute("""
                 SELECT COUNT(*) 
@@ -234,68 +192,32 @@ def module_exercises_api(request, course_id, module_id):
             if cursor.fetchone()[0] == 0:
                 return Response({'error': 'Not enrolled in this course.'}, status=status.HTTP_403_FORBIDDEN)
 
-        # 获取模块和课程信息
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT m.module_id, m.module_name, m.module_description,
-                       c.course_name, c.course_code
-                FROM Module m
-                JOIN Course c ON m.course_id = c.course_id
-                WHERE m.module_id = %s AND m.course_id = %s
-            """, [module_id, course_id])
-            
-            module_info = cursor.fetchone()
-            if not module_info:
-                return Response({'error': 'Module not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            module = {
-                'module_id': module_info[0],
-                'module_name': module_info[1],
-                'module_description': module_info[2],
-                'course_name': module_info[3],
-                'course_code': module_info[4]
-            }
-
-        # 获取练习列表和完成状态
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    e.exercise_id, 
-                    e.title, 
-                    e.description, 
-                    e.hint,
-                    e.difficulty, 
-                    e.table_schema, 
-                    e.expected_answer,
-                    CASE WHEN se.exercise_id IS NOT NULL THEN 1 ELSE 0 END AS completed
-                FROM Exercise e
-                JOIN Module_Exercise me 
-                ON e.exercise_id = me.exercise_id
-                LEFT JOIN (
-                    -- 只选出"答对(is_correct=TRUE或=1)"的记录
-                    SELECT exercise_id
-                    FROM Student_Exercise 
-                    WHERE student_id = %s 
-                    AND is_correct = 1    -- 或 is_correct = TRUE，看你的存储类型而定
-                    GROUP BY exercise_id
-                ) se 
-                ON e.exercise_id = se.exercise_id
-                WHERE me.module_id = %s
-                ORDER BY me.display_order
-            """, [student_id, module_id])
-            
-            columns = [col[0] for col in cursor.description]
-            exercises = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
-            # 处理 table_schema
-            for exercise in exercises:
-                if exercise['table_schema']:
-                    try:
-                        exercise['table_schema'] = json.loads(exercise['table_schema'])
-                    except json.JSONDecodeError:
-                        exercise['table_schema'] = []
-                else:
-                    exercise['table_schema'] = []
+        # 模块和练习的静态内容来自进程内目录缓存
+        module_entry = catalog.get_module(module_id)
+        if not module_entry or module_entry['course_id'] != course_id:
+            return Response({'error': 'Module not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        module = {
+            'module_id': module_entry['module_id'],
+            'module_name': module_entry['module_name'],
+            'module_description': module_entry['module_description'],
+            'course_name': module_entry['course_name'],
+            'course_code': module_entry['course_code']
+        }
+
+        # 只叠加完成状态（"答对"的练习）
+        solved_set = solved.get(student_id)
+
+        exercises = [{
+            'exercise_id': e['exercise_id'],
+            'title': e['title'],
+            'description': e['description'],
+            'hint': e['hint'],
+            'difficulty': e['difficulty'],
+            'table_schema': e['table_schema'],
+            'expected_answer': e['expected_answer'],
+            'completed': 1 if solved_set.is_solved(e['exercise_id']) else 0,
+        } for e in catalog.module_exercises(module_id)]
         
         return Response({
             'status': 'success',
@@ -317,6 +239,8 @@ def module_exercises_api(request, course_id, module_id):
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotency.idempotent('submit_exercise', lambda request, exercise_id: idempotency.fingerprint(
+    exercise_id, (request.data.get('answer') or '').strip()), claim_seconds=submissions.max_request_seconds)
 def submit_exercise_api(request, exercise_id):
     try:
         student_id = request.user.user_id
@@ -325,20 +249,30 @@ def submit_exercise_api(request, exercise_id):
         if not student_answer:
             return Response({'status': 'error', 'message': 'Please provide an answer.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Get exercise details needed for validation and grading
+        exercise = catalog.get_exercise(exercise_id)
+        if not exercise:
+            return Response({'status': 'error', 'message': 'Exercise not found.'}, status=status.HTTP_404_NOT_FOUND)
+        expected_answer = exercise['expected_answer']
+        table_schema = exercise['table_schema']
+        course_id_associated_with_exercise = exercise['course_id']
+
+        if request.query_params.get('async') in ('1', 'true'):
+            # 后台评分：立即返回 202 和任务状态地址，结果在任务完成后可查
+            with connection.cursor() as cursor:
+                task_id = tasks.enqueue(cursor, 'grade_submission', {
+                    'student_id': student_id, 'exercise_id': exercise_id, 'answer': student_answer,
+                }, created_by=student_id)
+            return Response({
+                'status': 'accepted',
+                'data': {
+                    'task_id': task_id,
+                    'status_url': tasks.status_url(task_id),
+                    'message': 'Answer submitted and queued for grading.'
+                }
+            }, status=status.HTTP_202_ACCEPTED)
+
         with connection.cursor() as cursor:
-            # Get exercise details needed for validation and grading
-            cursor.execute("""
-                SELECT e.expected_answer, e.table_schema, m.course_id 
-                FROM Exercise e
-                LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
-                LEFT JOIN Module m ON me.module_id = m.module_id
-                WHERE e.exercise_id = %s
-            """, [exercise_id])
-            result = cursor.fetchone()
-            if not result:
-                return Response({'status': 'error', 'message': 'Exercise not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            expected_answer, table_schema_json, course_id_associated_with_exercise = result
 
             # # Permission Check (unchanged)
             # if course_id_associated_with_exercise:
@@ -352,103 +286,16 @@ def submit_exercise_api(request, exercise_id):
             #             'message': '您未注册包含此练习的课程，无法提交答案'
             #         }, status=status.HTTP_403_FORBIDDEN)
             
-            # --- AI Grading Logic --- 
-            is_correct = False
-            score = 0.0
-            ai_feedback = "AI grading disabled or encountered an error."
-
-            if OPENAI_ENABLED and client:
-                try:
-                    table_schema_str = json.dumps(json.loads(table_schema_json), indent=2) if table_schema_json else "No schema provided."
-                except json.JSONDecodeError:
-                    table_schema_str = "Error parsing table schema."
-                    
-                grading_prompt = f"""
-You are an expert SQL evaluator. Compare the Student's SQL Query with the Expected SQL Query based on the provided Table Schema. 
-Determine if the Student's Query is logically equivalent to the Expected Query (produces the same result set, ignoring order unless ORDER BY is present in Expected Query). Ignore differences in formatting, aliases, or comments.
-
-Table Schema:
-```json
-{table_schema_str}
-```
-
-Expected SQL Query:
-```sql
-{expected_answer}
-```
-
-Student's SQL Query:
-```sql
-{student_answer}
-```
-
-Output your evaluation in JSON format with two keys:
-1.  "is_correct": boolean (true if logically equivalent, false otherwise).
-2.  "score": integer (100 for correct, if incorrect, please give a score between 0 and 100 based on the correctness of the query).
-3.  "feedback": string (Provide a brief explanation for your reasoning, especially if incorrect).
-
-Example Response:
-{{"is_correct": true, "score": 100, "feedback": "Student's query is logically equivalent to the expected answer."}}
-OR
-{{"is_correct": false, "score": 0, "feedback": "Student's query uses an incorrect join condition, leading to different results."}}
-"""
-                
-                try:
-                    print("Sending grading request to OpenAI...")
-                    completion = client.chat.completions.create(
-                        model="gpt-4o", # Or a model suitable for code analysis
-                        messages=[{"role": "user", "content": grading_prompt}],
-                        response_format={ "type": "json_object" }, # Request JSON output
-                        temperature=0.1, # Low temperature for deterministic grading
-                        max_tokens=150
-                    )
-                    
-                    ai_response_content = completion.choices[0].message.content
-                    print(f"AI Grading Response: {ai_response_content}")
-                    
-                    # Parse the JSON response from AI
-                    grading_result = json.loads(ai_response_content)
-                    is_correct = grading_result.get('is_correct', False)
-                    score = float(grading_result.get('score', 0.0))
-                    ai_feedback = grading_result.get('feedback', 'No feedback provided by AI.')
-
-                except (APIError, OpenAIError) as ai_error:
-                    print(f"❌ OpenAI API error during grading: {ai_error}")
-                    ai_feedback = f"AI grading failed due to API error: {ai_error}"
-                except json.JSONDecodeError:
-                    print(f"❌ Failed to parse AI grading JSON response: {ai_response_content}")
-                    ai_feedback = "AI grading failed: Could not understand the AI's response format."
-                except Exception as e:
-                    print(f"❌ Unexpected error during AI grading: {e}")
-                    ai_feedback = f"AI grading failed due to an unexpected error: {e}"
-            else:
-                 # Fallback to simple string comparison if AI is disabled
-                 is_correct = student_answer.strip().lower() == expected_answer.strip().lower()
-                 score = 100.0 if is_correct else 0.0
-                 ai_feedback = "AI grading is disabled. Used basic string comparison." # Indicate fallback
-                 print("AI Grading Disabled - Using simple string comparison.")
-            # --- End AI Grading Logic ---
+            # 先做本地 SQL 检查（语法 / 表名列名），通过后才交给 AI 评分
+            is_correct, score, ai_feedback, graded_by = grading.grade(student_answer, expected_answer, table_schema)
             print("👌🏻22222")
-            # Save submission result
-            with transaction.atomic():
-                sql_insert = """
-                    INSERT INTO Student_Exercise (student_id, exercise_id, submitted_answer, is_correct, score, completed_at, ai_feedback)
-                    VALUES (%s, %s, %s, %s, %s, NOW(), %s)
-                    ON DUPLICATE KEY UPDATE 
-                        submitted_answer = VALUES(submitted_answer),
-                        is_correct = VALUES(is_correct),
-                        score = VALUES(score),
-                        completed_at = NOW(),
-                        ai_feedback = VALUES(ai_feedback)
-                """
-                params = [student_id, exercise_id, student_answer, is_correct, score, ai_feedback]
-                try:
-                    cursor.execute(sql_insert, params)
-                    print(f"Successfully inserted/updated Student_Exercise for student {student_id}, exercise {exercise_id}")
-                except Exception as db_error:
-                    print(f"❌ DB Error during Student_Exercise save: {db_error}")
-                    print(f"SQL attempted: {cursor.mogrify(sql_insert, params)}") # Log the exact query with params
-                    raise # Re-raise the exception to trigger rollback and error response
+            # Save submission result (returns once committed)
+            try:
+                submissions.record(request.user, exercise_id, course_id_associated_with_exercise,
+                                   student_answer, is_correct, score, ai_feedback)
+            except Exception as db_error:
+                print(f"❌ DB Error during Student_Exercise save: {db_error}")
+                raise
 
         # Return success response including AI feedback
         return Response({
@@ -457,7 +304,8 @@ OR
                 'is_correct': is_correct,
                 'score': score,
                 'feedback': ai_feedback, # Send feedback to frontend
-                'message': 'Answer submitted and evaluated by AI.'
+                'graded_by': graded_by,
+                'message': 'Answer submitted and evaluated by AI.' if graded_by == grading.AI else 'Answer submitted and checked.'
             }
         }, status=status.HTTP_200_OK)
 
@@ -631,70 +479,40 @@ def get_student_exercise_status(request, course_id, module_id, exercise_id):
 def get_exercise_detail(request, exercise_id):
     try:
         student_id = request.user.user_id
+
+        exercise_entry = catalog.get_exercise(exercise_id)
+        if not exercise_entry:
+            return Response({'status': 'error', 'message': 'Exercise not found.'}, status=status.HTTP_404_NOT_FOUND)
         
         with connection.cursor() as cursor:
             # Check if the student has submitted this exercise at least once
             cursor.execute("""
-                SELECT COUNT(*) 
+                SELECT submission_count, best_score
                 FROM Student_Exercise 
                 WHERE student_id = %s AND exercise_id = %s
             """, [student_id, exercise_id])
-            submission_count = cursor.fetchone()[0]
-            can_view_answer = submission_count > 0
-            
-            # Dynamically build the SELECT clause for expected_answer
-            expected_answer_select_sql = "e.expected_answer" if can_view_answer else "NULL"
-            
-            # Fetch exercise details using the dynamically built clause
-            cursor.execute("""
-                SELECT 
-                    e.exercise_id, e.title, e.description, e.hint, 
-                    e.difficulty, e.table_schema, e.expected_answer,
-                    m.module_id, m.module_name, 
-                    c.course_id, c.course_name,
-                    CASE WHEN se.student_id IS NOT NULL THEN 1 ELSE 0 END as completed
-                FROM Exercise e
-                LEFT JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
-                LEFT JOIN Module m ON me.module_id = m.module_id
-                LEFT JOIN Course c ON m.course_id = c.course_id
-                LEFT JOIN Student_Exercise se ON e.exercise_id = se.exercise_id AND se.student_id = %s
-                WHERE e.exercise_id = %s
-            """, [student_id, exercise_id])
-            
-            columns = [col[0] for col in cursor.description]
-            result = cursor.fetchone()
-            
-            if not result:
-                return Response({'status': 'error', 'message': 'Exercise not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            exercise = dict(zip(columns, result))
-            print("👌🏻exercise", exercise)
-            associated_course_id = exercise.get('course_id')
-            print("👌🏻associated_course_id", associated_course_id)
-
-            # # Permission Check
-            # if associated_course_id:
-            #     cursor.execute("""
-            #         SELECT COUNT(*) FROM Enrollment
-            #         WHERE student_id = %s AND course_id = %s AND status = 'enrolled'
-            #     """, [student_id, associated_course_id])
-            #     if cursor.fetchone()[0] == 0:
-            #         return Response({
-            #             'status': 'error', 
-            #             'message': 'You are not enrolled in the course containing this exercise and cannot access it.'
-            #         }, status=status.HTTP_403_FORBIDDEN)
-             
-            # Process table_schema
-            if exercise.get('table_schema'):
-                try:
-                    exercise['table_schema'] = json.loads(exercise['table_schema'])
-                except json.JSONDecodeError:
-                    exercise['table_schema'] = []
-            else:
-                exercise['table_schema'] = []
-
+            attempt = cursor.fetchone()
+            can_view_answer = attempt is not None
+
+        exercise = {
+            'exercise_id': exercise_entry['exercise_id'],
+            'title': exercise_entry['title'],
+            'description': exercise_entry['description'],
+            'hint': exercise_entry['hint'],
+            'difficulty': exercise_entry['difficulty'],
+            'table_schema': exercise_entry['table_schema'],
+            # Only reveal the expected answer after a first submission
+            'expected_answer': exercise_entry['expected_answer'] if can_view_answer else None,
+            'module_id': exercise_entry['module_id'],
+            'module_name': exercise_entry['module_name'],
+            'course_id': exercise_entry['course_id'],
+            'course_name': exercise_entry['course_name'],
+            'completed': 1 if can_view_answer else 0,
             # Add flag to indicate if the answer can be viewed
-            exercise['can_view_answer'] = can_view_answer 
+            'can_view_answer': can_view_answer,
+            'submission_count': attempt[0] if attempt else 0,
+            'best_score': attempt[1] if attempt else None,
+        }
 
         return Response({
             'status': 'success',
@@ -709,6 +527,63 @@ def get_exercise_detail(request, exercise_id):
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def student_exercise_submissions_api(request, exercise_id):
+    """GET: 当前学生对某练习的全部提交记录（最新在前），?cursor= / ?limit= 分页"""
+    try:
+        with connection.cursor() as cursor:
+            submissions, next_cursor = submission_log.history(
+                cursor,
+                student_id=request.user.user_id,
+                exercise_id=exercise_id,
+                limit=submission_log.page_size(request.query_params.get('limit')),
+                after=request.query_params.get('cursor'),
+            )
+        return Response({
+            'status': 'success',
+            'data': submissions,
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
+
+    except pagination.InvalidCursor as e:
+        return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"❌ Error fetching submission history (Exercise ID: {exercise_id}): {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': 'Failed to get submission history.',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def run_exercise_query_api(request, exercise_id):
+    """POST: 在练习的示例数据沙箱里试运行学生的 SELECT（只读，限制行数与时间），不评分也不记录"""
+    try:
+        exercise = catalog.get_exercise(exercise_id)
+        if not exercise:
+            return Response({'status': 'error', 'message': 'Exercise not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        query = request.data.get('query', '')
+        if not isinstance(query, str):
+            return Response({'status': 'error', 'message': 'query must be a string.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = sandbox.run(exercise['table_schema'], query, key=exercise['dataset_hash'])
+        return Response({'status': 'success', 'data': result}, status=status.HTTP_200_OK)
+
+    except sandbox.SandboxError as e:
+        return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        print(f"❌ Error running sandbox query (Exercise ID: {exercise_id}): {str(e)}")
+        return Response({
+            'status': 'error',
+            'message': 'Failed to run query.',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
@@ -716,153 +591,15 @@ def student_dashboard_api(request):
     try:
         # 获取当前登录用户的 student_id
         student_id = request.user.user_id
-        
-        # 获取学生的个人信息
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    u.first_name,
-                    u.last_name,
-                    u.username,
-                    u.email,
-                    u.profile_info
-                FROM Users u
-                WHERE u.user_id = %s
-            """, [student_id])
-            user_info = cursor.fetchone()
-            if not user_info:
-                return Response({'status': 'error', 'message': 'User information not found.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            user_data = {
-                'first_name': user_info[0],
-                'last_name': user_info[1],
-                'username': user_info[2],
-                'email': user_info[3],
-                'profile_info': user_info[4]
-            }
-            
-            # 获取学生的课程总览数据
-            cursor.execute("""
-                SELECT 
-                    COUNT(DISTINCT e.course_id) as total_courses,
-                    COUNT(DISTINCT CASE WHEN c.state = 'active' THEN c.course_id END) as active_courses,
-                    COUNT(DISTINCT CASE WHEN c.state = 'complete' THEN c.course_id END) as completed_courses
-                FROM Enrollment e
-                JOIN Course c ON e.course_id = c.course_id
-                WHERE e.student_id = %s AND e.status = 'enrolled'
-            """, [student_id])
-            
-            course_stats = cursor.fetchone()
-            course_data = {
-                'total_courses': course_stats[0],
-                'active_courses': course_stats[1],
-                'completed_courses': course_stats[2]
-            }
-            
-            # 获取练习完成情况
-            cursor.execute("""
-                SELECT 
-                    COUNT(DISTINCT e.exercise_id) as total_exercises,
-                    COUNT(DISTINCT CASE WHEN se.is_correct = TRUE THEN se.exercise_id END) as correct_exercises,
-                    COUNT(DISTINCT CASE WHEN se.id IS NOT NULL THEN se.exercise_id END) as attempted_exercises
-                FROM Exercise e
-                JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
-                JOIN Module m ON me.module_id = m.module_id
-                JOIN Course c ON m.course_id = c.course_id
-                JOIN Enrollment en ON c.course_id = en.course_id AND en.student_id = %s
-                LEFT JOIN Student_Exercise se ON e.exercise_id = se.exercise_id AND se.student_id = %s
-                WHERE en.status = 'enrolled'
-            """, [student_id, student_id])
-            
-            exercise_stats = cursor.fetchone()
-            exercise_data = {
-                'total_exercises': exercise_stats[0],
-                'correct_exercises': exercise_stats[1],
-                'attempted_exercises': exercise_stats[2],
-                'completion_rate': round((exercise_stats[2] / exercise_stats[0]) * 100, 2) if exercise_stats[0] > 0 else 0,
-                'accuracy_rate': round((exercise_stats[1] / exercise_stats[2]) * 100, 2) if exercise_stats[2] > 0 else 0
-            }
-            
-            # 获取学生最近的课程
-            cursor.execute("""
-                SELECT 
-                    c.course_id,
-                    c.course_name,
-                    c.course_code,
-                    c.year,
-                    c.term,
-                    c.state,
-                    (SELECT COUNT(*) FROM Module m WHERE m.course_id = c.course_id) as module_count,
-                    (SELECT COUNT(DISTINCT me.exercise_id) 
-                     FROM Module m JOIN Module_Exercise me ON m.module_id = me.module_id 
-                     WHERE m.course_id = c.course_id) as exercise_count,
-                    (SELECT COUNT(DISTINCT se.exercise_id) 
-                     FROM Student_Exercise se
-                     JOIN Module_Exercise me ON se.exercise_id = me.exercise_id
-                     JOIN Module m ON me.module_id = m.module_id
-                     WHERE m.course_id = c.course_id AND se.student_id = %s AND se.is_correct = TRUE) as completed_exercises
-                FROM Course c
-                JOIN Enrollment e ON c.course_id = e.course_id
-                WHERE e.student_id = %s AND e.status = 'enrolled'
-                ORDER BY c.year DESC, c.term DESC
-                LIMIT 5
-            """, [student_id, student_id])
-            
-            recent_courses = []
-            columns = [col[0] for col in cursor.description]
-            for row in cursor.fetchall():
-                course_dict = dict(zip(columns, row))
-                if course_dict['exercise_count'] > 0:
-                    course_dict['progress'] = round((course_dict['completed_exercises'] / course_dict['exercise_count']) * 100, 2)
-                else:
-                    course_dict['progress'] = 0
-                # 添加额外的课程信息（示例）
-                course_dict['instructor_name'] = "Example Instructor" # Placeholder
-                course_dict['next_deadline'] = "2024-08-01" # Placeholder
-                recent_courses.append(course_dict)
-            print("到达这里了吗？")
-            # Fetch recent exercises (last 5 attempts), now including score and feedback
-            cursor.execute("""
-                SELECT
-                    se.id AS student_exercise_id,
-                    e.exercise_id,
-                    e.title,
-                    e.difficulty,
-                    se.is_correct,
-                    se.completed_at,
-                    se.score,         -- Added score
-                    se.ai_feedback,   -- Added ai_feedback
-                    c.course_name,
-                    m.module_name,
-                    c.course_id,
-                    m.module_id
-                FROM Student_Exercise se
-                JOIN Exercise e ON se.exercise_id = e.exercise_id
-                LEFT JOIN (
-                    SELECT DISTINCT exercise_id, MIN(module_id) AS module_id
-                    FROM Module_Exercise
-                    GROUP BY exercise_id
-                ) me ON e.exercise_id = me.exercise_id
-                LEFT JOIN Module m ON me.module_id = m.module_id
-                LEFT JOIN Course c ON m.course_id = c.course_id
-                WHERE se.student_id = %s AND se.completed_at IS NOT NULL
-                ORDER BY se.completed_at DESC
-                LIMIT 5
-            """, [student_id])
-            def dictfetchall(cursor):
-                columns = [col[0] for col in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-            recent_exercises = dictfetchall(cursor) # Fetch all results directly
+
+        # 快照一次查询构建，并按学生缓存（提交/选课/评分时失效）
+        snapshot = dashboard.get_snapshot(student_id)
+        if snapshot is None:
+            return Response({'status': 'error', 'message': 'User information not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({
             'status': 'success',
-            'data': {
-                'user': user_data,
-                'course_stats': course_data,
-                'exercise_stats': exercise_data,
-                'recent_courses': recent_courses,
-                'recent_exercises': recent_exercises # Now includes score and feedback
-            }
+            'data': snapshot
         }, status=status.HTTP_200_OK)
             
     except Exception as e:
@@ -880,40 +617,42 @@ def browse_all_courses_api(request):
         # 获取当前登录用户的 student_id
         student_id = request.user.user_id
         
-        # 查询所有可用(active)的课程，包含该学生是否已注册的信息
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    c.course_id,
-                    c.course_name,
-                    c.course_code,
-                    c.course_description,
-                    c.year,
-                    c.term,
-                    c.state,
-                    CASE WHEN e.student_id IS NOT NULL THEN TRUE ELSE FALSE END as is_enrolled,
-                    (SELECT COUNT(*) 
-                     FROM Module m 
-                     WHERE m.course_id = c.course_id) AS total_modules,
-                    (SELECT COUNT(*) 
-                     FROM Module_Exercise me
-                     JOIN Module m ON me.module_id = m.module_id
-                     WHERE m.course_id = c.course_id) AS total_exercises
-                FROM Course c
-                LEFT JOIN Enrollment e ON c.course_id = e.course_id AND e.student_id = %s AND e.status = 'enrolled'
-                WHERE c.state = 'active'
-                ORDER BY c.year DESC, c.term DESC
-            """, [student_id])
+        params = request.query_params
+        # Pagination is opt-in (?limit= / ?cursor=), as in instructor_courses: the browse page loads the full catalog
+        paginate = 'limit' in params or 'cursor' in params
 
-            # 转换为 dict 列表返回
-            columns = [col[0] for col in cursor.description]
-            results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        # 查询可用(active)的课程，支持全文搜索 (?q=)、年份/学期筛选和游标分页 (?cursor=, ?limit=)
+        with connection.cursor() as cursor:
+            results, next_cursor = course_search.search(
+                cursor,
+                text=params.get('q'),
+                year=course_search.parse_year(params.get('year')),
+                term=course_search.parse_term(params.get('term')),
+                state='active',
+                extra_select="""
+                    , CASE WHEN e.status = 'enrolled' THEN TRUE ELSE FALSE END as is_enrolled,
+                    CASE WHEN e.status = 'waitlisted' THEN TRUE ELSE FALSE END as is_waitlisted,
+                    COALESCE(cs.module_count, 0) AS total_modules,
+                    COALESCE(cs.exercise_count, 0) AS total_exercises,
+                    c.seat_limit,
+                    GREATEST(c.seat_limit - COALESCE(cs.enrolled_count, 0), 0) AS seats_left""",
+                extra_join="""
+                    LEFT JOIN Enrollment e ON c.course_id = e.course_id AND e.student_id = %s AND e.status IN ('enrolled', 'waitlisted')
+                    LEFT JOIN Course_Stats cs ON cs.course_id = c.course_id""",
+                extra_params=[student_id],
+                limit=course_search.page_size(params.get('limit')) if paginate else None,
+                after=params.get('cursor'),
+            )
 
         return Response({
             "status": "success",
-            "data": results
+            "data": results,
+            "next_cursor": next_cursor
         }, status=status.HTTP_200_OK)
 
+    except pagination.InvalidCursor as e:
+        return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     except Exception as e:
         print("❌ Error browsing all courses:", str(e))
         return Response({
@@ -921,51 +660,54 @@ def browse_all_courses_api(request):
             "message": "An error occurred while fetching available courses."
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
+@api_view(['POST', 'DELETE'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def enroll_course_api(request, course_id):
+    """POST: 选课（满员时进入候补名单）; DELETE: 退课或退出候补，空出的名额按顺序补给候补学生"""
     try:
         # 获取当前登录用户的 student_id
         student_id = request.user.user_id
-        
-        # 检查课程是否存在且状态为active
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT course_id 
-                FROM Course 
-                WHERE course_id = %s AND state = 'active'
-            """, [course_id])
-            
-            if not cursor.fetchone():
-                return Response({
-                    "status": "error",
-                    "message": "Course does not exist or is inactive."
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-            # 检查学生是否已经注册该课程
-            cursor.execute("""
-                SELECT enrollment_id 
-                FROM Enrollment 
-                WHERE student_id = %s AND course_id = %s
-            """, [student_id, course_id])
-            
-            if cursor.fetchone():
-                return Response({
-                    "status": "error",
-                    "message": "You are already enrolled in this course."
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-            # 注册课程
-            cursor.execute("""
-                INSERT INTO Enrollment (student_id, course_id, status)
-                VALUES (%s, %s, 'enrolled')
-            """, [student_id, course_id])
 
+        with transaction.atomic(), connection.cursor() as cursor:
+            if request.method == 'DELETE':
+                previous = enrollment.drop(cursor, student_id, course_id)
+                if previous is None:
+                    return Response({
+                        "status": "error",
+                        "message": "You are not enrolled in this course."
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                return Response({
+                    "status": "success",
+                    "message": "Left the waitlist." if previous == enrollment.WAITLISTED else "Dropped the course."
+                }, status=status.HTTP_200_OK)
+
+            # 单条 INSERT 依赖 (student_id, course_id) 唯一键；名额由 Course_Stats 计数器原子占用
+            result = enrollment.enroll(cursor, student_id, course_id)
+            if result == enrollment.WAITLISTED:
+                position = enrollment.waitlist_position(cursor, student_id, course_id)
+
+        if result == enrollment.ENROLLED:
+            return Response({
+                "status": "success",
+                "message": "Successfully enrolled in course."
+            }, status=status.HTTP_200_OK)
+        if result == enrollment.WAITLISTED:
+            return Response({
+                "status": "success",
+                "message": "The course is full. You have been added to the waitlist.",
+                "waitlist_position": position
+            }, status=status.HTTP_202_ACCEPTED)
+        if result == enrollment.UNAVAILABLE:
+            return Response({
+                "status": "error",
+                "message": "Course does not exist or is inactive."
+            }, status=status.HTTP_400_BAD_REQUEST)
         return Response({
-            "status": "success",
-            "message": "Successfully enrolled in course."
-        }, status=status.HTTP_200_OK)
+            "status": "error",
+            "message": "You are already enrolled in this course." if result == enrollment.ALREADY_ENROLLED
+                       else "You are already on the waitlist for this course."
+        }, status=status.HTTP_400_BAD_REQUEST)
 
     except Exception as e:
         print("❌ Error enrolling in course:", str(e))
@@ -981,65 +723,49 @@ def student_all_exercises_api(request):
     try:
         student_id = request.user.user_id
         difficulty = request.query_params.get('difficulty')
-        
-        # 构建基础查询
-        query = """
-            SELECT 
-                e.exercise_id,
-                e.title,
-                e.description,
-                e.hint,
-                e.difficulty,
-                e.table_schema,
-                c.course_id,
-                c.course_name,
-                c.course_code,
-                m.module_id,
-                m.module_name,
-                CASE WHEN se.student_id IS NOT NULL THEN 1 ELSE 0 END as completed,
-                CASE WHEN se.is_correct = TRUE THEN 1 ELSE 0 END as is_correct
-            FROM Exercise e
-            JOIN Module_Exercise me ON e.exercise_id = me.exercise_id
-            JOIN Module m ON me.module_id = m.module_id
-            JOIN Course c ON m.course_id = c.course_id
-            JOIN Enrollment en ON c.course_id = en.course_id AND en.student_id = %s
-            LEFT JOIN Student_Exercise se ON e.exercise_id = se.exercise_id AND se.student_id = %s
-            WHERE en.status = 'enrolled'
-        """
-        
-        params = [student_id, student_id]
-        
-        # 添加难度过滤
-        if difficulty and difficulty in ['Easy', 'Medium', 'Hard']:
-            query += " AND e.difficulty = %s"
-            params.append(difficulty)
-            
-        # 添加排序
-        query += " ORDER BY c.course_name, m.module_name, me.display_order"
-        
+        if difficulty not in ['Easy', 'Medium', 'Hard']:
+            difficulty = None
+
         with connection.cursor() as cursor:
-            cursor.execute(query, params)
-            columns = [col[0] for col in cursor.description]
-            exercises_raw = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
-            # 处理 table_schema 并去重
-            processed_exercises = {}
-            for exercise in exercises_raw:
-                # 转换table_schema为JSON
-                if exercise['table_schema']:
-                    try:
-                        exercise['table_schema'] = json.loads(exercise['table_schema'])
-                    except json.JSONDecodeError:
-                        exercise['table_schema'] = []
-                else:
-                    exercise['table_schema'] = []
-                
-                # 使用 exercise_id 作为 key 进行去重，保留第一次出现的记录
-                if exercise['exercise_id'] not in processed_exercises:
-                    processed_exercises[exercise['exercise_id']] = exercise
-            
-            # 将去重后的结果转换为列表
-            exercises = list(processed_exercises.values())
+            cursor.execute("""
+                SELECT c.course_id
+                FROM Enrollment en
+                JOIN Course c ON c.course_id = en.course_id
+                WHERE en.student_id = %s AND en.status = 'enrolled'
+                ORDER BY c.course_name
+            """, [student_id])
+            course_ids = [row[0] for row in cursor.fetchall()]
+
+        # 每个练习的提交/答对状态来自位图，叠加到目录缓存的静态内容上
+        solved_set = solved.get(student_id)
+
+        # 按 课程名, 模块名, display_order 排序；以 exercise_id 去重，保留第一次出现的记录
+        processed_exercises = {}
+        for course_id in course_ids:
+            for module in catalog.course_modules(course_id):
+                for e in catalog.module_exercises(module['module_id']):
+                    if e['exercise_id'] in processed_exercises:
+                        continue
+                    if difficulty and e['difficulty'] != difficulty:
+                        continue
+                    processed_exercises[e['exercise_id']] = {
+                        'exercise_id': e['exercise_id'],
+                        'title': e['title'],
+                        'description': e['description'],
+                        'hint': e['hint'],
+                        'difficulty': e['difficulty'],
+                        'table_schema': e['table_schema'],
+                        'course_id': module['course_id'],
+                        'course_name': module['course_name'],
+                        'course_code': module['course_code'],
+                        'module_id': module['module_id'],
+                        'module_name': module['module_name'],
+                        'completed': 1 if solved_set.is_attempted(e['exercise_id']) else 0,
+                        'is_correct': 1 if solved_set.is_solved(e['exercise_id']) else 0,
+                    }
+
+        # 将去重后的结果转换为列表
+        exercises = list(processed_exercises.values())
             
         return Response({
             'status': 'success',
@@ -1059,64 +785,25 @@ def student_all_exercises_api(request):
 def student_messages_api(request):
     try:
         student_id = request.user.user_id
-        
+        params = request.query_params
+        # Pagination is opt-in (?limit= / ?cursor= / ?since=): the messages page loads the whole inbox
+        paginate = any(key in params for key in ('limit', 'cursor', 'since'))
+
+        try:
+            before = int(params['cursor']) if params.get('cursor') else None
+            since = int(params['since']) if params.get('since') else None
+        except ValueError:
+            return Response({'status': 'error', 'message': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 收件箱在发送时写入（私信、课程公告、全局公告），这里只做一次按用户的索引范围扫描
         with connection.cursor() as cursor:
-            # 获取该学生收到或发送的所有私人消息以及收到的课程公告
-            cursor.execute("""
-                -- Received Private Messages
-                SELECT 
-                    m.message_id,
-                    m.sender_id,
-                    u_sender.first_name as sender_first_name,
-                    u_sender.last_name as sender_last_name,
-                    u_sender.username as sender_username,
-                    pm.receiver_id,
-                    u_receiver.first_name as receiver_first_name, 
-                    u_receiver.last_name as receiver_last_name,
-                    u_receiver.username as receiver_username,
-                    m.message_content,
-                    m.timestamp,
-                    'private' as message_type,
-                    CASE WHEN m.sender_id = %s THEN TRUE ELSE FALSE END as is_sent_by_me
-                FROM Message m
-                JOIN PrivateMessage pm ON m.message_id = pm.message_id
-                JOIN Users u_sender ON m.sender_id = u_sender.user_id
-                LEFT JOIN Users u_receiver ON pm.receiver_id = u_receiver.user_id
-                WHERE pm.receiver_id = %s OR m.sender_id = %s
-                
-                UNION ALL
-                
-                -- Received Course Announcements
-                SELECT 
-                    m.message_id,
-                    m.sender_id,
-                    u_sender.first_name as sender_first_name,
-                    u_sender.last_name as sender_last_name,
-                    u_sender.username as sender_username,
-                    NULL as receiver_id, -- Announcements don't have a specific receiver ID in this context
-                    NULL as receiver_first_name,
-                    NULL as receiver_last_name,
-                    NULL as receiver_username,
-                    m.message_content,
-                    m.timestamp,
-                    'announcement' as message_type,
-                    FALSE as is_sent_by_me -- Student cannot send announcements
-                FROM Message m
-                JOIN Announcement a ON m.message_id = a.message_id
-                JOIN Course c ON a.course_id = c.course_id
-                JOIN Enrollment e ON c.course_id = e.course_id
-                JOIN Users u_sender ON m.sender_id = u_sender.user_id
-                WHERE e.student_id = %s AND e.status = 'enrolled'
-                
-                ORDER BY timestamp DESC
-            """, [student_id, student_id, student_id, student_id]) # Pass student_id four times
-            
-            columns = [col[0] for col in cursor.description]
-            messages = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            
+            messages, next_cursor = inbox.fetch(
+                cursor, student_id, before=before, since=since, limit=inbox.page_size(params.get('limit')) if paginate else None)
+
         return Response({
             'status': 'success',
-            'data': messages
+            'data': messages,
+            'next_cursor': next_cursor
         }, status=status.HTTP_200_OK)
             
     except Exception as e:
@@ -1126,13 +813,3 @@ def student_messages_api(request):
             "message": "Failed to retrieve message list."
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# Assume OpenAI client is initialized similarly to ai/views.py
-# It's better practice to initialize it once globally, e.g., in settings or apps.py
-try:
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    OPENAI_ENABLED = True
-except Exception as e:
-    print(f"Warning: OpenAI client could not be initialized in student/views.py: {e}")
-    client = None
-    OPENAI_ENABLED = False
-
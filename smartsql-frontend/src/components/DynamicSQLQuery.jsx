@@ -22,24 +22,22 @@ const DynamicSQLQuery = () => {
   const [form] = Form.useForm();
   const [loading, setLoading] = useState(false);
   const [queryResults, setQueryResults] = useState([]);
-  const [generatedQuery, setGeneratedQuery] = useState('');
+  // The structured query of the current results and the cursor of their next page
+  const [lastQuery, setLastQuery] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const navigate = useNavigate();
 
-  const handleSubmit = async (values) => {
+  const runQuery = async (query, cursor) => {
     setLoading(true);
     try {
-      const response = await apiClient.post('/api/dynamic-sql/', {
-        table_name: values.table_name,
-        columns: values.columns || [],
-        conditions: values.conditions?.map(cond => `${cond.column} ${cond.operator} '${cond.value}'`) || [],
-        order_by: values.order_by?.map(order => `${order.column} ${order.direction}`) || [],
-        limit: values.limit,
-        offset: values.offset
-      });
+      const response = await apiClient.post('/api/dynamic-sql/', cursor ? { ...query, cursor } : query);
 
-      setQueryResults(response.data.data);
-      setGeneratedQuery(response.data.query);
-      message.success('Query executed successfully');
+      setQueryResults(previous => (cursor ? [...previous, ...response.data.data] : response.data.data));
+      setLastQuery(query);
+      setNextCursor(response.data.next_cursor);
+      if (!cursor) {
+        message.success('Query executed successfully');
+      }
     } catch (error) {
       console.error('Error executing query:', error);
       message.error('Query failed: ' + (error.response?.data?.message || error.message));
@@ -48,6 +46,17 @@ const DynamicSQLQuery = () => {
     }
   };
 
+  const handleSubmit = (values) => {
+    // Conditions are sent as {column, op, value} objects; the server binds the values as parameters
+    runQuery({
+      table_name: values.table_name,
+      columns: values.columns || [],
+      conditions: values.conditions?.map(cond => ({ column: cond.column, op: cond.operator, value: cond.value })) || [],
+      order_by: values.order_by?.map(order => ({ column: order.column, direction: order.direction })) || [],
+      limit: values.limit
+    });
+  };
+
   return (
       <div style={{ padding: '20px' }}>
         <Title level={2}>Dynamic SQL Query</Title>
@@ -194,13 +203,6 @@ const DynamicSQLQuery = () => {
           </Form>
         </Card>
 
-        {generatedQuery && (
-            <Card style={{ marginTop: 16 }}>
-              <Title level={4}>Generated SQL Query</Title>
-              <Text code>{generatedQuery}</Text>
-            </Card>
-        )}
-
         {queryResults.length > 0 && (
             <Card style={{ marginTop: 16 }}>
               <Title level={4}>Query Results</Title>
@@ -220,7 +222,13 @@ const DynamicSQLQuery = () => {
                     }
                   }))}
                   rowKey={(record) => JSON.stringify(record)}
+                  pagination={false}
               />
+              {nextCursor && (
+                  <Button style={{ marginTop: 16 }} onClick={() => runQuery(lastQuery, nextCursor)} loading={loading} block>
+                    Load More
+                  </Button>
+              )}
             </Card>
         )}
       </div>